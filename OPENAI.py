@@ -1,3 +1,5 @@
+import asyncio
+import functools
 import re
 from loguru import logger
 from openai import OpenAI
@@ -6,6 +8,12 @@ from dotenv import load_dotenv
 import os
 from azure.identity import InteractiveBrowserCredential, get_bearer_token_provider
 from openai import AzureOpenAI
+from utils.llm_cache import llm_cache, make_cache_key
+from utils.chunking import CHUNK_TOKEN_BUDGET, merge_identified_risks, split_document
+from utils.fanout import LLM_PER_DOCUMENT_CONCURRENCY, iter_as_completed
+from utils.tokens import CHAT_OVERHEAD_TOKENS, LLM_OVERSIZE_POLICY, LLM_PROMPT_TOKEN_BUDGET, check_budget, count_tokens, usage_log
+from utils.llm_client import AZURE_OPENAI_API_VERSION, AZURE_OPENAI_DEPLOYMENT, get_async_azure_client, get_azure_client, get_openai_client
+from utils import metrics
 load_dotenv()
 
 RISK_TAXONOMY = {
@@ -330,92 +338,24 @@ ILLUSTRATIVE_RISKS = {
     }
 }
 
-def get_risk_prompt_iteration_1(document, level_0_risk, level_1_risk, conditional_environment_description=None):
-    PROMPT_TEMPLATE = f"""
-As a risk assessment expert for a multilateral development bank, your task is to identify and analyze a risk named "{level_0_risk} - {level_1_risk}". The definition of "{level_0_risk} - {level_1_risk}" is: "{RISK_TAXONOMY[level_0_risk][level_1_risk]}". Now Follow this step-by-step process to conduct a thorough risk assessment, given an input document:
-Here are illustrative risks for the risk named "{level_0_risk} - {level_1_risk}": {ILLUSTRATIVE_RISKS[f"{level_0_risk} - {level_1_risk}"]}
+# Prompts are assembled from text that is fixed at import time followed by the
+# variable parts, with the document always last. Every prompt of the same kind
+# therefore starts with an identical prefix, which the provider can serve from
+# its prompt cache, and building a prompt is a couple of string concatenations.
 
-    1. Document Analysis:
-    - Carefully read the provided document.
-    - Identify key aspects that entail risks or point to "{level_0_risk} - {level_1_risk}".
-    - Note any explicitly stated risk factors or vulnerabilities.
-    - Refer to the provided illustrative risks as examples of how the risk named "{level_0_risk} - {level_1_risk}" may manifest in practice. Use them as a guide to assess whether similar issues are present.
-        
-    2. Detailed Risk Analysis:
-    Provide a comprehensive analysis including:
-        a) Description of the risk
-        b) Triggering root-cause events
-        c) Triggering intermediate events
-        d) Likelihood of the risk/event(s) occurring (Low, Medium, High)
-        e) Impact of the risk (Low, Medium, High)
-        f) Consequences of each triggering event
+TAXONOMY_BLOCK = "    ## RISK TAXONOMY:\n" + "\n\n".join(
+    f"    - {tier_1}\n" + "\n".join(f"        -- {tier_2}: {definition.strip()}" for tier_2, definition in tier_2s.items())
+    for tier_1, tier_2s in RISK_TAXONOMY.items()
+) + "\n"
 
-    In identifying the impact of the risk, make sure to focus on the following primary categories of impact:
-
-    ## IMPACT:
+IMPACT_BLOCK = """    ## IMPACT:
     - Development Effectiveness Failure : Failure to achieve the development goals of the Bank's interventions.
     - Financial Loss : Negative monetary impact to income or balance sheet.
     - Financial Misstatement : Inaccuracy in financial reporting or in transactional records.
     - Reputational Damage : Harm to the Bank's image of trustworthiness and integrity.
+"""
 
-    3. Key Risk Indicators (KRIs):
-    - Suggest 2-3 measurable KRIs that can help monitor the risk level.
-    - Explain why each KRI is relevant and how it relates to the risk.
-
-    4. Internal Controls:
-    - Recommend 2-3 specific internal controls to mitigate the risk.
-    - Briefly explain how each control addresses the risk and its potential effectiveness.
-
-    5. Final Review:
-    - Review your analysis to ensure all requests in this prompt have been considered.
-
-    Follow this step-by-step process to analyze the risk in the input document. Present your analysis in a structured JSON format, following this example structure:
-
-    {{
-        "risk_assessment": {{
-            "risk_name": "{level_0_risk} - {level_1_risk}",
-            "description": "Detailed description of the risk",
-            "analysis": {{
-                "triggering_root_cause_events": [...],
-                "triggering_intermediate_events": [...],
-                "likelihood": "High/Medium/Low",
-                "impact": {{
-                    "[IMPACT CATEGORY FROM THE IMPACT TAXONOMY]": "High/Medium/Low",
-                    "[IMPACT 2:...]": "High/Medium/Low",
-                    ...
-                }},
-                "consequences": [...]
-            }},
-            "key_risk_indicators": [
-                {{
-                    "indicator": "...",
-                    "rationale": "..."
-                }},
-                ...
-            ],
-            "internal_controls": [
-                {{
-                    "control": "...",
-                    "explanation": "..."
-                }},
-                ...
-            ]            
-        }}
-    }}
-    
-    The input document is the following:
-    ```
-    {document}
-    ```
-    {'Note that the bank operates in an environment where the following conditions apply: ' + conditional_environment_description if conditional_environment_description else ''}
-
-    Please provide a comprehensive risk assessment following the steps and format outlined above.
-    """
-    
-    return PROMPT_TEMPLATE
-
-def get_risk_prompt_iteration_0(document, conditional_environment_description=None):
-    PROMPT_TEMPLATE = f"""
+ITERATION_0_STATIC = """
 As a risk assessment expert for a multilateral development bank, your task is to identify and analyze the bank's risks in terms of a risk taxonomy provided below. Follow this step-by-step process to conduct a thorough risk assessment, given an input document:
 
     1. Document Analysis:
@@ -429,32 +369,7 @@ As a risk assessment expert for a multilateral development bank, your task is to
     
     In identifying the risks, make sure to use the following two-tier risk taxonomy:
     
-    ## RISK TAXONOMY:
-    - Strategic Risk
-        -- Strategic priorities: Risks that strategic priorities may not be aligned to the Bank's mission or risk of becoming irrelevant by not adapting to evolving demand.
-        -- Governance and policy framework: Risk that the Bank's effectiveness and efficiency are compromised, or opportunities are missed due to inadequate corporate or operational structure, inadequate policies and procedures, or roles and responsibilities.
-        -- Strategic resources: Risk arising from not having the adequate administrative and capital budget, human capital resources and information technology to implement the institutional strategy or that these are not aligned to the Bank's mission and strategic priorities.
-        -- Shareholder and donor relationships: Risk that relationship with shareholders or donors becomes ineffective, deteriorates, or becomes difficult for the Bank to manage.
-
-    - Financial Risk
-        -- Capital adequacy: Risk that the Bank's existing capital base is not adequate to absorb market, credit, and operational risk related shocks or to meet borrower's demand for loans.  
-        -- Credit: Potential loss that could result from the default of borrowers (loan portfolio credit risk or country credit risk) or from the default/ downgrade of investment or swap counterparties (commercial credit).
-        -- Market: Risk that changes in market rates (e.g., interest rates, credit spread, stock market values, or exchange rates) result in a loss or opportunity cost that affects the Bank's income or equity.
-        -- Liquidity and funding: Risk that the Bank is unable to fund its portfolio of assets at appropriate maturities and rates or unable to liquidate positions in a timely manner at reasonable rates.
-
-    - Corporate Operational Risk
-        -- Internal fraud and professional conduct: Risks originated by Bank staff, complementary workforce, contractors and/or Directors in breach of the applicable ethics codes or other applicable Bank policies, including prohibited practices, omissions, or misrepresentations, which knowingly or recklessly mislead, or attempt to mislead. 
-        -- Information security breaches: Risks arising from actors attempting to breach information systems or malicious or fortuitous behavior of internal users leading to security breaches of information systems.
-        -- Employment practices and workplace safety: Risks arising from acts inconsistent with employment, health or safety laws or agreements. 
-        -- Business practices, product failures, and obligations: Risks arising from an unintentional or negligent failure to meet an institutional obligation to specific IDB clients (borrower, investors & others) including product suitability or from the nature or design of a product. 
-        -- Damage to the Bank's physical assets and human wellbeing: Risks arising from loss or damage to the Bank's physical assets or human wellbeing from natural disaster or other events (e.g., terrorism, civil unrest). 
-        -- Business disruption, system and data management failures: Risks arising from system failures, inadequate IT infrastructure or disruption of business. 
-        -- Transaction processing errors: Risks arising from unintentional failed human transaction processing or inadequate process management, including failures from trade counterparties and vendors.  
-
-    - Project Operational Risk
-        -- Ineffective project management, supervision, and portfolio management: Risks arising from failures to adequately design, execute, close (project management) and/or supervise IDB financed operations; as well as to manage them as part of the Bank portfolio.
-        -- Breach of obligations in IDB financed operations: Risks arising from thirds parties’ failure to meet integrity or environmental and social requirements during the preparation and execution of an IDB-financed operation (including non-compliance with applicable IDB policies and regulations).
-        
+""" + TAXONOMY_BLOCK + """
     3. Detailed Risk Analysis:
     For each identified risk, provide a comprehensive analysis including:
         a) Description of the risk
@@ -467,12 +382,7 @@ As a risk assessment expert for a multilateral development bank, your task is to
 
     In identifying the impacts of risks, make sure to focus on the following primary categories of impact:
 
-    ## IMPACT:
-    - Development Effectiveness Failure : Failure to achieve the development goals of the Bank's interventions.
-    - Financial Loss : Negative monetary impact to income or balance sheet.
-    - Financial Misstatement : Inaccuracy in financial reporting or in transactional records.
-    - Reputational Damage : Harm to the Bank's image of trustworthiness and integrity.
-
+""" + IMPACT_BLOCK + """
     4. Risk Prioritization:
     - Evaluate the combined likelihood and impact of each risk.
     - Based on that evaluation, rank the risks from most critical to least critical.
@@ -483,132 +393,478 @@ As a risk assessment expert for a multilateral development bank, your task is to
 
     Follow this step-by-step process to analyze the risks in the input document. Give as many risks as you can find. Present your analysis in a structured JSON format, following this example structure:
 
-    {{
-        "risk_assessment": {{
+    {
+        "risk_assessment": {
             "identified_risks": [
-                {{
-                    "risk_1": {{
-                        "description": {{
-                            "[tier-1 RISK TAXONOMY]": {{
+                {
+                    "risk_1": {
+                        "description": {
+                            "[tier-1 RISK TAXONOMY]": {
                                 "[tier-2 RISK TAXONOMY]" : "Detailed description of the risk"
-                            }}
-                        }},
-                        "analysis": {{
+                            }
+                        },
+                        "analysis": {
                             "triggering_root_cause_events": [...],
                             "triggering_intermediate_events": [...],
                             "likelihood": "High/Medium/Low",
-                            "impact": {{
+                            "impact": {
                                 "[IMPACT CATEGORY FROM THE IMPACT TAXONOMY]": "High/Medium/Low",
                                 "[IMPACT 2:...]": "High/Medium/Low",
                                 ...
-                            }},
+                            },
                             "consequences": [...],
                             "interdependencies": [...]
-                        }},
+                        },
                         "key_risk_indicators": [
-                            {{
+                            {
                                 "indicator": "...",
                                 "rationale": "..."
-                            }},
+                            },
                             ...
                         ],
                         "internal_controls": [
-                            {{
+                            {
                                 "control": "...",
                                 "explanation": "..."
-                            }},
+                            },
                             ...
                         ]
-                    }}
-                }},
+                    }
+                },
                 ...
             ],
             "risk_prioritization": [
-                {{
+                {
                     "risk": "Risk 1 description",
                     "priority": 1,
                     "justification": "..."
-                }},
+                },
                 ...
             ]
-        }}
-    }}
+        }
+    }
     
     IMPORTANT: When using the risk taxonomy and impact categories in your response, use the exact names as provided in the taxonomy above, without any leading dashes or additional formatting. For example, use "Strategic Risk" for the top-level category and "Strategic resources" for the subcategory.
-    
-    The input document is the following:
-    ```
-    {document}
-    ```
-    {'Note that the bank operates in an environment where the following conditions apply: ' + conditional_environment_description if conditional_environment_description else ''}
 
     Please provide a comprehensive risk assessment following the steps and format outlined above.
-    """
-    
-    return PROMPT_TEMPLATE
+"""
 
+ITERATION_1_STATIC = """
+As a risk assessment expert for a multilateral development bank, your task is to identify and analyze one specific risk, the target risk, in an input document. The target risk, its definition and illustrative risks for it follow the instructions. Now Follow this step-by-step process to conduct a thorough risk assessment, given an input document:
 
+    1. Document Analysis:
+    - Carefully read the provided document.
+    - Identify key aspects that entail risks or point to the target risk.
+    - Note any explicitly stated risk factors or vulnerabilities.
+    - Refer to the provided illustrative risks as examples of how the target risk may manifest in practice. Use them as a guide to assess whether similar issues are present.
+        
+    2. Detailed Risk Analysis:
+    Provide a comprehensive analysis including:
+        a) Description of the risk
+        b) Triggering root-cause events
+        c) Triggering intermediate events
+        d) Likelihood of the risk/event(s) occurring (Low, Medium, High)
+        e) Impact of the risk (Low, Medium, High)
+        f) Consequences of each triggering event
 
-def call_gpt4o_test(prompt):
-    OPENAI_API_KEY = "key"
-    client_openai = OpenAI(api_key=OPENAI_API_KEY)
+    In identifying the impact of the risk, make sure to focus on the following primary categories of impact:
 
-    response = client_openai.chat.completions.create(
-        model="gpt-4o-mini",
-        response_format={"type": "json_object"},
-        messages=[
-            {"role": "system", "content": "You are an expert in risk analysis."},
-            {"role": "user", "content": prompt}
-        ],
-        temperature=0
-    )
-    try:
-        return json.loads(response.choices[0].message.content)
-    except:
-        logger.error(f"Load JSON Failed\n{response.choices[0].message.content}")
-        return {}
+""" + IMPACT_BLOCK + """
+    3. Key Risk Indicators (KRIs):
+    - Suggest 2-3 measurable KRIs that can help monitor the risk level.
+    - Explain why each KRI is relevant and how it relates to the risk.
 
-def call_gpt4o(prompt):
-    MODEL_NAME = "aug-gpt-4o"
-    API_VERSION = "2024-12-01-preview"
-    AZURE_ENDPOINT = "https://aug-az-openai-poc.openai.azure.com/"
-    # Obtain the token
-    # try:
-    #     token_provider = get_bearer_token_provider(InteractiveBrowserCredential(), "https://cognitiveservices.azure.com/.default")
-    # except Exception as e:
-    #     logger.error(f"Failed to obtain token: {e}")
-    
-    # if token_provider:
-    # # Initialize the OpenAI client
-    #     client = AzureOpenAI(
-    #         api_version=API_VERSION,
-    #         azure_endpoint=AZURE_ENDPOINT,
-    #         azure_ad_token_provider=token_provider
-    #     )
-    # else:
-    # AZURE_OPENAI_API_KEY = os.getenv("AZURE_OPENAI_API_KEY")
-    AZURE_OPENAI_API_KEY = "c94b159223564c3081d83b3a18221371"
-    client = AzureOpenAI(
-        azure_endpoint=AZURE_ENDPOINT,
-        api_version=API_VERSION,
-        api_key=AZURE_OPENAI_API_KEY
-    )
+    4. Internal Controls:
+    - Recommend 2-3 specific internal controls to mitigate the risk.
+    - Briefly explain how each control addresses the risk and its potential effectiveness.
+
+    5. Final Review:
+    - Review your analysis to ensure all requests in this prompt have been considered.
+
+    Follow this step-by-step process to analyze the risk in the input document. Present your analysis in a structured JSON format, following this example structure:
+
+    {
+        "risk_assessment": {
+            "risk_name": "[TARGET RISK NAME]",
+            "description": "Detailed description of the risk",
+            "analysis": {
+                "triggering_root_cause_events": [...],
+                "triggering_intermediate_events": [...],
+                "likelihood": "High/Medium/Low",
+                "impact": {
+                    "[IMPACT CATEGORY FROM THE IMPACT TAXONOMY]": "High/Medium/Low",
+                    "[IMPACT 2:...]": "High/Medium/Low",
+                    ...
+                },
+                "consequences": [...]
+            },
+            "key_risk_indicators": [
+                {
+                    "indicator": "...",
+                    "rationale": "..."
+                },
+                ...
+            ],
+            "internal_controls": [
+                {
+                    "control": "...",
+                    "explanation": "..."
+                },
+                ...
+            ]            
+        }
+    }
 
-    response = client.chat.completions.create(
-        model=MODEL_NAME,
-        response_format={"type": "json_object"},
-        messages=[
-            {"role": "system", "content": "You are an expert in risk analysis."},
-            {"role": "user", "content": prompt}
-        ],
-        temperature= 0
+    Please provide a comprehensive risk assessment following the steps and format outlined above.
+"""
+
+def _iteration_1_target(level_0_risk, level_1_risk):
+    name = f"{level_0_risk} - {level_1_risk}"
+    return f"""
+    ## TARGET RISK:
+    The target risk is named "{name}". Use exactly "{name}" as the risk_name in your JSON.
+    The definition of "{name}" is: "{RISK_TAXONOMY[level_0_risk][level_1_risk]}"
+    Here are illustrative risks for the risk named "{name}": {ILLUSTRATIVE_RISKS[name]}
+"""
+
+# One precompiled prefix per (tier-1, tier-2) pair; they all share ITERATION_1_STATIC
+ITERATION_1_PREFIXES = {
+    (level_0_risk, level_1_risk): ITERATION_1_STATIC + _iteration_1_target(level_0_risk, level_1_risk)
+    for level_0_risk, level_1_risks in RISK_TAXONOMY.items()
+    for level_1_risk in level_1_risks
+}
+
+def _environment_and_document(document, conditional_environment_description):
+    environment = (
+        f"    Note that the bank operates in an environment where the following conditions apply: {conditional_environment_description}\n"
+        if conditional_environment_description else ""
     )
+    return environment + "\n    The input document is the following:\n    ```\n" + document + "\n    ```\n"
+
+def get_risk_prompt_iteration_1(document, level_0_risk, level_1_risk, conditional_environment_description=None):
+    return ITERATION_1_PREFIXES[(level_0_risk, level_1_risk)] + _environment_and_document(document, conditional_environment_description)
+
+def get_risk_prompt_iteration_0(document, conditional_environment_description=None):
+    return ITERATION_0_STATIC + _environment_and_document(document, conditional_environment_description)
+
+
+
+SYSTEM_MESSAGE = "You are an expert in risk analysis."
+
+@functools.lru_cache(maxsize=None)
+def _static_tokens(text):
+    # Only for the module's fixed prompt parts, so the cache stays small; documents are counted on every call
+    return count_tokens(text)
+
+def estimate_prompt_tokens(document, level_0_risk=None, level_1_risk=None, conditional_environment_description=None):
+    """
+    Pre-flight token estimate for an iteration-0 prompt, or an iteration-1 prompt when a risk is given.
+
+    Returns:
+        Dict with the estimated `total` prompt tokens (system message and chat
+        overhead included) split into `instructions`, `taxonomy`,
+        `illustrative_risks` and `document`.
+    """
+    if level_0_risk is None:
+        static = ITERATION_0_STATIC
+        taxonomy = _static_tokens(TAXONOMY_BLOCK)
+        illustrative = 0
+    else:
+        static = ITERATION_1_PREFIXES[(level_0_risk, level_1_risk)]
+        taxonomy = _static_tokens(RISK_TAXONOMY[level_0_risk][level_1_risk])
+        illustrative = _static_tokens(str(ILLUSTRATIVE_RISKS[f"{level_0_risk} - {level_1_risk}"]))
+
+    # The prompt is the static part, the document wrapper and the document: the document is tokenized once
+    document_tokens = count_tokens(document)
+    wrapper = count_tokens(_environment_and_document("", conditional_environment_description))
+    total = _static_tokens(static) + wrapper + document_tokens + _static_tokens(SYSTEM_MESSAGE) + CHAT_OVERHEAD_TOKENS
+    return {
+        "total": total,
+        "instructions": max(total - taxonomy - illustrative - document_tokens, 0),
+        "taxonomy": taxonomy,
+        "illustrative_risks": illustrative,
+        "document": document_tokens,
+    }
+
+def _preflight(prompt, estimate):
+    if estimate is None:
+        estimate = {"total": count_tokens(prompt) + _static_tokens(SYSTEM_MESSAGE) + CHAT_OVERHEAD_TOKENS}
+    check_budget(estimate)
+    return estimate
+
+@metrics.timed("llm_decode")
+def _load_json_response(response):
     try:
         return json.loads(response.choices[0].message.content)
     except:
         logger.error(f"Load JSON Failed\n{response.choices[0].message.content}")
         return {}
 
+def _cacheable(result):
+    # Failed parses come back as {}, and error-shaped replies lack risk_assessment; neither may be served again
+    return isinstance(result, dict) and "risk_assessment" in result
+
+def _cached_completion(model, api_version, prompt, request_fn, use_cache):
+    # temperature=0 makes responses reproducible enough to reuse across identical prompts
+    key = make_cache_key(model, api_version, SYSTEM_MESSAGE, prompt)
+    if use_cache:
+        cached = llm_cache.get(key)
+        if cached is not None:
+            logger.debug(f"LLM cache hit {key[:12]}")
+            return cached
+
+    result = request_fn()
+    if use_cache and _cacheable(result):
+        llm_cache.set(key, model, result)
+    return result
+
+def call_gpt4o_test(prompt, use_cache=True, estimate=None):
+    MODEL_NAME = "gpt-4o-mini"
+    estimate = _preflight(prompt, estimate)
+
+    def request():
+        with metrics.llm_request(MODEL_NAME):
+            response = get_openai_client().chat.completions.create(
+                model=MODEL_NAME,
+                response_format={"type": "json_object"},
+                messages=[
+                    {"role": "system", "content": SYSTEM_MESSAGE},
+                    {"role": "user", "content": prompt}
+                ],
+                temperature=0
+            )
+        usage_log.record(MODEL_NAME, estimate, response.usage)
+        return _load_json_response(response)
+
+    return _cached_completion(MODEL_NAME, None, prompt, request, use_cache)
+
+def call_gpt4o(prompt, use_cache=True, estimate=None):
+    """
+    Args:
+        prompt: Rendered user prompt.
+        use_cache: Serve / store the response through the shared LLM cache.
+        estimate: Optional `estimate_prompt_tokens` result; computed from the prompt when omitted.
+
+    Raises:
+        PromptTooLargeError: The estimated prompt exceeds LLM_PROMPT_TOKEN_BUDGET.
+    """
+    MODEL_NAME = AZURE_OPENAI_DEPLOYMENT
+    API_VERSION = AZURE_OPENAI_API_VERSION
+    estimate = _preflight(prompt, estimate)
+
+    def request():
+        with metrics.llm_request(MODEL_NAME):
+            response = get_azure_client().chat.completions.create(
+                model=MODEL_NAME,
+                response_format={"type": "json_object"},
+                messages=[
+                    {"role": "system", "content": SYSTEM_MESSAGE},
+                    {"role": "user", "content": prompt}
+                ],
+                temperature= 0
+            )
+        usage_log.record(MODEL_NAME, estimate, response.usage)
+        return _load_json_response(response)
+
+    return _cached_completion(MODEL_NAME, API_VERSION, prompt, request, use_cache)
+
+
+
+CHUNKED_ANALYSIS_THRESHOLD_TOKENS = int(os.environ.get("CHUNKED_ANALYSIS_THRESHOLD_TOKENS", 24000))
+
+def should_chunk(document, estimate=None):
+    """True when the iteration-0 analysis of `document` should take the chunked path."""
+    estimate = estimate or estimate_prompt_tokens(document)
+    if estimate["document"] > CHUNKED_ANALYSIS_THRESHOLD_TOKENS:
+        return True
+    return estimate["total"] > LLM_PROMPT_TOKEN_BUDGET and LLM_OVERSIZE_POLICY == "chunk"
+
+def call_gpt4o_chunked(document, use_cache=True, token_budget=CHUNK_TOKEN_BUDGET,
+                       conditional_environment_description=None):
+    """
+    Map-reduce version of the iteration-0 analysis for documents too long for one prompt.
+
+    The document is split on page/section boundaries, every chunk is analyzed in
+    parallel, and the identified risks are merged by taxonomy key. The result has
+    the same shape as a single `call_gpt4o` response.
+    """
+    def analyze_chunk(chunk):
+        estimate = estimate_prompt_tokens(chunk, conditional_environment_description=conditional_environment_description)
+        prompt = get_risk_prompt_iteration_0(chunk, conditional_environment_description)
+        return call_gpt4o(prompt, use_cache=use_cache, estimate=estimate)
+
+    chunks = split_document(document, token_budget)
+    if len(chunks) == 1:
+        return analyze_chunk(document)
+
+    logger.info(f"Chunked analysis: {len(chunks)} chunks of <= {token_budget} tokens")
+    responses = [None] * len(chunks)
+    for (i, _), response, error in iter_as_completed(lambda item: analyze_chunk(item[1]), list(enumerate(chunks))):
+        if error is not None:
+            logger.opt(exception=error).error(f"Chunk {i + 1}/{len(chunks)} failed")
+            continue
+        responses[i] = response
+    return merge_identified_risks([r for r in responses if r])
+
+def stream_gpt4o(prompt, use_cache=True, estimate=None):
+    """
+    Streams the chat completion for `prompt` as text deltas.
+
+    A cached response is replayed as a single chunk; a freshly streamed
+    response is cached once it has been received and parsed in full.
+    """
+    MODEL_NAME = AZURE_OPENAI_DEPLOYMENT
+    API_VERSION = AZURE_OPENAI_API_VERSION
+    estimate = _preflight(prompt, estimate)
+    key = make_cache_key(MODEL_NAME, API_VERSION, SYSTEM_MESSAGE, prompt)
+
+    if use_cache:
+        cached = llm_cache.get(key)
+        if cached is not None:
+            logger.debug(f"LLM cache hit {key[:12]}")
+            yield json.dumps(cached, ensure_ascii=False)
+            return
+
+    parts = []
+    with metrics.llm_request(MODEL_NAME):
+        stream = get_azure_client().chat.completions.create(
+            model=MODEL_NAME,
+            response_format={"type": "json_object"},
+            messages=[
+                {"role": "system", "content": SYSTEM_MESSAGE},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=0,
+            stream=True,
+            stream_options={"include_usage": True}
+        )
+        for chunk in stream:
+            if chunk.usage:
+                usage_log.record(MODEL_NAME, estimate, chunk.usage)
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                parts.append(delta)
+                yield delta
+
+    if use_cache:
+        try:
+            result = json.loads("".join(parts))
+        except json.JSONDecodeError:
+            logger.error(f"Load JSON Failed\n{''.join(parts)}")
+        else:
+            if _cacheable(result):
+                llm_cache.set(key, MODEL_NAME, result)
+
+
+
+# Async variants for the ASGI serving mode (asgi.py). They share the cache, budget
+# and usage log with the sync functions; the SQLite writes and the CPU-bound steps
+# (tokenizing, hashing and splitting large documents) run in worker threads so
+# they never block the event loop.
+
+def _prepare_request(model, api_version, prompt, estimate):
+    estimate = _preflight(prompt, estimate)
+    return estimate, make_cache_key(model, api_version, SYSTEM_MESSAGE, prompt)
+
+async def acall_gpt4o(prompt, use_cache=True, estimate=None):
+    """Async version of `call_gpt4o`."""
+    MODEL_NAME = AZURE_OPENAI_DEPLOYMENT
+    API_VERSION = AZURE_OPENAI_API_VERSION
+    estimate, key = await asyncio.to_thread(_prepare_request, MODEL_NAME, API_VERSION, prompt, estimate)
+
+    if use_cache:
+        cached = await asyncio.to_thread(llm_cache.get, key)
+        if cached is not None:
+            logger.debug(f"LLM cache hit {key[:12]}")
+            return cached
+
+    with metrics.llm_request(MODEL_NAME):
+        response = await get_async_azure_client().chat.completions.create(
+            model=MODEL_NAME,
+            response_format={"type": "json_object"},
+            messages=[
+                {"role": "system", "content": SYSTEM_MESSAGE},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=0
+        )
+    await asyncio.to_thread(usage_log.record, MODEL_NAME, estimate, response.usage)
+    result = _load_json_response(response)
+    if use_cache and _cacheable(result):
+        await asyncio.to_thread(llm_cache.set, key, MODEL_NAME, result)
+    return result
+
+async def acall_gpt4o_chunked(document, use_cache=True, token_budget=CHUNK_TOKEN_BUDGET,
+                              conditional_environment_description=None):
+    """Async version of `call_gpt4o_chunked`; chunks run concurrently on the event loop."""
+    semaphore = asyncio.Semaphore(LLM_PER_DOCUMENT_CONCURRENCY)
+
+    def prepare(chunk):
+        estimate = estimate_prompt_tokens(chunk, conditional_environment_description=conditional_environment_description)
+        return get_risk_prompt_iteration_0(chunk, conditional_environment_description), estimate
+
+    async def analyze_chunk(chunk):
+        prompt, estimate = await asyncio.to_thread(prepare, chunk)
+        async with semaphore:
+            return await acall_gpt4o(prompt, use_cache=use_cache, estimate=estimate)
+
+    chunks = await asyncio.to_thread(split_document, document, token_budget)
+    if len(chunks) == 1:
+        return await analyze_chunk(document)
+
+    logger.info(f"Chunked analysis: {len(chunks)} chunks of <= {token_budget} tokens")
+    responses = await asyncio.gather(*(analyze_chunk(chunk) for chunk in chunks), return_exceptions=True)
+    for i, response in enumerate(responses):
+        if isinstance(response, BaseException):
+            logger.opt(exception=response).error(f"Chunk {i + 1}/{len(chunks)} failed")
+    return merge_identified_risks([r for r in responses if r and not isinstance(r, BaseException)])
+
+async def astream_gpt4o(prompt, use_cache=True, estimate=None):
+    """Async version of `stream_gpt4o`."""
+    MODEL_NAME = AZURE_OPENAI_DEPLOYMENT
+    API_VERSION = AZURE_OPENAI_API_VERSION
+    estimate, key = await asyncio.to_thread(_prepare_request, MODEL_NAME, API_VERSION, prompt, estimate)
+
+    if use_cache:
+        cached = await asyncio.to_thread(llm_cache.get, key)
+        if cached is not None:
+            logger.debug(f"LLM cache hit {key[:12]}")
+            yield json.dumps(cached, ensure_ascii=False)
+            return
+
+    parts = []
+    with metrics.llm_request(MODEL_NAME):
+        stream = await get_async_azure_client().chat.completions.create(
+            model=MODEL_NAME,
+            response_format={"type": "json_object"},
+            messages=[
+                {"role": "system", "content": SYSTEM_MESSAGE},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=0,
+            stream=True,
+            stream_options={"include_usage": True}
+        )
+        async for chunk in stream:
+            if chunk.usage:
+                await asyncio.to_thread(usage_log.record, MODEL_NAME, estimate, chunk.usage)
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                parts.append(delta)
+                yield delta
+
+    if use_cache:
+        try:
+            result = json.loads("".join(parts))
+        except json.JSONDecodeError:
+            logger.error(f"Load JSON Failed\n{''.join(parts)}")
+        else:
+            if _cacheable(result):
+                await asyncio.to_thread(llm_cache.set, key, MODEL_NAME, result)
 
 
 def analyze_risks_detailed(response):
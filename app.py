@@ -1,23 +1,38 @@
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for, flash
+from flask import Flask, render_template, request, jsonify, session, redirect, url_for, flash, Response, stream_with_context
 import os
+import click
 from werkzeug.utils import secure_filename
-from OPENAI import call_gpt4o, call_gpt4o_test
-import PyPDF2
-import docx
+from OPENAI import call_gpt4o, call_gpt4o_test, stream_gpt4o, call_gpt4o_chunked, should_chunk, estimate_prompt_tokens
 import re
 from OPENAI import get_risk_prompt_iteration_0, get_risk_prompt_iteration_1, format_output_with_highlights, analyze_risks_detailed,analyze_risks_initial
 import json
+import uuid
 from loguru import logger
 import subprocess
 import tempfile
 import io
-import sqlite3
-from datetime import datetime
-import pandas as pd
+from datetime import datetime, timezone
 from datetime import timedelta
 from urllib.parse import urlparse
 
-from models import db, AnalysisRecord, User
+from sqlalchemy import event
+
+from models import db, AnalysisRecord, User, upgrade_schema
+from utils.llm_cache import llm_cache
+from utils.fanout import iter_as_completed
+from utils.stream_json import IdentifiedRisksParser
+from utils.doc_store import doc_store
+from utils.tokens import PromptTooLargeError, usage_log
+from utils.jobs import JobError, job_queue
+from utils.extraction import PDF_ENGINE, PDF_ENGINES, UnsupportedFileError, extract_document_in_pool
+from utils.extraction_cache import extraction_cache
+from utils.uploads import BatchUploadError, expand_uploads, save_upload
+from utils.dashboard import TABLE_PAGE_SIZE, risk_dashboard
+from utils.risk_store import RISKS_DB_PATH
+from utils import http_cache, metrics
+from utils.analysis_records import ANALYSIS_FILTERS, ANALYSIS_PAGE_SIZE, query_records, save_records
+from utils.feedback import FEEDBACK_PAGE_SIZE, feedback_store
+from utils.storage import apply_pragmas
 
 app = Flask(__name__)
 
@@ -27,7 +42,7 @@ app = Flask(__name__)
 
 ALLOWED_EXTENSIONS = {'txt', 'pdf', 'docx'}
 
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///Analysis.db'
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('ANALYSIS_DATABASE_URI', 'sqlite:///Analysis.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev-secret-key-change-me')
@@ -36,9 +51,24 @@ app.permanent_session_lifetime = timedelta(days=7)
 
 
 db.init_app(app)
+http_cache.init_app(app)
+metrics.init_app(app)
 
 with app.app_context():
+    # Same connection settings as the other SQLite files (utils/storage.py) for SQLAlchemy's pooled connections
+    event.listen(db.engine, "connect", lambda dbapi_connection, _: apply_pragmas(dbapi_connection))
+    db.engine.dispose()
     db.create_all()
+    upgrade_schema()
+
+def _resolve_ownership(records):
+    """Stores 'personal' records (sent by the detailed-analysis buttons) under the logged-in user's email, as /analyses lists them."""
+    for record in records if isinstance(records, list) else []:
+        if isinstance(record, dict) and record.get("ownership") == "personal":
+            if not session.get('user_email'):
+                raise ValueError("Log in to save a personal analysis")
+            record["ownership"] = session['user_email']
+    return records
 
 @app.route("/save_analysis", methods=["POST"])
 def save_analysis():
@@ -48,43 +78,59 @@ def save_analysis():
         return jsonify({"status": "error", "message": "No data received"}), 400
 
     try:
-        record = AnalysisRecord(
-            content_json=data["content_json"],
-            analysis_type=data["analysis_type"],
-            ownership=data["ownership"],
-            risk_name=data["risk_name"],
-            filename=data["filename"]
-        )
-        db.session.add(record)
-        db.session.commit()
-        return jsonify({"status": "success"})
+        result = save_records(_resolve_ownership([data]))
+        return jsonify({"status": "success", "duplicate": result["duplicates"] > 0})
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
     except Exception as e:
+        db.session.rollback()
         return jsonify({"status": "error", "message": str(e)}), 500
 
-def allowed_file(filename):
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+@app.route("/save_analysis/bulk", methods=["POST"])
+def save_analysis_bulk():
+    """Saves many records in one transaction: {"records": [...]}; repeated idempotency keys are skipped."""
+    data = request.get_json(silent=True)
 
-def extract_text(file_storage_obj):
-    ext = file_storage_obj.filename.rsplit('.', 1)[1].lower()
+    if not data:
+        return jsonify({"status": "error", "message": "No data received"}), 400
 
-    if ext == 'txt':
-        return file_storage_obj.read().decode('utf-8')
+    try:
+        result = save_records(_resolve_ownership(data.get("records") if isinstance(data, dict) else data))
+        return jsonify({"status": "success", **result})
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"status": "error", "message": str(e)}), 500
 
-    elif ext == 'pdf':
-        reader = PyPDF2.PdfReader(file_storage_obj)
-        return ' '.join(
-            re.sub("\n", " ", page.extract_text()) 
-            for page in reader.pages if page.extract_text()
+@app.route("/analyses")
+def list_analyses():
+    """Saved analyses, newest first; shared records plus the logged-in user's own, filterable by column."""
+    visible = {"shared"}
+    if session.get('user_email'):
+        visible.add(session['user_email'])
+    try:
+        page = query_records(
+            visible,
+            filters={f: request.args[f] for f in ANALYSIS_FILTERS if request.args.get(f)},
+            after=request.args.get('after'),
+            limit=request.args.get('limit', ANALYSIS_PAGE_SIZE, type=int),
+            include_content=request.args.get('content', 'false').lower() == 'true',
         )
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    return jsonify(page)
 
-    elif ext == 'docx':
-        # Reset stream pointer before reading
-        file_storage_obj.seek(0)
-        in_memory = io.BytesIO(file_storage_obj.read())
-        doc = docx.Document(in_memory)
-        return '\n'.join(paragraph.text for paragraph in doc.paragraphs)
+def allowed_file(filename):
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-    return 'Unsupported file format.'
+def extract_text(file_storage_obj, engine=None):
+    try:
+        result = extraction_cache.extract(file_storage_obj.read(), file_storage_obj.filename,
+                                          engine=engine or PDF_ENGINE)
+        return result['text']
+    except UnsupportedFileError:
+        return 'Unsupported file format.'
 
 ### This func for saving files.
 # def extract_text(filepath):
@@ -101,6 +147,48 @@ def extract_text(file_storage_obj):
 #         return '\n'.join(paragraph.text for paragraph in doc.paragraphs)
 #     return 'Unsupported file format.'
 
+DOC_PREVIEW_CHARS = int(os.environ.get('DOC_PREVIEW_CHARS', 20000))
+
+def _load_document(values):
+    """Returns (doc_id, text) for a request; text is None when the doc_id is unknown or evicted."""
+    doc_id = values.get('doc_id', '')
+    if doc_id:
+        return doc_id, doc_store.get(doc_id)
+    # Clients that still post the full text
+    text = values.get('text', '')
+    return (doc_store.put(text), text) if text else ('', '')
+
+def plan_initial_analysis(text, values=None):
+    """
+    Returns (chunked, estimate) for the initial analysis of `text`.
+
+    The document is tokenized once, for both the path decision and the
+    budget check; pass the estimate on to `run_initial_analysis`. It is
+    None when mode=chunked forces the chunked path.
+    """
+    # mode=chunked / mode=single force a path; the default picks by document size
+    mode = (request.values if values is None else values).get('mode', 'auto')
+    if mode == 'chunked':
+        return True, None
+    with metrics.stage("prompt"):
+        estimate = estimate_prompt_tokens(text)
+    return mode == 'auto' and should_chunk(text, estimate=estimate), estimate
+
+def initial_analysis_prompt(text, estimate=None):
+    """Returns (prompt, estimate) for the initial analysis of `text`; a given estimate is reused."""
+    with metrics.stage("prompt"):
+        return get_risk_prompt_iteration_0(text), estimate or estimate_prompt_tokens(text)
+
+def run_initial_analysis(text, use_cache=True, chunked=False, estimate=None):
+    if chunked:
+        return call_gpt4o_chunked(text, use_cache=use_cache)
+    prompt, estimate = initial_analysis_prompt(text, estimate)
+    return call_gpt4o(prompt, use_cache=use_cache, estimate=estimate)
+
+def _use_llm_cache(values=None):
+    # Send refresh=1 to force a fresh LLM call for this request
+    return (request.values if values is None else values).get('refresh', '0') not in ('1', 'true')
+
 @app.route('/')
 def index():
     return render_template("index.html")
@@ -108,6 +196,9 @@ def index():
 @app.route('/risk_analysis', methods=['GET', 'POST'])
 def upload_file():
     text = ''
+    doc_id = ''
+    document_expired = False
+    analysis_error = ''
     filename = ''
     analysis_result = []
     risk_lis = []
@@ -124,7 +215,10 @@ def upload_file():
 
     if request.method == 'POST':
         action = request.form.get('action')
-        text = request.form.get('text', '')
+        doc_id, text = _load_document(request.form)
+        if text is None:
+            document_expired = True
+            doc_id, text = '', ''
 
         if action == 'upload':
             file = request.files.get('file')
@@ -135,19 +229,25 @@ def upload_file():
                 # file.save(filepath)
                 # text = extract_text(filepath)
                 filename = file.filename
-                text = extract_text(file)
+                engine = request.form.get('pdf_engine')
+                text = extract_text(file, engine if engine in PDF_ENGINES else None)
+                doc_id = doc_store.put(text)
 
         elif action == 'analyze':
             if text:
                 filename = request.form.get('filename', '')
-                prompt = get_risk_prompt_iteration_0(text)
-                analysis_result, risk_lis = analyze_risks_initial(call_gpt4o(prompt))
-                # for i in range(len(analysis_result)):
-                #     analysis_result[i] = format_output_with_highlights(analysis_result[i], "output5")
-                risk_analysis_pairs = list(zip(risk_lis, analysis_result))
+                try:
+                    chunked, estimate = plan_initial_analysis(text)
+                    response = run_initial_analysis(text, use_cache=_use_llm_cache(), chunked=chunked, estimate=estimate)
+                except PromptTooLargeError as e:
+                    logger.warning(str(e))
+                    analysis_error = _too_large_message(e)
+                    response = {}
+                risk_lis, risk_analysis_pairs = _initial_analysis_pairs(response)
 
         elif action == 'reset':
             text = ''
+            doc_id = ''
             filename = ''
             analysis_result = []
             risk_lis = []
@@ -157,69 +257,425 @@ def upload_file():
             page = 0
 
 
-    return render_template(
-        'risk_analysis.html',
+    return render_risk_analysis_page(
         text=text,
-        # analysis_result=format_output_with_highlights(analysis_result, "output2"),
+        doc_id=doc_id,
+        document_expired=document_expired,
+        analysis_error=analysis_error,
         risk_lis=risk_lis,
         selected_names=selected_names,
         risk_analysis_pairs=risk_analysis_pairs,
         analysis_dict=analysis_dict,
+        page=page,
+        filename=filename
+    )
+
+def _initial_analysis_pairs(response):
+    with metrics.stage("parse"):
+        analysis_result, risk_lis = analyze_risks_initial(response)
+    # for i in range(len(analysis_result)):
+    #     analysis_result[i] = format_output_with_highlights(analysis_result[i], "output5")
+    return risk_lis, list(zip(risk_lis, analysis_result))
+
+def _too_large_message(e):
+    return f"This document is too large to analyze ({e.estimate['total']} tokens, limit {e.budget})."
+
+def render_risk_analysis_page(text='', doc_id='', document_expired=False, analysis_error='', risk_lis=(),
+                              selected_names=(), risk_analysis_pairs=(), analysis_dict=None, page=0, filename=''):
+    # The page only shows a preview; follow-up requests refer to the stored document by doc_id
+    return render_template(
+        'risk_analysis.html',
+        text=text[:DOC_PREVIEW_CHARS],
+        text_length=len(text),
+        doc_id=doc_id,
+        document_expired=document_expired,
+        analysis_error=analysis_error,
+        # analysis_result=format_output_with_highlights(analysis_result, "output2"),
+        risk_lis=list(risk_lis),
+        selected_names=list(selected_names),
+        risk_analysis_pairs=list(risk_analysis_pairs),
+        analysis_dict=analysis_dict or {},
         current_page=page,
         filename=filename
     )
 
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def _risk_event(risk, index, doc_id, filename):
+    """Renders one streamed identified risk as an SSE `risk` event, or None if it cannot be parsed."""
+    with metrics.stage("parse"):
+        analyses, risk_lis = analyze_risks_initial([risk])
+    if not risk_lis:
+        return None
+    analysis = dict(analyses[0], index=index)
+    cur_risk = dict(risk_lis[0], index=index)
+    html = render_template('risk_card_partial.html', risk=cur_risk, result=analysis,
+                           index=index, doc_id=doc_id, filename=filename)
+    return _sse('risk', {'index': index, 'name': cur_risk['name'], 'html': html})
+
+@app.route('/risk_analysis/stream', methods=['POST'])
+def stream_initial_analysis():
+    """Streams the initial analysis as Server-Sent Events, one `risk` event per identified risk."""
+    doc_id, text = _load_document(request.form)
+    filename = request.form.get('filename', '')
+
+    if text is None:
+        return "Document expired, please upload it again", 410
+    if not text:
+        return "Invalid request", 400
+
+    use_cache = _use_llm_cache()
+    chunked, estimate = plan_initial_analysis(text)
+
+    def risks():
+        if chunked:
+            # Chunks finish independently, so the merged list is only known at the end
+            response = run_initial_analysis(text, use_cache=use_cache, chunked=True)
+            yield from response.get('risk_assessment', {}).get('identified_risks', [])
+            return
+        parser = IdentifiedRisksParser()
+        prompt, _ = initial_analysis_prompt(text, estimate)
+        for delta in stream_gpt4o(prompt, use_cache=use_cache, estimate=estimate):
+            yield from parser.feed(delta)
+
+    def generate():
+        index = 0
+        try:
+            for risk in risks():
+                event = _risk_event(risk, index + 1, doc_id, filename)
+                if event:
+                    index += 1
+                    yield event
+        except PromptTooLargeError as e:
+            logger.warning(str(e))
+            yield _sse('error', {'message': f"Document too large ({e.estimate['total']} tokens, limit {e.budget})"})
+            return
+        except Exception:
+            logger.exception("Error during streamed initial analysis")
+            yield _sse('error', {'message': 'Error during analysis'})
+            return
+        yield _sse('done', {'count': index})
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def detailed_analysis_prompt(text, name):
+    """Returns (prompt, estimate) for the detailed analysis of the risk named "<tier-1> - <tier-2>"."""
+    level_0_risk = name.split("-")[0].strip()
+    level_1_risk = name.split("-")[1].strip()
+    with metrics.stage("prompt"):
+        prompt = get_risk_prompt_iteration_1(
+            text,
+            level_0_risk=level_0_risk,
+            level_1_risk=level_1_risk
+        )
+        return prompt, estimate_prompt_tokens(text, level_0_risk, level_1_risk)
+
+def run_detailed_analysis(text, name, use_cache=True):
+    prompt, estimate = detailed_analysis_prompt(text, name)
+    result = call_gpt4o(prompt, use_cache=use_cache, estimate=estimate)
+    with metrics.stage("parse"):
+        return analyze_risks_detailed(result)
+
 @app.route('/detailed_analysis', methods=['POST'])
 def detailed_analysis():
-    text = request.form.get('text', '')
+    doc_id, text = _load_document(request.form)
     name = request.form.get('risk_name', '')
 
+    if text is None:
+        return "Document expired, please upload it again", 410
     if not name or not text:
         return "Invalid request", 400
 
     try:
-        prompt = get_risk_prompt_iteration_1(
-            text,
-            level_0_risk=name.split("-")[0].strip(),
-            level_1_risk=name.split("-")[1].strip()
-        )
-        result = call_gpt4o(prompt)
-        detailed_result = analyze_risks_detailed(result)
+        detailed_result = run_detailed_analysis(text, name, use_cache=_use_llm_cache())
 
+    except PromptTooLargeError as e:
+        logger.warning(str(e))
+        return "Document too large for a detailed analysis", 413
     except Exception as e:
         logger.exception("Error during detailed analysis")
         return "Error during analysis", 500
 
     return render_template("detailed_analysis_partial.html", risk_name=name, detailed_result=detailed_result)
 
-@app.route('/submit_feedback', methods=['POST'])
-def submit_feedback():
-    data = request.json
-    feedback = data.get('feedback')
-    user_id = data.get('user_id')
-    timestamp = datetime.utcnow().isoformat()
-
-    conn = sqlite3.connect('./feedback.db')
-    cursor = conn.cursor()
-
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS feedback (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id TEXT,
-            feedback TEXT,
-            timestamp TEXT,
-            project TEXT
-        )
-    ''')
+def _batch_line(name, detailed_result, error):
+    if isinstance(error, PromptTooLargeError):
+        line = {"risk_name": name, "status": "error", "message": "Document too large for a detailed analysis"}
+    elif error is not None:
+        logger.opt(exception=error).error(f"Error during detailed analysis of {name}")
+        line = {"risk_name": name, "status": "error", "message": "Error during analysis"}
+    else:
+        line = {
+            "risk_name": name,
+            "status": "success",
+            "html": render_template("detailed_analysis_partial.html", risk_name=name, detailed_result=detailed_result)
+        }
+    return json.dumps(line) + "\n"
+
+@app.route('/detailed_analysis_batch', methods=['POST'])
+def detailed_analysis_batch():
+    """Runs the detailed analysis for several risks at once and streams one NDJSON line per finished risk."""
+    data = request.get_json(silent=True) or {}
+    doc_id, text = _load_document(data)
+    risk_names = data.get('risk_names') or []
+
+    if text is None:
+        return jsonify({"status": "error", "message": "Document expired, please upload it again"}), 410
+    if not text or not risk_names:
+        return jsonify({"status": "error", "message": "doc_id and risk_names are required"}), 400
+
+    use_cache = _use_llm_cache() and data.get('refresh') not in (True, 1, '1', 'true')
+
+    def generate():
+        for name, detailed_result, error in iter_as_completed(
+                lambda n: run_detailed_analysis(text, n, use_cache=use_cache), risk_names, key=doc_id):
+            yield _batch_line(name, detailed_result, error)
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+JOB_LONG_POLL_MAX_SECONDS = float(os.environ.get('JOB_LONG_POLL_MAX_SECONDS', 30))
+
+def _job_document(payload):
+    text = doc_store.get(payload['doc_id'])
+    if text is None:
+        raise JobError("Document expired, please upload it again")
+    return text
+
+def _render_in_worker(template, **context):
+    # Job workers have no request; templates still run the context processors, which read the session
+    with app.test_request_context():
+        return render_template(template, **context)
+
+def initial_analysis_job(payload):
+    text = _job_document(payload)
+    try:
+        response = run_initial_analysis(text, use_cache=payload['use_cache'], chunked=payload['chunked'],
+                                        estimate=payload.get('estimate'))
+    except PromptTooLargeError as e:
+        raise JobError(f"Document too large ({e.estimate['total']} tokens, limit {e.budget})")
+    with metrics.stage("parse"):
+        analysis_result, risk_lis = analyze_risks_initial(response)
+    risks = []
+    for index, (cur_risk, analysis) in enumerate(zip(risk_lis, analysis_result), 1):
+        html = _render_in_worker('risk_card_partial.html', risk=dict(cur_risk, index=index),
+                                 result=dict(analysis, index=index), index=index,
+                                 doc_id=payload['doc_id'], filename=payload['filename'])
+        risks.append({'index': index, 'name': cur_risk['name'], 'html': html})
+    return {'count': len(risks), 'risks': risks}
+
+def detailed_analysis_job(payload):
+    text = _job_document(payload)
+    name = payload['risk_name']
+    try:
+        detailed_result = run_detailed_analysis(text, name, use_cache=payload['use_cache'])
+    except PromptTooLargeError:
+        raise JobError("Document too large for a detailed analysis")
+    html = _render_in_worker("detailed_analysis_partial.html", risk_name=name, detailed_result=detailed_result)
+    return {'risk_name': name, 'html': html}
+
+job_queue.register('initial_analysis', initial_analysis_job)
+job_queue.register('detailed_analysis', detailed_analysis_job)
+
+BATCH_ANALYSIS_CONCURRENCY = int(os.environ.get('BATCH_ANALYSIS_CONCURRENCY', 4))
+
+def batch_document_job(payload):
+    """Extracts one file of a batch upload, stores it and runs its initial analysis."""
+    path = payload['path']
+    filename = payload['filename']
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        raise JobError("The uploaded file is no longer available")
+    try:
+        try:
+            # Documents of a batch are spread across the extraction processes
+            extraction = extraction_cache.extract(data, filename, engine=payload['engine'],
+                                                  extractor=extract_document_in_pool)
+        except UnsupportedFileError as e:
+            raise JobError(str(e))
+        except Exception as e:
+            logger.warning(f"Extraction of {filename} failed: {e}")
+            raise JobError("Could not read the document")
+        text = extraction['text']
+        if not text.strip():
+            raise JobError("No text could be extracted from the document")
+        doc_id = doc_store.put(text)
+        try:
+            estimate = estimate_prompt_tokens(text)
+            response = run_initial_analysis(text, use_cache=payload['use_cache'],
+                                            chunked=should_chunk(text, estimate=estimate), estimate=estimate)
+        except PromptTooLargeError as e:
+            raise JobError(_too_large_message(e))
+        risk_lis, _ = _initial_analysis_pairs(response)
+    finally:
+        os.remove(path)
+    return {
+        'filename': filename,
+        'doc_id': doc_id,
+        'pages': extraction['pages'],
+        'truncated': extraction['truncated'],
+        'extraction_cached': extraction['cached'],
+        'count': len(risk_lis),
+        'risks': [risk['name'] for risk in risk_lis],
+    }
 
-    cursor.execute("""
-        INSERT INTO feedback (user_id, feedback, timestamp, project)
-        VALUES (?, ?, ?, ?)
-    """, (user_id, feedback, timestamp, 'risk_web_system'))
+job_queue.register('batch_document', batch_document_job, max_concurrent=BATCH_ANALYSIS_CONCURRENCY)
+
+@app.before_request
+def _start_job_workers():
+    # Once per process, so workers also run in each forked web worker
+    job_queue.start()
+
+def _job_accepted(job_id):
+    return jsonify({"status": "queued", "job_id": job_id, "status_url": url_for('job_status', job_id=job_id)}), 202
+
+@app.route('/jobs/risk_analysis', methods=['POST'])
+def submit_initial_analysis_job():
+    """Queues the initial analysis of a stored document and returns a job id at once."""
+    doc_id, text = _load_document(request.form)
+    if text is None:
+        return jsonify({"status": "error", "message": "Document expired, please upload it again"}), 410
+    if not text:
+        return jsonify({"status": "error", "message": "doc_id is required"}), 400
+
+    chunked, estimate = plan_initial_analysis(text)
+    job_id = job_queue.submit('initial_analysis', {
+        'doc_id': doc_id,
+        'filename': request.form.get('filename', ''),
+        'use_cache': _use_llm_cache(),
+        'chunked': chunked,
+        'estimate': estimate,
+    })
+    return _job_accepted(job_id)
+
+@app.route('/jobs/detailed_analysis', methods=['POST'])
+def submit_detailed_analysis_job():
+    """Queues the detailed analysis of one risk and returns a job id at once."""
+    doc_id, text = _load_document(request.form)
+    name = request.form.get('risk_name', '')
+    if text is None:
+        return jsonify({"status": "error", "message": "Document expired, please upload it again"}), 410
+    if not name or not text:
+        return jsonify({"status": "error", "message": "doc_id and risk_name are required"}), 400
+
+    job_id = job_queue.submit('detailed_analysis', {'doc_id': doc_id, 'risk_name': name, 'use_cache': _use_llm_cache()})
+    return _job_accepted(job_id)
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """Job state and, once finished, its result. `wait=N` long-polls for up to N seconds."""
+    wait = min(request.args.get('wait', 0, type=float), JOB_LONG_POLL_MAX_SECONDS)
+    job = job_queue.wait(job_id, wait) if wait > 0 else job_queue.get(job_id)
+    if job is None:
+        return jsonify({"status": "error", "message": "Unknown job"}), 404
+    return jsonify(job)
+
+@app.route('/batch_upload', methods=['GET', 'POST'])
+def batch_upload():
+    """Accepts many files and/or ZIPs; queues extraction and an initial analysis for each document."""
+    if request.method == 'GET':
+        return render_template('batch_upload.html')
 
-    conn.commit()
-    conn.close()
+    try:
+        files, skipped = expand_uploads(request.files.getlist('files'), ALLOWED_EXTENSIONS)
+    except BatchUploadError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    if not files:
+        return jsonify({"status": "error", "message": "No .pdf, .txt or .docx documents in the upload", "skipped": skipped}), 400
+
+    engine = request.form.get('pdf_engine')
+    engine = engine if engine in PDF_ENGINES else PDF_ENGINE
+    batch_id = uuid.uuid4().hex
+    for filename, data in files:
+        job_queue.submit('batch_document', {
+            'path': save_upload(data, filename),
+            'filename': filename,
+            'engine': engine,
+            'use_cache': _use_llm_cache(),
+        }, batch_id=batch_id)
+    logger.info(f"Batch {batch_id}: {len(files)} documents queued, {len(skipped)} skipped")
+    return jsonify({
+        "status": "queued",
+        "batch_id": batch_id,
+        "documents": [filename for filename, _ in files],
+        "skipped": skipped,
+        "status_url": url_for('batch_status', batch_id=batch_id),
+    }), 202
+
+@app.route('/batches/<batch_id>', methods=['GET'])
+def batch_status(batch_id):
+    """Per-file progress of a batch upload."""
+    batch = job_queue.batch(batch_id)
+    if batch is None:
+        return jsonify({"status": "error", "message": "Unknown batch"}), 404
+    documents = []
+    for job in batch.pop('jobs'):
+        result = job['result'] or {}
+        documents.append({
+            'job_id': job['id'],
+            'filename': job['payload'].get('filename'),
+            'state': job['state'],
+            'error': job['error'],
+            'doc_id': result.get('doc_id'),
+            'pages': result.get('pages'),
+            'risk_count': result.get('count'),
+            'risks': result.get('risks', []),
+        })
+    return jsonify(dict(batch, documents=documents))
+
+@app.route('/jobs', methods=['GET'])
+def job_stats():
+    return jsonify(job_queue.stats())
+
+def _collect_metrics():
+    # Read at scrape time: the caches and the job queue keep their counts in SQLite, shared by all workers
+    caches = {'llm': llm_cache.stats(), 'extraction': extraction_cache.stats()}
+    jobs = job_queue.stats()
+    return [
+        ('cache_hits_total', 'counter', 'Cache hits since the cache was created.',
+         {(name,): stats['hits'] for name, stats in caches.items()}, ('cache',)),
+        ('cache_misses_total', 'counter', 'Cache misses since the cache was created.',
+         {(name,): stats['misses'] for name, stats in caches.items()}, ('cache',)),
+        ('cache_hit_ratio', 'gauge', 'Hits over lookups since the cache was created.',
+         {(name,): stats['hit_ratio'] for name, stats in caches.items()}, ('cache',)),
+        ('jobs', 'gauge', 'Background analysis jobs by state.',
+         {(state,): jobs[state] for state in ('queued', 'running')}, ('state',)),
+    ]
+
+metrics.add_collector(_collect_metrics)
+
+@app.route('/llm_cache', methods=['GET'])
+def llm_cache_stats():
+    return jsonify(llm_cache.stats())
+
+# Clearing forces paid re-computation, so it is an operator command (flask --app app clear-llm-cache), not a route
+@app.cli.command('clear-llm-cache')
+@click.option('--key', default=None, help='Only remove this cache key.')
+def llm_cache_clear(key):
+    removed = llm_cache.invalidate(key)
+    click.echo(f"Removed {removed} LLM cache entries")
+
+@app.route('/extraction_cache', methods=['GET'])
+def extraction_cache_stats():
+    return jsonify(extraction_cache.stats())
+
+@app.cli.command('clear-extraction-cache')
+@click.option('--content-hash', default=None, help='Only remove the entries of this file hash.')
+def extraction_cache_clear(content_hash):
+    removed = extraction_cache.invalidate(content_hash)
+    click.echo(f"Removed {removed} extraction cache entries")
+
+@app.route('/llm_usage', methods=['GET'])
+def llm_usage():
+    return jsonify(usage_log.summary())
 
+@app.route('/submit_feedback', methods=['POST'])
+def submit_feedback():
+    data = request.json
+    feedback_store.add(data.get('user_id'), data.get('feedback'))
     return jsonify({'status': 'success'})
 
 @app.route('/f')
@@ -230,80 +686,73 @@ def format():
 
 @app.route('/view_feedback')
 def view_feedback():
-    conn = sqlite3.connect('/home/feedback.db')
-    cursor = conn.cursor()
-    cursor.execute("SELECT user_id, feedback, timestamp, project FROM feedback ORDER BY timestamp DESC")
-    feedback_data = cursor.fetchall()
-    conn.close()
-    return render_template('view_feedback.html', feedback_data=feedback_data)
-
+    try:
+        page = feedback_store.page(before=request.args.get('before'),
+                                   limit=request.args.get('limit', FEEDBACK_PAGE_SIZE, type=int))
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    return render_template('view_feedback.html', feedback_data=page["rows"], next_cursor=page["next"])
 
-DB_PATH = "Test.db" 
 
-def parse_impact_level(impact_text):
-    levels = re.findall(r'\b(High|Medium|Low)\b', impact_text)
-    level_map = {'Low': 1, 'Medium': 2, 'High': 3}
-    scores = [level_map[i] for i in levels if i in level_map]
-    return sum(scores) / len(scores) if scores else None
+DB_PATH = RISKS_DB_PATH
 
 def get_data(access_level=None):
-    conn = sqlite3.connect(DB_PATH)
-    df = pd.read_sql_query("SELECT * FROM Risks", conn)
-    conn.close()
-
-    # Full stats regardless of filter
-    total_risks = df.copy()
-
-    # Filtered data for selected level
-    if access_level == "user":
-        df = df[df["access_level"] == "user"]
-    elif access_level == "group":
-        df = df[df["access_level"] == "group"]
-
-    # Risk type distribution
-    risk_types = df["risk_name"].value_counts().reset_index()
-    risk_types.columns = ["risk_name", "count"]
-
-    # File-level average impact & likelihood
-    df["impact_score"] = df["impact"].apply(parse_impact_level)
-    likelihood_map = {'Low': 1, 'Medium': 2, 'High': 3}
-    df["likelihood_score"] = df["likelihood"].map(likelihood_map)
-    scatter_df = df.groupby("file_name").agg({
-        "impact_score": "mean",
-        "likelihood_score": "mean"
-    }).dropna().reset_index()
-
-    # Table data: filtered records
-    table_data = df[["file_name", "risk_name", "likelihood", "impact", "access_level"]].to_dict(orient="records")
-
-    # File count per risk type (in full dataset)
-    file_count = total_risks.groupby("risk_name")["file_name"].nunique().reset_index()
-    file_count.columns = ["risk_name", "file_count"]
-
-    return {
-        "risk_types": {
-            "labels": risk_types["risk_name"].tolist(),
-            "counts": risk_types["count"].tolist()
-        },
-        "scatter": {
-            "file_names": scatter_df["file_name"].tolist(),
-            "impact": scatter_df["impact_score"].tolist(),
-            "likelihood": scatter_df["likelihood_score"].tolist()
-        },
-        "table": table_data,
-        "file_risk_counts": {
-            "labels": file_count["risk_name"].tolist(),
-            "counts": file_count["file_count"].tolist()
-        }
-    }
+    # Served from aggregate tables kept current by triggers on `risk`, see utils/dashboard.py
+    return risk_dashboard.data(access_level)
 
 @app.route("/risk_overview")
 def risk_overview1():
     return render_template("risk_overview.html")
 
+def _dashboard_response(build):
+    """
+    The response `build()` makes, or a 304 when the client already holds it.
+
+    Dashboard payloads only change when risk rows are written, so the ETag
+    and Last-Modified come from the data version bumped on every write and
+    the browser revalidates instead of downloading the JSON again.
+    """
+    version, updated_at = risk_dashboard.state()
+    etag = f"{version}-{int(updated_at * 1000)}"
+    last_modified = datetime.fromtimestamp(int(updated_at), timezone.utc)
+    if request.if_none_match:
+        fresh = request.if_none_match.contains_weak(etag)
+    else:
+        fresh = request.if_modified_since is not None and request.if_modified_since >= last_modified
+    response = Response(status=304) if fresh else build()
+    if response.status_code in (200, 304):
+        response.set_etag(etag, weak=True)
+        response.last_modified = last_modified
+        response.cache_control.no_cache = True
+    return response
+
 @app.route("/data/<level>")
 def get_level_data(level):
-    return jsonify(get_data(level))
+    return _dashboard_response(lambda: jsonify(get_data(level)))
+
+@app.route("/data/<level>/table")
+def get_level_table(level):
+    """Keyset-paginated risk rows: ?sort=&order=asc|desc&after=<next>&limit=&fields=a,b&q=&risk_name="""
+    return _dashboard_response(lambda: _table_page(level))
+
+def _table_page(level):
+    fields = request.args.get('fields')
+    try:
+        page = risk_dashboard.table(
+            level,
+            sort=request.args.get('sort', 'id'),
+            descending=request.args.get('order', 'asc').lower() == 'desc',
+            after=request.args.get('after'),
+            limit=request.args.get('limit', TABLE_PAGE_SIZE, type=int),
+            fields=fields.split(',') if fields else None,
+            search=request.args.get('q', '').strip(),
+            risk_name=request.args.get('risk_name'),
+        )
+    except ValueError as e:
+        response = jsonify({"status": "error", "message": str(e)})
+        response.status_code = 400
+        return response
+    return jsonify(page)
 
 
 # # --- Login ---
@@ -0,0 +1,279 @@
+"""
+Async (ASGI) serving mode.
+
+The LLM-bound routes are served by async handlers that await the async
+OpenAI client, so an in-flight analysis costs a coroutine instead of a
+thread. Every other route, and the non-analysis actions of /risk_analysis,
+falls through to the unchanged Flask app. Run with:
+
+    uvicorn asgi:app --host 0.0.0.0 --port 8000
+
+`python app.py` / any WSGI server keeps serving the sync versions.
+"""
+import asyncio
+import json
+from contextlib import asynccontextmanager
+
+from a2wsgi import WSGIMiddleware
+from flask import render_template
+from loguru import logger
+from starlette.applications import Starlette
+from starlette.responses import HTMLResponse, JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.routing import Mount, Route
+
+from OPENAI import acall_gpt4o, acall_gpt4o_chunked, astream_gpt4o, analyze_risks_detailed
+from app import (
+    app as flask_app,
+    _batch_line,
+    _initial_analysis_pairs,
+    _load_document,
+    _risk_event,
+    _sse,
+    _too_large_message,
+    _use_llm_cache,
+    detailed_analysis_prompt,
+    initial_analysis_prompt,
+    plan_initial_analysis,
+    render_risk_analysis_page,
+)
+from utils import metrics
+from utils.fanout import LLM_PER_DOCUMENT_CONCURRENCY
+from utils.http_cache import COMPRESS_MIN_BYTES, choose_encoding, compress
+from utils.llm_client import client_manager
+from utils.stream_json import IdentifiedRisksParser
+from utils.tokens import PromptTooLargeError
+
+wsgi_app = WSGIMiddleware(flask_app)
+
+
+def html_response(request, html):
+    """HTMLResponse compressed like the Flask responses (see utils/http_cache.py)."""
+    body = html.encode("utf-8")
+    encoding = choose_encoding(request.headers.get("accept-encoding"))
+    headers = {"Vary": "Accept-Encoding"}
+    if encoding and len(body) >= COMPRESS_MIN_BYTES:
+        body = compress(body, encoding)
+        headers["Content-Encoding"] = encoding
+    return HTMLResponse(body, headers=headers)
+
+
+def flask_context(request):
+    """Flask request context for rendering templates; carries the cookies so the session is available."""
+    return flask_app.test_request_context(request.url.path, method=request.method, headers=dict(request.headers))
+
+
+async def load_document(values):
+    # doc_store touches the disk
+    return await asyncio.to_thread(_load_document, values)
+
+
+def prepare_initial_analysis(text, values):
+    """Returns (chunked, prompt, estimate); tokenizes the document, so it runs in a thread."""
+    chunked, estimate = plan_initial_analysis(text, values)
+    if chunked:
+        return True, None, estimate
+    prompt, estimate = initial_analysis_prompt(text, estimate)
+    return False, prompt, estimate
+
+
+async def arun_initial_analysis(text, values, use_cache=True):
+    chunked, prompt, estimate = await asyncio.to_thread(prepare_initial_analysis, text, values)
+    if chunked:
+        return await acall_gpt4o_chunked(text, use_cache=use_cache)
+    return await acall_gpt4o(prompt, use_cache=use_cache, estimate=estimate)
+
+
+async def arun_detailed_analysis(text, name, use_cache=True):
+    prompt, estimate = await asyncio.to_thread(detailed_analysis_prompt, text, name)
+    result = await acall_gpt4o(prompt, use_cache=use_cache, estimate=estimate)
+    with metrics.stage("parse"):
+        return analyze_risks_detailed(result)
+
+
+class _ToFlask:
+    """Returned by an endpoint to hand the request to the Flask app instead."""
+
+    def __init__(self, body=None):
+        self.body = body
+
+    async def __call__(self, scope, receive, send):
+        if self.body is not None:
+            # The endpoint already read the body to look at the form; replay it
+            replayed = False
+            downstream = receive
+
+            async def receive():
+                nonlocal replayed
+                if replayed:
+                    return await downstream()
+                replayed = True
+                return {"type": "http.request", "body": self.body, "more_body": False}
+
+        await wsgi_app(scope, receive, send)
+
+
+async def risk_analysis(request):
+    """Async `upload_file` for action=analyze; uploads, resets and GETs are served by Flask."""
+    if request.method != "POST" or request.headers.get("content-type", "").startswith("multipart/"):
+        return _ToFlask()
+    body = await request.body()
+    form = await request.form()
+    if form.get("action") != "analyze":
+        return _ToFlask(body)
+
+    doc_id, text = await load_document(form)
+    document_expired = text is None
+    if document_expired:
+        doc_id, text = "", ""
+    filename = form.get("filename", "") if text else ""
+    analysis_error = ""
+    risk_lis, risk_analysis_pairs = [], []
+    if text:
+        try:
+            response = await arun_initial_analysis(text, form, use_cache=_use_llm_cache(form))
+        except PromptTooLargeError as e:
+            logger.warning(str(e))
+            analysis_error = _too_large_message(e)
+            response = {}
+        risk_lis, risk_analysis_pairs = _initial_analysis_pairs(response)
+
+    try:
+        analysis_dict = json.loads(form.get("analysis_dict", "{}"))
+    except json.JSONDecodeError:
+        analysis_dict = {}
+    with flask_context(request):
+        html = render_risk_analysis_page(
+            text=text, doc_id=doc_id, document_expired=document_expired, analysis_error=analysis_error,
+            risk_lis=risk_lis, risk_analysis_pairs=risk_analysis_pairs, analysis_dict=analysis_dict,
+            page=int(form.get("page", 0)), filename=filename)
+    return html_response(request, html)
+
+
+async def stream_initial_analysis(request):
+    form = await request.form()
+    doc_id, text = await load_document(form)
+    filename = form.get("filename", "")
+
+    if text is None:
+        return PlainTextResponse("Document expired, please upload it again", 410)
+    if not text:
+        return PlainTextResponse("Invalid request", 400)
+
+    use_cache = _use_llm_cache(form)
+
+    async def risks():
+        chunked, prompt, estimate = await asyncio.to_thread(prepare_initial_analysis, text, form)
+        if chunked:
+            # Chunks finish independently, so the merged list is only known at the end
+            response = await acall_gpt4o_chunked(text, use_cache=use_cache)
+            for risk in response.get("risk_assessment", {}).get("identified_risks", []):
+                yield risk
+            return
+        parser = IdentifiedRisksParser()
+        async for delta in astream_gpt4o(prompt, use_cache=use_cache, estimate=estimate):
+            for risk in parser.feed(delta):
+                yield risk
+
+    async def generate():
+        index = 0
+        try:
+            async for risk in risks():
+                with flask_context(request):
+                    event = _risk_event(risk, index + 1, doc_id, filename)
+                if event:
+                    index += 1
+                    yield event
+        except PromptTooLargeError as e:
+            logger.warning(str(e))
+            yield _sse("error", {"message": f"Document too large ({e.estimate['total']} tokens, limit {e.budget})"})
+            return
+        except Exception:
+            logger.exception("Error during streamed initial analysis")
+            yield _sse("error", {"message": "Error during analysis"})
+            return
+        yield _sse("done", {"count": index})
+
+    return StreamingResponse(generate(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+async def detailed_analysis(request):
+    form = await request.form()
+    doc_id, text = await load_document(form)
+    name = form.get("risk_name", "")
+
+    if text is None:
+        return PlainTextResponse("Document expired, please upload it again", 410)
+    if not name or not text:
+        return PlainTextResponse("Invalid request", 400)
+
+    try:
+        detailed_result = await arun_detailed_analysis(text, name, use_cache=_use_llm_cache(form))
+    except PromptTooLargeError as e:
+        logger.warning(str(e))
+        return PlainTextResponse("Document too large for a detailed analysis", 413)
+    except Exception:
+        logger.exception("Error during detailed analysis")
+        return PlainTextResponse("Error during analysis", 500)
+
+    with flask_context(request):
+        html = render_template("detailed_analysis_partial.html", risk_name=name, detailed_result=detailed_result)
+    return html_response(request, html)
+
+
+async def detailed_analysis_batch(request):
+    try:
+        data = await request.json()
+    except json.JSONDecodeError:
+        data = {}
+    doc_id, text = await load_document(data)
+    risk_names = data.get("risk_names") or []
+
+    if text is None:
+        return JSONResponse({"status": "error", "message": "Document expired, please upload it again"}, 410)
+    if not text or not risk_names:
+        return JSONResponse({"status": "error", "message": "doc_id and risk_names are required"}, 400)
+
+    use_cache = _use_llm_cache(request.query_params) and data.get("refresh") not in (True, 1, "1", "true")
+    semaphore = asyncio.Semaphore(LLM_PER_DOCUMENT_CONCURRENCY)
+
+    async def analyze(name):
+        async with semaphore:
+            try:
+                return name, await arun_detailed_analysis(text, name, use_cache=use_cache), None
+            except Exception as e:
+                return name, None, e
+
+    async def generate():
+        tasks = [asyncio.ensure_future(analyze(name)) for name in risk_names]
+        try:
+            for finished in asyncio.as_completed(tasks):
+                name, detailed_result, error = await finished
+                # Leave the Flask context before yielding: the generator may be closed from another task
+                with flask_context(request):
+                    line = _batch_line(name, detailed_result, error)
+                yield line
+        finally:
+            # A client disconnect closes the generator; don't leave its LLM calls running
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+
+@asynccontextmanager
+async def lifespan(_):
+    yield
+    await client_manager.aclose()
+
+
+app = Starlette(
+    routes=[
+        Route("/risk_analysis", risk_analysis, methods=["GET", "POST"]),
+        Route("/risk_analysis/stream", stream_initial_analysis, methods=["POST"]),
+        Route("/detailed_analysis", detailed_analysis, methods=["POST"]),
+        Route("/detailed_analysis_batch", detailed_analysis_batch, methods=["POST"]),
+        Mount("/", app=wsgi_app),
+    ],
+    lifespan=lifespan,
+)
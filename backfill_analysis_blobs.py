@@ -0,0 +1,52 @@
+"""
+Moves saved analysis payloads into compressed, deduplicated blob storage.
+
+Records saved before payloads were content-addressed keep their full JSON
+inline in `analysis_record.content_json`. This copies each payload into
+`analysis_blob` (zlib, one row per distinct content), points the record at
+it, and prints how much space the payloads took before and after:
+
+    python backfill_analysis_blobs.py --vacuum
+
+Batches commit on their own, so the backfill can be interrupted and rerun.
+New saves already go to `analysis_blob`; the app reads both layouts.
+"""
+import argparse
+import json
+import os
+
+from app import app
+from models import db
+from utils.analysis_records import backfill_blobs, storage_report
+
+
+def _database_file():
+    return db.engine.url.database
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=500, help="records moved per transaction")
+    parser.add_argument("--vacuum", action="store_true", help="VACUUM afterwards to return the freed pages to the OS")
+    parser.add_argument("--report-only", action="store_true", help="print the space report without moving anything")
+    args = parser.parse_args(argv)
+
+    with app.app_context():
+        path = _database_file()
+        file_before = os.path.getsize(path)
+        if not args.report_only:
+            moved = backfill_blobs(batch_size=args.batch_size)
+            print(f"{moved} records moved to analysis_blob")
+            if args.vacuum:
+                db.session.close()
+                with db.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+                    conn.exec_driver_sql("VACUUM")
+                    conn.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)")
+        report = storage_report()
+        report["file_bytes_before"] = file_before
+        report["file_bytes_after"] = os.path.getsize(path)
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+"""
+Headless batch analysis of a document archive.
+
+Walks a directory, runs the same pipeline as the web UI on every .pdf, .txt
+and .docx file (extraction -> iteration-0 prompt -> call_gpt4o ->
+analyze_risks_initial, optionally an iteration-1 analysis per risk) with a
+pool of workers, and bulk-writes the results into the normalized `risk` table
+read by the risk overview dashboard.
+
+Progress is checkpointed in the target database, in the same transaction as
+the rows it covers, so an interrupted run picks up where it stopped. A file
+whose content changed since it was analyzed is analyzed again:
+
+    python batch_analyze.py /data/archive --workers 8 --detailed
+"""
+import argparse
+import hashlib
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from loguru import logger
+
+from OPENAI import (
+    analyze_risks_detailed,
+    analyze_risks_initial,
+    call_gpt4o,
+    call_gpt4o_chunked,
+    estimate_prompt_tokens,
+    get_risk_prompt_iteration_0,
+    get_risk_prompt_iteration_1,
+    should_chunk,
+)
+from utils.extraction import PDF_ENGINE, PDF_ENGINES, extract_document_in_pool
+from utils.extraction_cache import extraction_cache
+from utils.risk_store import RISKS_DB_PATH, insert_risks, risk_database
+
+ALLOWED_EXTENSIONS = {'txt', 'pdf', 'docx'}
+
+
+def _create_checkpoint_table(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS risk_batch_checkpoint (
+            path TEXT PRIMARY KEY,
+            content_hash TEXT NOT NULL,
+            status TEXT NOT NULL,
+            risks INTEGER,
+            error TEXT,
+            finished_at REAL NOT NULL
+        )
+    ''')
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def find_documents(root):
+    paths = []
+    for directory, _, files in os.walk(root):
+        for name in files:
+            if '.' in name and name.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS:
+                paths.append(os.path.join(directory, name))
+    return sorted(paths)
+
+
+def _kris(items):
+    return ", ".join(
+        f"{k.get('indicator', '')} (Rationale: {k.get('rationale', '')})" if isinstance(k, dict) else str(k)
+        for k in items or [])
+
+
+def _controls(items):
+    return ", ".join(
+        f"{c.get('control', '')} (Explanation: {c.get('explanation', '')})" if isinstance(c, dict) else str(c)
+        for c in items or [])
+
+
+def _row(analysis_type, file_name, analysis, kris, controls, args):
+    # risk_name holds the tier-1 category, as in the rows saved from the UI; fields in RISKS_COLUMNS order
+    return (
+        analysis_type, args.file_id, file_name, analysis['description'], analysis['name'].split("-")[0],
+        analysis['triggering_root_cause_events'], analysis['triggering_intermediate_events'],
+        analysis['consequences'], analysis['likelihood'], analysis['impact'],
+        _kris(kris), _controls(controls), args.access_level,
+    )
+
+
+def analyze_document(path, args):
+    """Runs the pipeline on one file; returns (content_hash, rows)."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    content_hash = hashlib.sha256(data).hexdigest()
+    file_name = os.path.basename(path)
+    extraction = extraction_cache.extract(data, file_name, engine=args.pdf_engine, extractor=extract_document_in_pool)
+    text = extraction['text']
+    if not text.strip():
+        raise ValueError("no text could be extracted")
+
+    use_cache = not args.refresh
+    estimate = estimate_prompt_tokens(text)
+    if should_chunk(text, estimate=estimate):
+        response = call_gpt4o_chunked(text, use_cache=use_cache)
+    else:
+        response = call_gpt4o(get_risk_prompt_iteration_0(text), use_cache=use_cache, estimate=estimate)
+
+    rows = []
+    for risk in response.get('risk_assessment', {}).get('identified_risks', []):
+        analyses, risk_lis = analyze_risks_initial([risk])
+        if not risk_lis:
+            continue
+        risk_data = next(iter(risk.values()))
+        rows.append(_row("Initial Analysis", file_name, analyses[0],
+                         risk_data.get('key_risk_indicators'), risk_data.get('internal_controls'), args))
+
+        if args.detailed:
+            level_0_risk, level_1_risk = (part.strip() for part in risk_lis[0]['name'].split("-", 1))
+            try:
+                detailed = call_gpt4o(
+                    get_risk_prompt_iteration_1(text, level_0_risk, level_1_risk), use_cache=use_cache,
+                    estimate=estimate_prompt_tokens(text, level_0_risk, level_1_risk))
+                analysis = analyze_risks_detailed(detailed)[0]
+            except Exception as e:
+                # One failed risk (API error, timeout, malformed response) must not discard the document's rows
+                logger.warning(f"{file_name}: detailed analysis of {risk_lis[0]['name']} failed: {e!r}")
+                continue
+            rows.append(_row("Detailed Analysis", file_name, analysis,
+                             analysis['kris'], analysis['controls'], args))
+    return content_hash, rows
+
+
+def run(args):
+    db = risk_database(args.db)
+    db.add_schema(_create_checkpoint_table)
+    paths = find_documents(args.directory)
+    with db.connection() as conn:
+        done = {path: (status, content_hash) for path, status, content_hash in conn.execute(
+            "SELECT path, status, content_hash FROM risk_batch_checkpoint").fetchall()}
+
+    def pending(path):
+        status, content_hash = done.get(os.path.abspath(path), (None, None))
+        if status == 'error':
+            return args.retry_failed
+        if status == 'done' and file_hash(path) != content_hash:
+            logger.info(f"{path} changed since it was analyzed; analyzing it again")
+            return True
+        return status != 'done'
+
+    todo = [p for p in paths if pending(p)]
+    if args.limit:
+        todo = todo[:args.limit]
+    logger.info(f"{len(paths)} documents found, {len(paths) - len(todo)} already processed, {len(todo)} to go")
+    if not todo:
+        return
+
+    pending_rows, pending_checkpoints = [], []
+    processed = failed = 0
+    start = time.perf_counter()
+
+    def flush():
+        # Risk rows and the checkpoints covering them commit together
+        with db.connection() as conn:
+            insert_risks(conn, pending_rows)
+            conn.executemany("""
+                INSERT OR REPLACE INTO risk_batch_checkpoint (path, content_hash, status, risks, error, finished_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, pending_checkpoints)
+        pending_rows.clear()
+        pending_checkpoints.clear()
+        minutes = (time.perf_counter() - start) / 60
+        logger.info(f"{processed + failed}/{len(todo)} documents ({failed} failed), "
+                    f"{(processed + failed) / minutes:.1f} docs/min")
+
+    def analyze(path):
+        return analyze_document(path, args)
+
+    remaining = iter(todo)
+    with ThreadPoolExecutor(max_workers=args.workers, thread_name_prefix="batch") as executor:
+        futures = {}
+        try:
+            while True:
+                # Keep a bounded number of documents in flight so memory stays flat on huge archives
+                while len(futures) < args.workers * 2:
+                    path = next(remaining, None)
+                    if path is None:
+                        break
+                    futures[executor.submit(analyze, path)] = path
+                if not futures:
+                    break
+                finished, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    path = futures.pop(future)
+                    key = os.path.abspath(path)
+                    try:
+                        content_hash, rows = future.result()
+                    except Exception as e:
+                        failed += 1
+                        logger.warning(f"{path}: {e!r}")
+                        pending_checkpoints.append((key, "", "error", None, repr(e), time.time()))
+                    else:
+                        processed += 1
+                        pending_rows.extend(rows)
+                        pending_checkpoints.append((key, content_hash, "done", len(rows), None, time.time()))
+                if len(pending_checkpoints) >= args.flush_every:
+                    flush()
+        except KeyboardInterrupt:
+            logger.warning("Interrupted, saving finished documents; rerun the same command to resume")
+            for future in futures:
+                future.cancel()
+            raise
+        finally:
+            if pending_checkpoints:
+                flush()
+            db.close()
+
+    elapsed = time.perf_counter() - start
+    print(f"{processed} documents analyzed, {failed} failed in {elapsed:.0f}s "
+          f"({(processed + failed) / (elapsed / 60):.1f} docs/min)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("directory", help="directory to walk for .pdf, .txt and .docx files")
+    parser.add_argument("--db", default=RISKS_DB_PATH,
+                        help=f"risk database read by the dashboard (default: RISKS_DB_PATH, {RISKS_DB_PATH})")
+    parser.add_argument("--workers", type=int, default=8, help="documents analyzed concurrently")
+    parser.add_argument("--detailed", action="store_true", help="also run the detailed (iteration-1) analysis per risk")
+    parser.add_argument("--pdf-engine", choices=PDF_ENGINES, default=PDF_ENGINE)
+    parser.add_argument("--access-level", choices=("user", "group"), default="user")
+    parser.add_argument("--file-id", type=int, default=None, help="value for the file_id column")
+    parser.add_argument("--flush-every", type=int, default=20, help="documents per bulk write / checkpoint")
+    parser.add_argument("--limit", type=int, default=0, help="stop after this many documents")
+    parser.add_argument("--retry-failed", action="store_true", help="retry documents that failed in a previous run")
+    parser.add_argument("--refresh", action="store_true", help="bypass the LLM cache")
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.directory):
+        parser.error(f"{args.directory} is not a directory")
+    try:
+        run(args)
+    except KeyboardInterrupt:
+        sys.exit(130)
+
+
+if __name__ == "__main__":
+    main()
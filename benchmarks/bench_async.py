@@ -0,0 +1,164 @@
+"""
+Sync (WSGI, thread per request) vs async (ASGI) serving of /detailed_analysis.
+
+Starts the mock chat-completions endpoint (mock_openai.py) with a fixed latency, then serves the
+app twice against it: the Flask app on a WSGI server with a fixed number of
+threads (like a gunicorn gthread worker), and asgi:app under uvicorn. Both get
+the same burst of concurrent requests; the LLM cache is disabled so every
+request reaches the mock.
+
+Usage:
+    python benchmarks/bench_async.py [--requests 200] [--latency 2.0] [--threads 8]
+"""
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def serve_mock(port, latency):
+    import uvicorn
+    from mock_openai import MockCompletions, create_app
+
+    uvicorn.run(create_app(MockCompletions(latency=str(latency))), host="127.0.0.1", port=port,
+                log_level="warning", backlog=4096)
+
+
+def serve_sync(port, threads):
+    from concurrent.futures import ThreadPoolExecutor
+
+    from werkzeug.serving import BaseWSGIServer
+
+    from app import app
+
+    class PooledWSGIServer(BaseWSGIServer):
+        request_queue_size = 4096
+
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.pool = ThreadPoolExecutor(max_workers=threads)
+
+        def process_request(self, request, client_address):
+            self.pool.submit(self._handle, request, client_address)
+
+        def _handle(self, request, client_address):
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+    PooledWSGIServer("127.0.0.1", port, app).serve_forever()
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_for_port(port, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Server on port {port} did not start")
+
+
+async def drive(port, n):
+    import httpx
+
+    text = "The borrower's fiscal position has deteriorated and counterpart funding is delayed. " * 50
+    limits = httpx.Limits(max_connections=n, max_keepalive_connections=n)
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=600) as client:
+        async def one():
+            start = time.perf_counter()
+            r = await client.post("/detailed_analysis", data={"text": text, "risk_name": "Financial Risk - Credit", "refresh": "1"})
+            return r.status_code, time.perf_counter() - start
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*(one() for _ in range(n)))
+        elapsed = time.perf_counter() - start
+    latencies = sorted(t for _, t in results)
+    return {
+        "ok": sum(1 for status, _ in results if status == 200),
+        "elapsed": elapsed,
+        "p50": latencies[len(latencies) // 2],
+        "p95": latencies[int(len(latencies) * 0.95) - 1],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=2.0, help="mock LLM latency in seconds")
+    parser.add_argument("--threads", type=int, default=8, help="threads of the sync server")
+    parser.add_argument("--serve-mock", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--serve-sync", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve_mock:
+        return serve_mock(args.serve_mock, args.latency)
+    if args.serve_sync:
+        return serve_sync(args.serve_sync, args.threads)
+
+    workdir = tempfile.mkdtemp(prefix="bench_async_")
+    mock_port = _free_port()
+    env = dict(
+        os.environ,
+        PYTHONPATH=ROOT,
+        AZURE_OPENAI_ENDPOINT=f"http://127.0.0.1:{mock_port}",
+        AZURE_OPENAI_API_KEY="mock",
+        LLM_CACHE_ENABLED="0",
+        LLM_MAX_RETRIES="0",
+        LLM_USAGE_PATH=os.path.join(workdir, "usage.db"),
+        DOC_STORE_DIR=os.path.join(workdir, "documents"),
+        JOBS_DB_PATH=os.path.join(workdir, "jobs.db"),
+        RISKS_DB_PATH=os.path.join(workdir, "risks.db"),
+        FEEDBACK_DB_PATH=os.path.join(workdir, "feedback.db"),
+        ANALYSIS_DATABASE_URI=f"sqlite:///{os.path.join(workdir, 'analysis.db')}",
+        LLM_POOL_MAX_CONNECTIONS=str(args.threads),
+    )
+    quiet = {"stdout": subprocess.DEVNULL, "stderr": subprocess.DEVNULL, "cwd": ROOT, "env": env}
+    me = os.path.abspath(__file__)
+    procs = [subprocess.Popen([sys.executable, me, "--serve-mock", str(mock_port), "--latency", str(args.latency)], **quiet)]
+    try:
+        _wait_for_port(mock_port)
+        modes = []
+
+        sync_port = _free_port()
+        procs.append(subprocess.Popen([sys.executable, me, "--serve-sync", str(sync_port), "--threads", str(args.threads)], **quiet))
+        modes.append((f"sync ({args.threads} threads)", sync_port))
+
+        async_port = _free_port()
+        procs.append(subprocess.Popen([sys.executable, "-m", "uvicorn", "asgi:app", "--port", str(async_port),
+                                       "--log-level", "warning", "--backlog", "4096"], **quiet))
+        modes.append(("async (uvicorn)", async_port))
+
+        print(f"{args.requests} concurrent /detailed_analysis requests, mock LLM latency {args.latency}s\n")
+        print(f"{'mode':<20} {'ok':>5} {'elapsed s':>10} {'req/s':>8} {'p50 s':>7} {'p95 s':>7}")
+        for name, port in modes:
+            _wait_for_port(port)
+            asyncio.run(drive(port, 2))  # warm up imports and clients
+            r = asyncio.run(drive(port, args.requests))
+            print(f"{name:<20} {r['ok']:>5} {r['elapsed']:>10.2f} {args.requests / r['elapsed']:>8.1f} "
+                  f"{r['p50']:>7.2f} {r['p95']:>7.2f}")
+    finally:
+        for p in procs:
+            p.terminate()
+        for p in procs:
+            p.wait()
+
+
+if __name__ == "__main__":
+    main()
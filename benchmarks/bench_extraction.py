@@ -0,0 +1,78 @@
+"""
+PDF extraction throughput, single process vs the process pool.
+
+Builds a synthetic text PDF (or uses --pdf) and extracts it with each engine,
+first with EXTRACT_PROCESSES=1 and then with the pool at --processes workers.
+
+Usage:
+    python benchmarks/bench_extraction.py [--pages 300] [--processes N] [--pdf report.pdf]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import utils.extraction as extraction  # noqa: E402
+
+
+def make_pdf(pages, lines=40):
+    """Minimal uncompressed PDF with `lines` lines of Helvetica text per page."""
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        f"<< /Type /Pages /Kids [{' '.join(f'{3 + 2 * i} 0 R' for i in range(pages))}] /Count {pages} >>",
+    ]
+    font = 3 + 2 * pages
+    for i in range(pages):
+        body = "BT /F1 10 Tf 40 800 Td 12 TL " + " ".join(
+            f"(Page {i + 1} line {j}: the borrower faces fiscal pressure and delayed counterpart funding.) '"
+            for j in range(lines)) + " ET"
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                       f"/Resources << /Font << /F1 {font} 0 R >> >> /Contents {4 + 2 * i} 0 R >>")
+        objects.append(f"<< /Length {len(body)} >>\nstream\n{body}\nendstream")
+    objects.append("<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    out, offsets = "%PDF-1.4\n", []
+    for number, obj in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n{obj}\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n" + "".join(f"{o:010d} 00000 n \n" for o in offsets)
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n"
+    return out.encode("latin-1")
+
+
+def timed(data, engine, processes):
+    extraction.EXTRACT_PROCESSES = processes
+    start = time.perf_counter()
+    result = extraction.extract_document(data, "bench.pdf", engine=engine)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=300)
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--pdf", help="benchmark this file instead of a synthetic one")
+    args = parser.parse_args()
+
+    if args.pdf:
+        with open(args.pdf, "rb") as f:
+            data = f.read()
+    else:
+        data = make_pdf(args.pages)
+
+    # Start the pool's processes before timing
+    timed(make_pdf(extraction.EXTRACT_PARALLEL_MIN_PAGES), "pypdf2", args.processes)
+
+    print(f"{'engine':<10} {'pages':>6} {'1 process s':>12} {f'{args.processes} processes s':>15} {'speedup':>8}")
+    for engine in extraction.PDF_ENGINES:
+        serial, a = timed(data, engine, 1)
+        parallel, b = timed(data, engine, args.processes)
+        assert a["text"] == b["text"], "parallel extraction must match the serial result"
+        print(f"{engine:<10} {a['pages']:>6} {serial:>12.2f} {parallel:>15.2f} {serial / parallel:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
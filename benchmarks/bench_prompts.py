@@ -0,0 +1,75 @@
+"""
+Micro-benchmark for prompt construction.
+
+Measures how long building an iteration-0 / iteration-1 prompt takes and how
+much of each prompt is the shared static prefix (the part a provider-side
+prompt cache can reuse across documents and risks).
+
+Usage:
+    python benchmarks/bench_prompts.py [--repeat 2000]
+"""
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from OPENAI import (  # noqa: E402
+    ITERATION_0_STATIC,
+    ITERATION_1_PREFIXES,
+    ITERATION_1_STATIC,
+    RISK_TAXONOMY,
+    get_risk_prompt_iteration_0,
+    get_risk_prompt_iteration_1,
+)
+from utils.tokens import count_tokens  # noqa: E402
+
+DOCUMENT_SIZES = [2_000, 20_000, 200_000]  # characters
+PAIRS = [(l0, l1) for l0, l1s in RISK_TAXONOMY.items() for l1 in l1s]
+
+
+def _document(size):
+    sentence = "The project will finance rural roads and requires counterpart funding from the borrower. "
+    return (sentence * (size // len(sentence) + 1))[:size]
+
+
+def _shared_prefix(a, b):
+    n = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        n += 1
+    return n
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=2000)
+    args = parser.parse_args()
+
+    print(f"{'size':>8} {'iter0 us':>9} {'iter1 us':>9} {'iter0 prefix':>13} {'iter1 prefix':>13}")
+    for size in DOCUMENT_SIZES:
+        document = _document(size)
+        t0 = timeit.timeit(lambda: get_risk_prompt_iteration_0(document), number=args.repeat)
+        t1 = timeit.timeit(lambda: [get_risk_prompt_iteration_1(document, *p) for p in PAIRS], number=args.repeat // 10 or 1)
+
+        prompt_0 = get_risk_prompt_iteration_0(document)
+        prompt_1 = get_risk_prompt_iteration_1(document, *PAIRS[0])
+        share_0 = count_tokens(ITERATION_0_STATIC) / count_tokens(prompt_0)
+        share_1 = count_tokens(ITERATION_1_STATIC) / count_tokens(prompt_1)
+        print(f"{size:>8} {t0 / args.repeat * 1e6:>9.2f} "
+              f"{t1 / ((args.repeat // 10 or 1) * len(PAIRS)) * 1e6:>9.2f} {share_0:>12.1%} {share_1:>12.1%}")
+
+    # The prefix must not depend on the document, or provider caching never hits
+    a, b = _document(1000), _document(1000)[::-1]
+    assert get_risk_prompt_iteration_0(a).startswith(ITERATION_0_STATIC)
+    assert _shared_prefix(get_risk_prompt_iteration_0(a), get_risk_prompt_iteration_0(b)) >= len(ITERATION_0_STATIC)
+    for pair in PAIRS:
+        assert get_risk_prompt_iteration_1(a, *pair).startswith(ITERATION_1_PREFIXES[pair])
+    print(f"\nstatic prefix tokens: iteration 0 = {count_tokens(ITERATION_0_STATIC)}, "
+          f"iteration 1 (shared by all {len(PAIRS)} risks) = {count_tokens(ITERATION_1_STATIC)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+"""
+End-to-end load test of the web app against the mock Azure OpenAI endpoint.
+
+Starts mock_openai.py and the app (threaded WSGI server, or asgi:app under
+uvicorn with --asgi) on local ports, with every database and cache in a
+temporary directory, then replays user sessions concurrently:
+
+    upload a document -> analyze it -> N detailed-analysis clicks -> save all
+
+Each session waits --think seconds between steps. At the end, requests per
+route are reported with their throughput, p50/p95/p99 latency and error rate
+(HTTP status >= 400 or a transport error). The mock's latency and fault
+options (--latency, --rate-429, --rate-500, --rate-truncated, ...) are passed
+through; see mock_openai.py.
+
+Usage:
+    python benchmarks/load_test.py [--sessions 50] [--concurrency 10] [--clicks 3] [--latency lognormal:2,0.5]
+    python benchmarks/load_test.py --url http://127.0.0.1:5000   # an app that is already running
+"""
+import argparse
+import asyncio
+import html
+import math
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_async import _free_port, _wait_for_port, serve_sync  # noqa: E402
+from bench_prompts import _document  # noqa: E402
+from mock_openai import add_arguments, mock_arguments  # noqa: E402
+
+DOC_ID = re.compile(r'name="doc_id" value="([^"]+)"')
+RISK_NAME = re.compile(r'data-risk-name="([^"]+)"')
+
+
+class Recorder:
+    """Latencies and errors per route."""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.sessions_ok = 0
+        self.sessions_failed = 0
+
+    async def request(self, client, route, method, url, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+        except Exception:
+            self.latencies[route].append(time.perf_counter() - start)
+            self.errors[route] += 1
+            return None
+        self.latencies[route].append(time.perf_counter() - start)
+        if response.status_code >= 400:
+            self.errors[route] += 1
+            return None
+        return response
+
+    def report(self, elapsed):
+        print(f"\n{'route':<28} {'requests':>8} {'req/s':>7} {'p50 s':>7} {'p95 s':>7} {'p99 s':>7} {'errors':>7}")
+        for route, latencies in self.latencies.items():
+            latencies = sorted(latencies)
+            print(f"{route:<28} {len(latencies):>8} {len(latencies) / elapsed:>7.2f} "
+                  f"{_percentile(latencies, 50):>7.2f} {_percentile(latencies, 95):>7.2f} "
+                  f"{_percentile(latencies, 99):>7.2f} {self.errors[route] / len(latencies):>7.1%}")
+        total = self.sessions_ok + self.sessions_failed
+        print(f"\n{total} sessions in {elapsed:.1f}s ({total / elapsed * 60:.1f}/min), "
+              f"{self.sessions_failed} did not complete")
+
+
+def _percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    # Nearest-rank percentile
+    return sorted_values[max(0, math.ceil(p / 100 * len(sorted_values)) - 1)]
+
+
+async def session(client, recorder, args, rng, number):
+    filename = f"session_{number}.txt"
+    document = _document(rng.randint(args.min_chars, args.max_chars))
+
+    async def think():
+        if args.think:
+            await asyncio.sleep(rng.uniform(0, 2 * args.think))
+
+    response = await recorder.request(
+        client, "POST /risk_analysis upload", "POST", "/risk_analysis",
+        data={"action": "upload"}, files={"file": (filename, document.encode("utf-8"), "text/plain")})
+    match = DOC_ID.search(response.text) if response is not None else None
+    if not match:
+        recorder.sessions_failed += 1
+        return
+    doc_id = match.group(1)
+    await think()
+
+    response = await recorder.request(
+        client, "POST /risk_analysis analyze", "POST", "/risk_analysis",
+        data={"action": "analyze", "doc_id": doc_id, "filename": filename, "refresh": "1"})
+    names = list(dict.fromkeys(html.unescape(n) for n in RISK_NAME.findall(response.text))) if response else []
+    if not names:
+        recorder.sessions_failed += 1
+        return
+
+    saved = []
+    for name in rng.sample(names, min(args.clicks, len(names))):
+        await think()
+        response = await recorder.request(
+            client, "POST /detailed_analysis", "POST", "/detailed_analysis",
+            data={"doc_id": doc_id, "risk_name": name, "refresh": "1"})
+        if response is not None:
+            saved.append(name)
+
+    await think()
+    records = [{"content_json": {"risk_name": name, "session": number}, "analysis_type": "detailed",
+                "ownership": "shared", "risk_name": name, "filename": filename} for name in saved or names]
+    response = await recorder.request(client, "POST /save_analysis/bulk", "POST", "/save_analysis/bulk",
+                                      json={"records": records})
+    if response is None:
+        recorder.sessions_failed += 1
+    else:
+        recorder.sessions_ok += 1
+
+
+async def drive(url, args):
+    import httpx
+
+    recorder = Recorder()
+    rng = random.Random(args.seed)
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    semaphore = asyncio.Semaphore(args.concurrency)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=args.timeout) as client:
+        async def one(number):
+            async with semaphore:
+                await session(client, recorder, args, random.Random(rng.random()), number)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(args.sessions)))
+        elapsed = time.perf_counter() - start
+    recorder.report(elapsed)
+    return recorder
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="load-test this running app instead of starting one (and the mock)")
+    parser.add_argument("--sessions", type=int, default=50, help="user sessions to replay")
+    parser.add_argument("--concurrency", type=int, default=10, help="sessions running at the same time")
+    parser.add_argument("--clicks", type=int, default=3, help="detailed analyses per session")
+    parser.add_argument("--think", type=float, default=0.5, help="mean pause between a session's steps, seconds")
+    parser.add_argument("--min-chars", type=int, default=5_000, help="smallest uploaded document")
+    parser.add_argument("--max-chars", type=int, default=50_000, help="largest uploaded document")
+    parser.add_argument("--timeout", type=float, default=300, help="client timeout per request, seconds")
+    parser.add_argument("--threads", type=int, default=16, help="threads of the WSGI server")
+    parser.add_argument("--asgi", action="store_true", help="serve asgi:app under uvicorn instead of WSGI")
+    parser.add_argument("--serve-mock", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--serve-sync", type=int, help=argparse.SUPPRESS)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    if args.serve_mock:
+        from mock_openai import serve
+        return serve(args.serve_mock, args)
+    if args.serve_sync:
+        return serve_sync(args.serve_sync, args.threads)
+    if args.url:
+        asyncio.run(drive(args.url, args))
+        return
+
+    workdir = tempfile.mkdtemp(prefix="load_test_")
+    mock_port, app_port = _free_port(), _free_port()
+    env = dict(
+        os.environ,
+        PYTHONPATH=ROOT,
+        AZURE_OPENAI_ENDPOINT=f"http://127.0.0.1:{mock_port}",
+        AZURE_OPENAI_API_KEY="mock",
+        LLM_CACHE_ENABLED="false",
+        EXTRACTION_CACHE_PATH=os.path.join(workdir, "extraction_cache.db"),
+        LLM_USAGE_PATH=os.path.join(workdir, "usage.db"),
+        DOC_STORE_DIR=os.path.join(workdir, "documents"),
+        JOBS_DB_PATH=os.path.join(workdir, "jobs.db"),
+        RISKS_DB_PATH=os.path.join(workdir, "risks.db"),
+        FEEDBACK_DB_PATH=os.path.join(workdir, "feedback.db"),
+        ANALYSIS_DATABASE_URI=f"sqlite:///{os.path.join(workdir, 'analysis.db')}",
+    )
+    log = open(os.path.join(workdir, "servers.log"), "w")
+    quiet = {"stdout": log, "stderr": log, "cwd": ROOT, "env": env}
+    me = os.path.abspath(__file__)
+    procs = [subprocess.Popen([sys.executable, me, "--serve-mock", str(mock_port)] + mock_arguments(args), **quiet)]
+    if args.asgi:
+        procs.append(subprocess.Popen([sys.executable, "-m", "uvicorn", "asgi:app", "--port", str(app_port),
+                                       "--log-level", "warning", "--backlog", "4096"], **quiet))
+    else:
+        procs.append(subprocess.Popen([sys.executable, me, "--serve-sync", str(app_port),
+                                       "--threads", str(args.threads)], **quiet))
+    try:
+        _wait_for_port(mock_port)
+        _wait_for_port(app_port, timeout=60)
+        print(f"{args.sessions} sessions, {args.concurrency} concurrent, {args.clicks} detailed clicks each; "
+              f"mock latency {args.latency}, 429 {args.rate_429:.0%}, 500 {args.rate_500:.0%}, "
+              f"truncated {args.rate_truncated:.0%}\nserver logs: {log.name}")
+        asyncio.run(drive(f"http://127.0.0.1:{app_port}", args))
+    finally:
+        for p in procs:
+            p.terminate()
+        for p in procs:
+            p.wait()
+        log.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+"""
+Local stand-in for the Azure OpenAI chat-completions API.
+
+Serves the same routes and payloads the app's clients use, so the app can be
+load-tested by pointing AZURE_OPENAI_ENDPOINT at it. Responses are replayed
+from the recorded `risk_assessment` fixtures in benchmarks/fixtures/: an
+iteration-1 prompt gets the detailed response renamed to its target risk,
+anything else gets the initial (identified risks) response.
+
+Latency, streaming and faults are configurable:
+
+    --latency 2.0                fixed seconds before the response (or the first chunk)
+    --latency uniform:1,3        uniform between 1 and 3 s
+    --latency normal:2,0.5       normal, mean 2 s, standard deviation 0.5 s
+    --latency lognormal:2,0.5    log-normal with a 2 s median (sigma 0.5), the usual LLM shape
+    --latency exp:2              exponential with a 2 s mean
+    --rate-429 0.05              share of requests rejected with 429 + Retry-After
+    --rate-500 0.01              share of requests failing with 500
+    --rate-truncated 0.02        share of responses cut off mid-JSON (finish_reason "length")
+
+Streaming requests (`stream=True`) get the content in --stream-chunks SSE
+chunks --chunk-delay seconds apart, then a usage chunk. GET /mock/stats
+returns the request and fault counters.
+
+Usage:
+    python benchmarks/mock_openai.py [--port 8008] [--latency lognormal:2,0.5] [--rate-429 0.05]
+    AZURE_OPENAI_ENDPOINT=http://127.0.0.1:8008 AZURE_OPENAI_API_KEY=mock python app.py
+"""
+import argparse
+import asyncio
+import copy
+import json
+import math
+import os
+import random
+import re
+import time
+import uuid
+from collections import Counter
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+TARGET_RISK = re.compile(r'The target risk is named "([^"]+)"')
+
+
+def parse_latency(spec):
+    """Returns a function sampling seconds from a --latency spec ("2.0", "uniform:1,3", "lognormal:2,0.5", ...)."""
+    name, _, params = spec.partition(":")
+    if not params:
+        value = float(name)
+        return lambda rng: value
+    args = [float(p) for p in params.split(",")]
+    samplers = {
+        "fixed": lambda rng: args[0],
+        "uniform": lambda rng: rng.uniform(args[0], args[1]),
+        "normal": lambda rng: max(0.0, rng.gauss(args[0], args[1])),
+        "lognormal": lambda rng: rng.lognormvariate(math.log(args[0]), args[1]),
+        "exp": lambda rng: rng.expovariate(1 / args[0]),
+    }
+    if name not in samplers:
+        raise ValueError(f"Unknown latency distribution: {name}")
+    return samplers[name]
+
+
+class MockCompletions:
+    """Builds replayed completions and decides which requests fail."""
+
+    def __init__(self, latency="1.0", rate_429=0.0, rate_500=0.0, rate_truncated=0.0, retry_after=1,
+                 stream_chunks=40, chunk_delay=0.02, seed=None):
+        self.latency = parse_latency(latency)
+        self.rate_429 = rate_429
+        self.rate_500 = rate_500
+        self.rate_truncated = rate_truncated
+        self.retry_after = retry_after
+        self.stream_chunks = stream_chunks
+        self.chunk_delay = chunk_delay
+        self.rng = random.Random(seed)
+        self.stats = Counter()
+        with open(os.path.join(FIXTURES, "initial_response.json"), encoding="utf-8") as f:
+            self.initial = json.load(f)
+        with open(os.path.join(FIXTURES, "detailed_response.json"), encoding="utf-8") as f:
+            self.detailed = json.load(f)
+
+    def content(self, body):
+        prompt = "".join(m.get("content") or "" for m in body.get("messages", []) if isinstance(m.get("content"), str))
+        target = TARGET_RISK.search(prompt)
+        if target:
+            response = copy.deepcopy(self.detailed)
+            response["risk_assessment"]["risk_name"] = target.group(1)
+            self.stats["detailed"] += 1
+        else:
+            response = self.initial
+            self.stats["initial"] += 1
+        return json.dumps(response), len(prompt) // 4
+
+    def fault(self):
+        """None, or the (status, body) of an injected error."""
+        roll = self.rng.random()
+        if roll < self.rate_429:
+            self.stats["429"] += 1
+            return 429, {"error": {"code": "429", "message": "Requests to the ChatCompletions_Create Operation "
+                                                             "have exceeded the rate limit (mock)."}}
+        if roll < self.rate_429 + self.rate_500:
+            self.stats["500"] += 1
+            return 500, {"error": {"code": "InternalServerError", "message": "The server had an error (mock)."}}
+        return None
+
+    def truncate(self, content):
+        if self.rng.random() < self.rate_truncated:
+            self.stats["truncated"] += 1
+            return content[:self.rng.randint(1, max(1, len(content) - 1))], "length"
+        return content, "stop"
+
+
+def _completion(model, content, finish_reason, prompt_tokens):
+    completion_tokens = len(content) // 4
+    return {
+        "id": f"chatcmpl-mock-{uuid.uuid4().hex[:12]}", "object": "chat.completion", "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "finish_reason": finish_reason, "message": {"role": "assistant", "content": content}}],
+        "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                  "total_tokens": prompt_tokens + completion_tokens},
+    }
+
+
+def _chunk(completion_id, model, delta=None, finish_reason=None, usage=None):
+    chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+             "choices": [] if usage else [{"index": 0, "delta": delta or {}, "finish_reason": finish_reason}]}
+    if usage:
+        chunk["usage"] = usage
+    return f"data: {json.dumps(chunk)}\n\n"
+
+
+def create_app(mock):
+    from starlette.applications import Starlette
+    from starlette.responses import JSONResponse, StreamingResponse
+    from starlette.routing import Route
+
+    async def completions(request):
+        body = await request.json()
+        mock.stats["requests"] += 1
+        model = body.get("model") or request.path_params.get("deployment", "gpt-4o")
+        await asyncio.sleep(mock.latency(mock.rng))
+
+        fault = mock.fault()
+        if fault:
+            status, error = fault
+            headers = {"Retry-After": str(mock.retry_after)} if status == 429 else None
+            return JSONResponse(error, status_code=status, headers=headers)
+
+        content, prompt_tokens = mock.content(body)
+        content, finish_reason = mock.truncate(content)
+        if not body.get("stream"):
+            return JSONResponse(_completion(model, content, finish_reason, prompt_tokens))
+
+        completion_id = f"chatcmpl-mock-{uuid.uuid4().hex[:12]}"
+        include_usage = (body.get("stream_options") or {}).get("include_usage")
+
+        async def events():
+            yield _chunk(completion_id, model, delta={"role": "assistant", "content": ""})
+            size = max(1, -(-len(content) // mock.stream_chunks))
+            for start in range(0, len(content), size):
+                yield _chunk(completion_id, model, delta={"content": content[start:start + size]})
+                await asyncio.sleep(mock.chunk_delay)
+            yield _chunk(completion_id, model, finish_reason=finish_reason)
+            if include_usage:
+                usage = _completion(model, content, finish_reason, prompt_tokens)["usage"]
+                yield _chunk(completion_id, model, usage=usage)
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    async def stats(request):
+        return JSONResponse(dict(mock.stats))
+
+    return Starlette(routes=[
+        Route("/openai/deployments/{deployment}/chat/completions", completions, methods=["POST"]),
+        Route("/v1/chat/completions", completions, methods=["POST"]),
+        Route("/chat/completions", completions, methods=["POST"]),
+        Route("/mock/stats", stats),
+    ])
+
+
+def add_arguments(parser):
+    parser.add_argument("--latency", default="1.0", help="latency spec, see above (default: 1.0)")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="share of requests answered with 429")
+    parser.add_argument("--rate-500", type=float, default=0.0, help="share of requests answered with 500")
+    parser.add_argument("--rate-truncated", type=float, default=0.0, help="share of responses cut off mid-JSON")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After seconds sent with 429s")
+    parser.add_argument("--stream-chunks", type=int, default=40, help="chunks per streamed response")
+    parser.add_argument("--chunk-delay", type=float, default=0.02, help="seconds between streamed chunks")
+    parser.add_argument("--seed", type=int, default=None, help="seed for latencies and faults")
+
+
+def mock_arguments(args):
+    """The command-line flags reproducing `args`, to start the mock in a subprocess."""
+    return ["--latency", args.latency, "--rate-429", str(args.rate_429), "--rate-500", str(args.rate_500),
+            "--rate-truncated", str(args.rate_truncated), "--retry-after", str(args.retry_after),
+            "--stream-chunks", str(args.stream_chunks), "--chunk-delay", str(args.chunk_delay)] + \
+        (["--seed", str(args.seed)] if args.seed is not None else [])
+
+
+def serve(port, args):
+    import uvicorn
+
+    mock = MockCompletions(args.latency, args.rate_429, args.rate_500, args.rate_truncated, args.retry_after,
+                           args.stream_chunks, args.chunk_delay, args.seed)
+    uvicorn.run(create_app(mock), host="127.0.0.1", port=port, log_level="warning", backlog=4096)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8008)
+    add_arguments(parser)
+    args = parser.parse_args()
+    parse_latency(args.latency)  # fail before the server starts
+    serve(args.port, args)
+
+
+if __name__ == "__main__":
+    main()
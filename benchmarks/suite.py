@@ -0,0 +1,305 @@
+"""
+Offline benchmark suite with saved baselines and regression flags.
+
+Times the CPU-bound stages of the pipeline on synthetic and fixture inputs,
+without network access or an LLM:
+
+    extract     extract_document on TXT, DOCX and PDF files of growing size
+    prompt      get_risk_prompt_iteration_0 / _1 construction
+    parse       analyze_risks_initial / analyze_risks_detailed on the recorded
+                responses in benchmarks/fixtures/
+    format      format_output_with_highlights
+    dashboard   the risk overview aggregates (what get_data serves), its
+                first table page and a full rebuild, over 1k to 1M risks
+
+Each case reports the median time per call. Results are compared against
+benchmarks/baselines.json; a case slower than its baseline by more than
+--threshold is flagged and the exit status is 1. Baselines are specific to
+the machine they were recorded on; record them with --save-baseline before
+and compare after a change.
+
+Usage:
+    python benchmarks/suite.py [--only dashboard] [--full] [--threshold 0.25]
+    python benchmarks/suite.py --save-baseline
+"""
+import argparse
+import fnmatch
+import io
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# Nothing here may reach the network or write to the app's caches
+os.environ.setdefault("LLM_CACHE_ENABLED", "false")
+os.environ.setdefault("EXTRACTION_CACHE_ENABLED", "false")
+
+from loguru import logger  # noqa: E402
+
+import utils.extraction as extraction  # noqa: E402
+from bench_extraction import make_pdf  # noqa: E402
+from bench_prompts import PAIRS, _document  # noqa: E402
+from OPENAI import (  # noqa: E402
+    analyze_risks_detailed,
+    analyze_risks_initial,
+    format_output_with_highlights,
+    get_risk_prompt_iteration_0,
+    get_risk_prompt_iteration_1,
+)
+from utils.dashboard import RiskDashboard  # noqa: E402
+from utils.risk_store import insert_risks  # noqa: E402
+
+FIXTURES = os.path.join(ROOT, "benchmarks", "fixtures")
+BASELINES = os.path.join(ROOT, "benchmarks", "baselines.json")
+
+TXT_CHARS = [10_000, 500_000, 4_000_000]  # below EXTRACT_MAX_CHARS, so nothing is cut off
+DOCX_PARAGRAPHS = [100, 1_000, 10_000]
+PDF_PAGES = [5, 50, 200]
+PROMPT_CHARS = [2_000, 20_000, 200_000]
+DASHBOARD_ROWS = [1_000, 10_000, 100_000]
+DASHBOARD_ROWS_FULL = DASHBOARD_ROWS + [1_000_000]
+
+_cases = []
+
+
+def case(group, name):
+    """Registers `setup()`, which prepares the inputs and returns the zero-argument callable to time."""
+    def register(setup):
+        _cases.append((group, name, setup))
+        return setup
+    return register
+
+
+def measure(fn, repeat=5, min_sample=0.05):
+    """Median seconds per call over `repeat` samples, each looping until it lasts at least `min_sample` s."""
+    start = time.perf_counter()
+    fn()  # warm-up, also sizes the loop
+    single = time.perf_counter() - start
+    loops = max(1, int(min_sample / single)) if single > 0 else 1000
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        samples.append((time.perf_counter() - start) / loops)
+    return statistics.median(samples)
+
+
+def _load_fixture(name):
+    with open(os.path.join(FIXTURES, name), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _make_docx(paragraphs):
+    import docx
+
+    document = docx.Document()
+    sentence = "The borrower faces fiscal pressure and delayed counterpart funding for the rural roads component. "
+    for i in range(paragraphs):
+        document.add_paragraph(f"{i + 1}. " + sentence * 3)
+    out = io.BytesIO()
+    document.save(out)
+    return out.getvalue()
+
+
+# --- extraction ---
+
+def _extraction_case(filename, data):
+    def run():
+        extraction.extract_document(data, filename, engine="pypdf2")
+    return run
+
+
+for _chars in TXT_CHARS:
+    case("extract", f"txt[{_chars} chars]")(
+        lambda chars=_chars: _extraction_case("bench.txt", _document(chars).encode("utf-8")))
+for _paragraphs in DOCX_PARAGRAPHS:
+    case("extract", f"docx[{_paragraphs} paragraphs]")(
+        lambda paragraphs=_paragraphs: _extraction_case("bench.docx", _make_docx(paragraphs)))
+for _pages in PDF_PAGES:
+    case("extract", f"pdf[{_pages} pages]")(
+        lambda pages=_pages: _extraction_case("bench.pdf", make_pdf(pages)))
+
+
+# --- prompt construction ---
+
+for _chars in PROMPT_CHARS:
+    case("prompt", f"iteration_0[{_chars} chars]")(
+        lambda chars=_chars: (lambda document=_document(chars): get_risk_prompt_iteration_0(document)))
+    case("prompt", f"iteration_1 all risks[{_chars} chars]")(
+        lambda chars=_chars: (lambda document=_document(chars): [get_risk_prompt_iteration_1(document, *p) for p in PAIRS]))
+
+
+# --- response parsing and formatting ---
+
+@case("parse", "analyze_risks_initial")
+def _parse_initial():
+    response = _load_fixture("initial_response.json")
+    return lambda: analyze_risks_initial(response)
+
+
+@case("parse", "analyze_risks_detailed")
+def _parse_detailed():
+    response = _load_fixture("detailed_response.json")
+    return lambda: analyze_risks_detailed(response)
+
+
+@case("format", "output1 (risk list)")
+def _format_list():
+    analyses, _ = analyze_risks_initial(_load_fixture("initial_response.json"))
+    output = [(a["index"], a["description"]) for a in analyses]
+    return lambda: format_output_with_highlights(output, "output1")
+
+
+@case("format", "output2 (analyses)")
+def _format_analyses():
+    analyses, _ = analyze_risks_initial(_load_fixture("initial_response.json"))
+    return lambda: format_output_with_highlights(analyses, "output2")
+
+
+@case("format", "output3+4 (KRIs, controls)")
+def _format_kris():
+    detailed = analyze_risks_detailed(_load_fixture("detailed_response.json"))
+    return lambda: (format_output_with_highlights(detailed, "output3"), format_output_with_highlights(detailed, "output4"))
+
+
+@case("format", "output5 (one analysis)")
+def _format_one():
+    analyses, _ = analyze_risks_initial(_load_fixture("initial_response.json"))
+    return lambda: [format_output_with_highlights(a, "output5") for a in analyses]
+
+
+# --- dashboard aggregation ---
+
+_dashboards = {}
+
+
+def _dashboard(rows, workdir):
+    """A risk database of `rows` synthetic risks (seeded, so every run builds the same one)."""
+    if rows in _dashboards:
+        return _dashboards[rows]
+    rng = random.Random(rows)
+    levels = ["Low", "Medium", "High"]
+    names = [f"{l0} - {l1}" for l0, l1 in PAIRS]
+    files = [f"operation_{i:04d}.pdf" for i in range(max(10, rows // 50))]
+    dashboard = RiskDashboard(os.path.join(workdir, f"risks_{rows}.db"))
+    start = time.perf_counter()
+    with dashboard.db.connection() as conn:
+        for offset in range(0, rows, 10_000):
+            insert_risks(conn, [{
+                "analysis_type": "Initial",
+                "file_id": i,
+                "file_name": rng.choice(files),
+                "description": "Synthetic risk for benchmarking.",
+                "risk_name": rng.choice(names),
+                "likelihood": rng.choice(levels),
+                "impact": f"Financial Loss: {rng.choice(levels)}, Reputational Damage: {rng.choice(levels)}",
+                "access_level": rng.choice(("user", "group")),
+            } for i in range(offset, min(offset + 10_000, rows))])
+    print(f"  (built a {rows}-risk database in {time.perf_counter() - start:.1f}s)", file=sys.stderr)
+    _dashboards[rows] = dashboard
+    return dashboard
+
+
+def _dashboard_cases(rows_list, workdir):
+    for rows in rows_list:
+        def aggregates(rows=rows):
+            dashboard = _dashboard(rows, workdir)
+
+            def run():
+                dashboard._cache.clear()  # what a request sees after the data changed
+                dashboard.data("all")
+            return run
+
+        def table(rows=rows):
+            dashboard = _dashboard(rows, workdir)
+            return lambda: dashboard.table("all", sort="impact", descending=True)
+
+        def rebuild(rows=rows):
+            return _dashboard(rows, workdir).rebuild
+        case("dashboard", f"data[all, {rows} risks]")(aggregates)
+        case("dashboard", f"table page[{rows} risks]")(table)
+        case("dashboard", f"rebuild[{rows} risks]")(rebuild)
+
+
+def load_baselines(path=BASELINES):
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)["results"]
+
+
+def save_baselines(results, path=BASELINES):
+    merged = load_baselines(path)
+    merged.update(results)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"python": sys.version.split()[0], "results": dict(sorted(merged.items()))}, f, indent=2)
+        f.write("\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--only", action="append", help="glob on 'group/name', may repeat (e.g. 'dashboard/*')")
+    parser.add_argument("--full", action="store_true", help="include the 1M-risk dashboard database")
+    parser.add_argument("--repeat", type=int, default=5, help="samples per case (the median is reported)")
+    parser.add_argument("--threshold", type=float, default=0.25, help="flag cases slower than baseline by this fraction")
+    parser.add_argument("--save-baseline", action="store_true", help="record these results as the new baseline")
+    parser.add_argument("--baseline", default=BASELINES, help="baseline file (default: benchmarks/baselines.json)")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args(argv)
+
+    logger.remove()
+    logger.add(sys.stderr, level="WARNING")
+    extraction.EXTRACT_PROCESSES = 1  # the process pool's scheduling noise is not what this measures
+    baselines = load_baselines(args.baseline)
+
+    results, regressions = {}, []
+    with tempfile.TemporaryDirectory() as workdir:
+        _dashboard_cases(DASHBOARD_ROWS_FULL if args.full else DASHBOARD_ROWS, workdir)
+        print(f"{'case':<48} {'median':>12} {'baseline':>12} {'change':>8}")
+        for group, name, setup in _cases:
+            key = f"{group}/{name}"
+            if args.only and not any(fnmatch.fnmatch(key, pattern) for pattern in args.only):
+                continue
+            seconds = measure(setup(), repeat=args.repeat)
+            results[key] = seconds
+            baseline = baselines.get(key)
+            change = f"{seconds / baseline - 1:+.0%}" if baseline else "new"
+            flag = ""
+            if baseline and seconds > baseline * (1 + args.threshold):
+                regressions.append(key)
+                flag = "  REGRESSION"
+            print(f"{key:<48} {_format_seconds(seconds):>12} "
+                  f"{_format_seconds(baseline) if baseline else '-':>12} {change:>8}{flag}")
+        for dashboard in _dashboards.values():
+            dashboard.db.close()
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if args.save_baseline:
+        save_baselines(results, args.baseline)
+        print(f"\nBaseline saved to {args.baseline}")
+    elif regressions:
+        print(f"\n{len(regressions)} regression(s) over {args.threshold:.0%}: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+def _format_seconds(seconds):
+    if seconds >= 1:
+        return f"{seconds:.2f} s"
+    if seconds >= 1e-3:
+        return f"{seconds * 1e3:.2f} ms"
+    return f"{seconds * 1e6:.1f} us"
+
+
+if __name__ == "__main__":
+    sys.exit(main())
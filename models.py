@@ -5,14 +5,33 @@ from werkzeug.security import generate_password_hash, check_password_hash
 
 db = SQLAlchemy()
 
+class AnalysisBlob(db.Model):
+    """Analysis payloads stored once per distinct content, see utils/analysis_records.py."""
+    __tablename__ = 'analysis_blob'
+    hash = db.Column(db.String(64), primary_key=True)       # sha256 of the serialized JSON
+    data = db.Column(db.LargeBinary, nullable=False)         # zlib-compressed JSON
+    size = db.Column(db.Integer, nullable=False)             # uncompressed bytes
+
 class AnalysisRecord(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    content_json = db.Column(db.JSON, nullable=False)
+    content_json = db.Column(db.JSON)                         # legacy inline payload, NULL once in analysis_blob
+    content_hash = db.Column(db.String(64), db.ForeignKey('analysis_blob.hash'))
     analysis_type = db.Column(db.String(50), nullable=False)  # "initial" or "detailed"
-    ownership = db.Column(db.String(10), nullable=False)      # "personal" or "shared"
+    ownership = db.Column(db.String(120), nullable=False)     # "shared" or the owner's user email
     risk_name = db.Column(db.String(200), nullable=False)
     filename = db.Column(db.String(200), nullable=False)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    idempotency_key = db.Column(db.String(64))                # drops repeated saves of the same record
+
+    # History listings filter on one column and page newest first by (timestamp, id)
+    __table_args__ = (
+        db.Index("ix_analysis_record_idempotency_key", "idempotency_key", unique=True),
+        db.Index("ix_analysis_record_timestamp", "timestamp", "id"),
+        db.Index("ix_analysis_record_ownership_timestamp", "ownership", "timestamp", "id"),
+        db.Index("ix_analysis_record_risk_name_timestamp", "risk_name", "timestamp", "id"),
+        db.Index("ix_analysis_record_filename_timestamp", "filename", "timestamp", "id"),
+        db.Index("ix_analysis_record_content_hash", "content_hash"),
+    )
 
 class User(db.Model):
     __tablename__ = 'user'
@@ -27,3 +46,46 @@ class User(db.Model):
 
     def check_password(self, password: str) -> bool:
         return check_password_hash(self.password_hash, password)
+
+
+def upgrade_schema():
+    """
+    Brings an `analysis_record` table created by an older version up to the model (`create_all` only adds tables).
+
+    SQLite cannot drop a NOT NULL constraint or add a foreign key in
+    place, so an outdated table is rebuilt: renamed, recreated from the
+    model and copied over in one transaction.
+    """
+    table = AnalysisRecord.__table__
+
+    def outdated(bind):
+        columns = {c["name"]: c for c in db.inspect(bind).get_columns(table.name)}
+        if not set(table.columns.keys()) <= set(columns):
+            return True, columns
+        # ownership widened from String(10) when it started holding user emails
+        ownership_length = getattr(columns["ownership"]["type"], "length", None)
+        widened = ownership_length is None or ownership_length >= table.c.ownership.type.length
+        return not (columns["content_json"]["nullable"] and widened), columns
+
+    if outdated(db.engine)[0]:
+        # Several workers may start at once: the first takes the write lock and rebuilds, the others
+        # wait on it and find the table up to date when they re-check under the lock
+        with db.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.exec_driver_sql("BEGIN IMMEDIATE")
+            try:
+                still_outdated, columns = outdated(conn)
+                if still_outdated:
+                    shared = ", ".join(c for c in table.columns.keys() if c in columns)
+                    old_indexes = [index["name"] for index in db.inspect(conn).get_indexes(table.name)]
+                    conn.execute(db.text(f"ALTER TABLE {table.name} RENAME TO {table.name}_old"))
+                    for name in old_indexes:
+                        conn.execute(db.text(f'DROP INDEX IF EXISTS "{name}"'))
+                    table.create(conn)
+                    conn.execute(db.text(f"INSERT INTO {table.name} ({shared}) SELECT {shared} FROM {table.name}_old"))
+                    conn.execute(db.text(f"DROP TABLE {table.name}_old"))
+                conn.exec_driver_sql("COMMIT")
+            except Exception:
+                conn.exec_driver_sql("ROLLBACK")
+                raise
+    for index in table.indexes:
+        index.create(db.engine, checkfirst=True)
@@ -1,7 +1,10 @@
 import { formatOutputWithHighlights } from './formatOutputWithHighlights.js';
 
-export function renderDetailedResult() {
-  const container = document.getElementById("detailed-result-container");
+export function renderDetailedResult(root) {
+  // Several detailed results can be on the page at once, so look inside `root` when given
+  const container = root
+    ? root.querySelector("#detailed-result-container")
+    : document.getElementById("detailed-result-container");
   if (!container) return;
 
   const rawJson = container.dataset.json;
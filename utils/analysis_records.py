@@ -0,0 +1,214 @@
+import base64
+import hashlib
+import json
+import os
+import zlib
+from datetime import datetime
+
+from loguru import logger
+from sqlalchemy import bindparam, null, update
+from sqlalchemy.dialects.sqlite import insert
+
+from models import AnalysisBlob, AnalysisRecord, db
+
+ANALYSIS_FIELDS = ("content_json", "analysis_type", "ownership", "risk_name", "filename")
+ANALYSIS_BULK_MAX = int(os.environ.get("ANALYSIS_BULK_MAX", 500))
+ANALYSIS_PAGE_SIZE = int(os.environ.get("ANALYSIS_PAGE_SIZE", 50))
+ANALYSIS_PAGE_MAX = int(os.environ.get("ANALYSIS_PAGE_MAX", 500))
+ANALYSIS_FILTERS = ("ownership", "risk_name", "filename", "analysis_type")
+ANALYSIS_BLOB_LEVEL = int(os.environ.get("ANALYSIS_BLOB_LEVEL", 9))
+
+
+def record_key(record):
+    """Default idempotency key: a hash of the record's fields, so saving the same analysis twice is a no-op."""
+    canonical = json.dumps({f: record[f] for f in ANALYSIS_FIELDS}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def encode_content(content):
+    """Serializes an analysis payload into an `analysis_blob` row: its content hash, zlib data and raw size."""
+    raw = json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return {"hash": hashlib.sha256(raw).hexdigest(), "data": zlib.compress(raw, ANALYSIS_BLOB_LEVEL), "size": len(raw)}
+
+
+def store_blobs(blobs):
+    """Inserts `encode_content` rows, keeping the existing row for content already stored. Does not commit."""
+    if blobs:
+        db.session.execute(insert(AnalysisBlob.__table__).on_conflict_do_nothing(index_elements=["hash"]),
+                           list({blob["hash"]: blob for blob in blobs}.values()))
+
+
+def load_contents(hashes):
+    """Decoded payloads of the given content hashes, as {hash: content}."""
+    hashes = list(set(hashes) - {None})
+    if not hashes:
+        return {}
+    rows = db.session.query(AnalysisBlob.hash, AnalysisBlob.data).filter(AnalysisBlob.hash.in_(hashes))
+    return {h: json.loads(zlib.decompress(data)) for h, data in rows}
+
+
+def record_content(record):
+    """The payload of an `AnalysisRecord`, whether stored inline (not yet backfilled) or as a blob."""
+    if record.content_hash is None:
+        return record.content_json
+    return load_contents([record.content_hash]).get(record.content_hash)
+
+
+def save_records(records):
+    """
+    Saves analysis records in one transaction, skipping those already saved.
+
+    Args:
+        records: Dicts with the `ANALYSIS_FIELDS` and an optional
+            `idempotency_key` (derived from the content when missing).
+
+    Returns:
+        {"saved": n, "duplicates": n}
+
+    Raises:
+        ValueError: When a record is incomplete or the batch is too large.
+    """
+    if not isinstance(records, list) or not records:
+        raise ValueError("Expected a non-empty list of records")
+    if len(records) > ANALYSIS_BULK_MAX:
+        raise ValueError(f"At most {ANALYSIS_BULK_MAX} records per request")
+
+    rows = {}
+    for i, record in enumerate(records):
+        if not isinstance(record, dict):
+            raise ValueError(f"Record {i} is not an object")
+        missing = [f for f in ANALYSIS_FIELDS if record.get(f) in (None, "")]
+        if missing:
+            raise ValueError(f"Record {i} is missing {', '.join(missing)}")
+        key = str(record.get("idempotency_key") or record_key(record))
+        if len(key) > 64:
+            raise ValueError(f"Record {i} has an idempotency_key longer than 64 characters")
+        # Repeats within the request count as duplicates too
+        rows.setdefault(key, {**{f: record[f] for f in ANALYSIS_FIELDS}, "idempotency_key": key})
+
+    existing = {key for (key,) in db.session.query(AnalysisRecord.idempotency_key)
+                .filter(AnalysisRecord.idempotency_key.in_(list(rows)))}
+    new_rows = [row for key, row in rows.items() if key not in existing]
+    saved = 0
+    if new_rows:
+        now = datetime.utcnow()
+        # Payloads go to analysis_blob once per distinct content; records only reference them
+        blobs = [encode_content(row.pop("content_json")) for row in new_rows]
+        store_blobs(blobs)
+        # DO NOTHING covers a concurrent request saving the same keys between the check and the insert
+        result = db.session.execute(
+            insert(AnalysisRecord.__table__).on_conflict_do_nothing(index_elements=["idempotency_key"]),
+            [{**row, "content_hash": blob["hash"], "timestamp": now} for row, blob in zip(new_rows, blobs)])
+        saved = max(result.rowcount, 0)
+    db.session.commit()
+    return {"saved": saved, "duplicates": len(records) - saved}
+
+
+def query_records(visible_ownerships, filters=None, after=None, limit=ANALYSIS_PAGE_SIZE, include_content=False):
+    """
+    One page of saved analyses, newest first.
+
+    Args:
+        visible_ownerships: Ownership values the caller may read ("shared" and their own email).
+        filters: Exact-match values for `ANALYSIS_FILTERS` columns.
+        after: The `next` cursor of the previous page.
+        limit: Rows per page, capped at `ANALYSIS_PAGE_MAX`.
+        include_content: Whether to return each record's `content_json`.
+
+    Returns:
+        {"records": [...], "next": cursor or None}
+
+    Raises:
+        ValueError: On an unknown filter or a malformed cursor.
+    """
+    limit = max(1, min(int(limit), ANALYSIS_PAGE_MAX))
+    query = AnalysisRecord.query.filter(AnalysisRecord.ownership.in_(list(visible_ownerships)))
+    for name, value in (filters or {}).items():
+        if name not in ANALYSIS_FILTERS:
+            raise ValueError(f"Unknown filter: {name}")
+        query = query.filter(getattr(AnalysisRecord, name) == value)
+    if after:
+        try:
+            timestamp, last_id = json.loads(base64.urlsafe_b64decode(after.encode()))
+            timestamp, last_id = datetime.fromisoformat(timestamp), int(last_id)
+        except (ValueError, TypeError) as e:
+            raise ValueError("Malformed page cursor") from e
+        query = query.filter(db.tuple_(AnalysisRecord.timestamp, AnalysisRecord.id) < (timestamp, last_id))
+
+    columns = [AnalysisRecord.id, AnalysisRecord.timestamp] + \
+        [getattr(AnalysisRecord, f) for f in ANALYSIS_FIELDS if f != "content_json"]
+    if include_content:
+        columns += [AnalysisRecord.content_json, AnalysisRecord.content_hash]
+    rows = query.with_entities(*columns) \
+        .order_by(AnalysisRecord.timestamp.desc(), AnalysisRecord.id.desc()).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = base64.urlsafe_b64encode(json.dumps([last.timestamp.isoformat(), last.id]).encode()).decode()
+    # Only the page's payloads are decompressed, and only when asked for
+    contents = load_contents(row.content_hash for row in rows) if include_content else {}
+    records = []
+    for row in rows:
+        record = row._asdict()
+        record["timestamp"] = row.timestamp.isoformat() if row.timestamp else None
+        if include_content:
+            content_hash = record.pop("content_hash")
+            if content_hash is not None:
+                record["content_json"] = contents.get(content_hash)
+        records.append(record)
+    return {"records": records, "next": next_cursor}
+
+
+def backfill_blobs(batch_size=500):
+    """
+    Moves inline `content_json` payloads of older records into `analysis_blob`.
+
+    Works in batches of `batch_size` records, each committed on its own,
+    so it can be interrupted and rerun.
+
+    Returns:
+        The number of records moved.
+    """
+    moved = 0
+    while True:
+        rows = db.session.query(AnalysisRecord.id, AnalysisRecord.content_json) \
+            .filter(AnalysisRecord.content_hash.is_(None), AnalysisRecord.content_json.isnot(None)) \
+            .order_by(AnalysisRecord.id).limit(batch_size).all()
+        if not rows:
+            break
+        blobs = [encode_content(content) for _, content in rows]
+        store_blobs(blobs)
+        db.session.execute(
+            update(AnalysisRecord.__table__).where(AnalysisRecord.__table__.c.id == bindparam("record_id"))
+            .values(content_hash=bindparam("blob_hash"), content_json=null()),
+            [{"record_id": record_id, "blob_hash": blob["hash"]} for (record_id, _), blob in zip(rows, blobs)])
+        db.session.commit()
+        moved += len(rows)
+        logger.info(f"Moved {moved} analysis payloads into analysis_blob")
+    return moved
+
+
+def storage_report():
+    """Payload bytes as saved (inline JSON or one uncompressed copy per record) against what is stored now."""
+    records = db.session.query(db.func.count(AnalysisRecord.id)).scalar()
+    logical = db.session.query(db.func.coalesce(db.func.sum(AnalysisBlob.size), 0)) \
+        .join(AnalysisRecord, AnalysisRecord.content_hash == AnalysisBlob.hash).scalar()
+    inline = db.session.query(db.func.coalesce(db.func.sum(db.func.length(AnalysisRecord.content_json)), 0)) \
+        .filter(AnalysisRecord.content_hash.is_(None)).scalar()
+    blobs, blob_raw, blob_stored = db.session.query(
+        db.func.count(AnalysisBlob.hash), db.func.coalesce(db.func.sum(AnalysisBlob.size), 0),
+        db.func.coalesce(db.func.sum(db.func.length(AnalysisBlob.data)), 0)).one()
+    before, after = logical + inline, blob_stored + inline
+    return {
+        "records": records,
+        "inline_records": db.session.query(db.func.count(AnalysisRecord.id))
+        .filter(AnalysisRecord.content_hash.is_(None)).scalar(),
+        "blobs": blobs,
+        "payload_bytes": before,
+        "deduplicated_bytes": blob_raw + inline,
+        "stored_bytes": after,
+        "saved_bytes": before - after,
+        "saved_ratio": round(1 - after / before, 4) if before else None,
+    }
@@ -0,0 +1,186 @@
+import os
+import re
+
+from utils.tokens import count_tokens
+
+CHUNK_TOKEN_BUDGET = int(os.environ.get("CHUNK_TOKEN_BUDGET", 12000))
+CHUNK_OVERLAP_TOKENS = int(os.environ.get("CHUNK_OVERLAP_TOKENS", 200))
+
+LEVEL_SCORES = {"low": 1, "medium": 2, "high": 3}
+
+# Form feeds separate pages in extracted PDF text; blank lines and numbered
+# headings ("3.", "3.2", "Section 4", "ANNEX II") separate sections.
+_PAGE_BREAK = re.compile(r"\f")
+_SECTION_BREAK = re.compile(
+    r"\n\s*\n|\n(?=\s*(?:\d+(?:\.\d+)*\.?\s+[A-Z]|(?:Section|SECTION|Chapter|CHAPTER|Annex|ANNEX|Appendix|APPENDIX)\b))"
+)
+_SENTENCE_BREAK = re.compile(r"(?<=[.!?;])\s+")
+
+
+def estimate_tokens(text) -> int:
+    return count_tokens(text)
+
+
+def _split(text, budget, separators, tokens=None):
+    # Returns (piece, tokens) pairs, so no piece is tokenized twice
+    tokens = estimate_tokens(text) if tokens is None else tokens
+    if tokens <= budget:
+        return [(text, tokens)]
+    if not separators:
+        step = budget * 4
+        return [(piece, estimate_tokens(piece)) for piece in (text[i:i + step] for i in range(0, len(text), step))]
+    pieces = [p for p in separators[0].split(text) if p and p.strip()]
+    if len(pieces) == 1:
+        return _split(text, budget, separators[1:], tokens)
+    out = []
+    for piece in pieces:
+        out.extend(_split(piece, budget, separators[1:]))
+    return out
+
+
+def split_document(text, token_budget=CHUNK_TOKEN_BUDGET, overlap_tokens=CHUNK_OVERLAP_TOKENS):
+    """
+    Splits a document into chunks of at most `token_budget` tokens.
+
+    Pages are preferred as boundaries, then sections, then sentences; a hard
+    character split is the last resort. Consecutive pieces are packed
+    together up to the budget, and each chunk starts with the tail of the
+    previous one so a risk described across a boundary is not lost.
+
+    Args:
+        text: Full document text.
+        token_budget: Maximum estimated tokens per chunk (document only, excluding the prompt).
+        overlap_tokens: Estimated tokens repeated from the end of the previous chunk.
+
+    Returns:
+        List of chunk strings, in document order.
+    """
+    pieces = _split(text, token_budget - overlap_tokens, [_PAGE_BREAK, _SECTION_BREAK, _SENTENCE_BREAK])
+
+    chunks = []
+    current = []
+    current_tokens = 0
+    for piece, tokens in pieces:
+        if current and current_tokens + tokens > token_budget - overlap_tokens:
+            chunks.append("\n\n".join(current))
+            current, current_tokens = [], 0
+        current.append(piece)
+        current_tokens += tokens
+    if current:
+        chunks.append("\n\n".join(current))
+
+    if overlap_tokens and len(chunks) > 1:
+        tail_chars = overlap_tokens * 4
+        chunks = [chunks[0]] + [
+            chunks[i - 1][-tail_chars:] + "\n\n" + chunks[i] for i in range(1, len(chunks))
+        ]
+    return chunks
+
+
+def level_score(value):
+    """Maps "High"/"Medium"/"Low" (case-insensitive, possibly with trailing text) to 3/2/1, else 0."""
+    match = re.match(r"\s*(high|medium|low)\b", str(value), flags=re.IGNORECASE)
+    return LEVEL_SCORES[match.group(1).lower()] if match else 0
+
+
+def _risk_key(risk):
+    data = next(iter(risk.values()))
+    tier_1 = next(iter(data["description"]))
+    tier_2 = next(iter(data["description"][tier_1]))
+    return tier_1.strip(), tier_2.strip()
+
+
+_LIST_FIELDS = ("triggering_root_cause_events", "triggering_intermediate_events", "consequences", "interdependencies")
+
+
+def _mergeable(data):
+    """True when `data` has the shape `_merge_pair` and the priority sort rely on."""
+    if not isinstance(data, dict):
+        return False
+    analysis = data.get("analysis", {})
+    if not isinstance(analysis, dict) or not isinstance(analysis.get("impact", {}), dict):
+        return False
+    return all(isinstance(analysis.get(field) or [], list) for field in _LIST_FIELDS) and all(
+        isinstance(data.get(field) or [], list) for field in ("key_risk_indicators", "internal_controls"))
+
+
+def _union(*lists, key=lambda x: x):
+    seen, out = set(), []
+    for items in lists:
+        for item in items or []:
+            k = key(item)
+            k = k if isinstance(k, str) else repr(k)
+            if k not in seen:
+                seen.add(k)
+                out.append(item)
+    return out
+
+
+def _merge_pair(primary, other):
+    pa, oa = primary.setdefault("analysis", {}), other.get("analysis", {})
+
+    impact = dict(pa.get("impact", {}))
+    for category, value in oa.get("impact", {}).items():
+        if level_score(value) > level_score(impact.get(category)):
+            impact[category] = value
+    pa["impact"] = impact
+
+    if level_score(oa.get("likelihood")) > level_score(pa.get("likelihood")):
+        pa["likelihood"] = oa["likelihood"]
+
+    for field in _LIST_FIELDS:
+        pa[field] = _union(pa.get(field), oa.get(field))
+
+    primary["key_risk_indicators"] = _union(
+        primary.get("key_risk_indicators"), other.get("key_risk_indicators"),
+        key=lambda k: k.get("indicator", "").lower() if isinstance(k, dict) else k)
+    primary["internal_controls"] = _union(
+        primary.get("internal_controls"), other.get("internal_controls"),
+        key=lambda c: c.get("control", "").lower() if isinstance(c, dict) else c)
+
+
+def merge_identified_risks(responses):
+    """
+    Reduces several iteration-0 responses into one.
+
+    Risks are deduplicated by their (tier-1, tier-2) taxonomy key. For each
+    key the highest likelihood and the highest level per impact category
+    are kept, and events, KRIs and controls are unioned. Risks that do not
+    follow the expected shape are passed through unchanged.
+
+    Args:
+        responses: Parsed `call_gpt4o` responses, in chunk order.
+
+    Returns:
+        A response dict in the iteration-0 format, suitable for `analyze_risks_initial`.
+    """
+    merged = {}
+    passthrough = []
+    for response in responses:
+        risks = (response or {}).get("risk_assessment", {}).get("identified_risks", [])
+        for risk in risks:
+            try:
+                key = _risk_key(risk)
+                data = next(iter(risk.values()))
+            except (AttributeError, KeyError, StopIteration, TypeError):
+                passthrough.append(risk)
+                continue
+            if not _mergeable(data):
+                passthrough.append(risk)
+                continue
+            if key not in merged:
+                merged[key] = data
+            else:
+                _merge_pair(merged[key], data)
+
+    identified = [{f"risk_{i}": data} for i, data in enumerate(merged.values(), 1)]
+    identified.sort(key=lambda r: (
+        -level_score(r[next(iter(r))].get("analysis", {}).get("likelihood")),
+        -sum(level_score(v) for v in r[next(iter(r))].get("analysis", {}).get("impact", {}).values()),
+    ))
+    return {
+        "risk_assessment": {
+            "identified_risks": identified + passthrough,
+            "risk_prioritization": [],
+        }
+    }
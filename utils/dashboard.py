@@ -0,0 +1,335 @@
+import base64
+import json
+import os
+
+from loguru import logger
+
+from utils.risk_store import RISKS_DB_PATH, risk_database, score_pending
+
+LEVELS = ("user", "group")
+
+TABLE_PAGE_SIZE = int(os.environ.get("TABLE_PAGE_SIZE", 50))
+TABLE_PAGE_MAX = int(os.environ.get("TABLE_PAGE_MAX", 500))
+
+# Sortable table columns -> the indexed column they sort by
+TABLE_SORTS = {
+    "id": "id",
+    "file_name": "file_name",
+    "risk_name": "risk_name",
+    "likelihood": "likelihood_score",
+    "impact": "impact_score",
+    "access_level": "access_level",
+}
+TABLE_FIELDS = (
+    "id", "file_name", "risk_name", "likelihood", "impact", "access_level",
+    "likelihood_score", "impact_score", "analysis_type", "description",
+)
+TABLE_DEFAULT_FIELDS = ("id", "file_name", "risk_name", "likelihood", "impact", "access_level")
+
+
+def _apply(row, sign):
+    """Trigger statements adding (sign=1) or removing (sign=-1) one risk row from the aggregates."""
+    impact = f"{row}.impact_score"
+    likelihood = f"{row}.likelihood_score"
+    level = f"COALESCE({row}.access_level, '')"
+    return f"""
+        INSERT INTO risk_dashboard_type_counts (access_level, risk_name, n)
+        SELECT {level}, {row}.risk_name, {sign} WHERE {row}.risk_name IS NOT NULL
+        ON CONFLICT (access_level, risk_name) DO UPDATE SET n = n + excluded.n;
+
+        INSERT INTO risk_dashboard_file_scores (access_level, file_name, impact_sum, impact_n, likelihood_sum, likelihood_n)
+        SELECT {level}, {row}.file_name,
+               {sign} * COALESCE({impact}, 0), {sign} * ({impact} IS NOT NULL),
+               {sign} * COALESCE({likelihood}, 0), {sign} * ({likelihood} IS NOT NULL)
+        WHERE {row}.file_name IS NOT NULL
+        ON CONFLICT (access_level, file_name) DO UPDATE SET
+            impact_sum = impact_sum + excluded.impact_sum, impact_n = impact_n + excluded.impact_n,
+            likelihood_sum = likelihood_sum + excluded.likelihood_sum, likelihood_n = likelihood_n + excluded.likelihood_n;
+
+        INSERT INTO risk_dashboard_file_risks (risk_name, file_name, n)
+        SELECT {row}.risk_name, {row}.file_name, {sign} WHERE {row}.risk_name IS NOT NULL AND {row}.file_name IS NOT NULL
+        ON CONFLICT (risk_name, file_name) DO UPDATE SET n = n + excluded.n;
+    """
+
+
+def _drop_empty(row):
+    """Trigger statements deleting the aggregate rows `row` was counted in once they are empty."""
+    level = f"COALESCE({row}.access_level, '')"
+    return f"""
+        DELETE FROM risk_dashboard_type_counts
+        WHERE access_level = {level} AND risk_name = {row}.risk_name AND n <= 0;
+        DELETE FROM risk_dashboard_file_scores
+        WHERE access_level = {level} AND file_name = {row}.file_name AND impact_n <= 0 AND likelihood_n <= 0;
+        DELETE FROM risk_dashboard_file_risks
+        WHERE risk_name = {row}.risk_name AND file_name = {row}.file_name AND n <= 0;
+    """
+
+
+_BUMP_VERSION = """
+        UPDATE risk_dashboard_version SET version = version + 1, updated_at = (julianday('now') - 2440587.5) * 86400.0;
+"""
+
+
+class RiskDashboard:
+    """
+    Serves the risk overview aggregates from tables maintained on write.
+
+    Triggers on `risk` keep three aggregate tables current on every insert,
+    update and delete, whichever process or tool writes the rows:
+    risk-type counts per access level, per-file impact / likelihood sums per
+    access level, and (risk, file) pairs for the distinct-files count. The
+    "all" level is the sum over access levels. Reading the dashboard is a few
+    small indexed queries, independent of the size of `risk`.
+
+    Computed results are cached per level in the process and dropped when the
+    version row, bumped by the same triggers, changes.
+    """
+
+    def __init__(self, path=RISKS_DB_PATH):
+        self.path = path
+        self._cache = {}
+        self.db = risk_database(path)
+        self.db.add_schema(self._setup)
+
+    def _setup(self, conn):
+        fresh = not conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'risk_dashboard_insert'").fetchone()
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(risk_dashboard_version)")}
+        if columns and "updated_at" not in columns:
+            conn.execute("ALTER TABLE risk_dashboard_version ADD COLUMN updated_at REAL NOT NULL DEFAULT 0")
+            conn.commit()
+        conn.executescript(f"""
+            BEGIN IMMEDIATE;
+            CREATE TABLE IF NOT EXISTS risk_dashboard_type_counts (
+                access_level TEXT NOT NULL,
+                risk_name TEXT NOT NULL,
+                n INTEGER NOT NULL,
+                PRIMARY KEY (access_level, risk_name)
+            );
+            CREATE TABLE IF NOT EXISTS risk_dashboard_file_scores (
+                access_level TEXT NOT NULL,
+                file_name TEXT NOT NULL,
+                impact_sum REAL NOT NULL,
+                impact_n INTEGER NOT NULL,
+                likelihood_sum REAL NOT NULL,
+                likelihood_n INTEGER NOT NULL,
+                PRIMARY KEY (access_level, file_name)
+            );
+            CREATE TABLE IF NOT EXISTS risk_dashboard_file_risks (
+                risk_name TEXT NOT NULL,
+                file_name TEXT NOT NULL,
+                n INTEGER NOT NULL,
+                PRIMARY KEY (risk_name, file_name)
+            );
+            CREATE TABLE IF NOT EXISTS risk_dashboard_version (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                version INTEGER NOT NULL,
+                updated_at REAL NOT NULL DEFAULT 0
+            );
+            INSERT OR IGNORE INTO risk_dashboard_version (id, version) VALUES (1, 0);
+
+            -- Maintained on the legacy Risks table before it was normalized into `risk`
+            DROP TRIGGER IF EXISTS risks_dashboard_insert;
+            DROP TRIGGER IF EXISTS risks_dashboard_delete;
+            DROP TRIGGER IF EXISTS risks_dashboard_update;
+
+            -- Recreated on every start, in this transaction, so their definitions follow this module
+            DROP TRIGGER IF EXISTS risk_dashboard_insert;
+            DROP TRIGGER IF EXISTS risk_dashboard_delete;
+            DROP TRIGGER IF EXISTS risk_dashboard_update;
+
+            CREATE TRIGGER IF NOT EXISTS risk_dashboard_insert AFTER INSERT ON risk BEGIN
+                {_apply("NEW", 1)}
+                {_BUMP_VERSION}
+            END;
+            CREATE TRIGGER IF NOT EXISTS risk_dashboard_delete AFTER DELETE ON risk BEGIN
+                {_apply("OLD", -1)}
+                {_drop_empty("OLD")}
+                {_BUMP_VERSION}
+            END;
+            CREATE TRIGGER IF NOT EXISTS risk_dashboard_update
+            AFTER UPDATE OF risk_name, file_name, access_level, likelihood_score, impact_score ON risk BEGIN
+                {_apply("OLD", -1)}
+                {_drop_empty("OLD")}
+                {_apply("NEW", 1)}
+                {_BUMP_VERSION}
+            END;
+            COMMIT;
+        """)
+        if fresh:
+            self.rebuild(conn)
+
+    def rebuild(self, conn=None):
+        """Recomputes the aggregate tables from `risk` (first install, or after bulk edits with triggers off)."""
+        if conn is None:
+            with self.db.connection() as conn:
+                return self.rebuild(conn)
+        conn.executescript(f"""
+            BEGIN IMMEDIATE;
+            DELETE FROM risk_dashboard_type_counts;
+            DELETE FROM risk_dashboard_file_scores;
+            DELETE FROM risk_dashboard_file_risks;
+
+            INSERT INTO risk_dashboard_type_counts (access_level, risk_name, n)
+            SELECT COALESCE(access_level, ''), risk_name, COUNT(*) FROM risk
+            WHERE risk_name IS NOT NULL GROUP BY 1, 2;
+
+            INSERT INTO risk_dashboard_file_scores (access_level, file_name, impact_sum, impact_n, likelihood_sum, likelihood_n)
+            SELECT COALESCE(access_level, ''), file_name,
+                   COALESCE(SUM(impact_score), 0), COUNT(impact_score),
+                   COALESCE(SUM(likelihood_score), 0), COUNT(likelihood_score)
+            FROM risk WHERE file_name IS NOT NULL GROUP BY 1, 2;
+
+            INSERT INTO risk_dashboard_file_risks (risk_name, file_name, n)
+            SELECT risk_name, file_name, COUNT(*) FROM risk
+            WHERE risk_name IS NOT NULL AND file_name IS NOT NULL GROUP BY 1, 2;
+
+            {_BUMP_VERSION}
+            COMMIT;
+        """)
+        logger.info("Risk dashboard aggregates rebuilt")
+
+    def invalidate(self):
+        self._cache.clear()
+
+    def state(self):
+        """(version, updated_at) of the risk data; both change on every write, whoever makes it."""
+        with self.db.connection() as conn:
+            return conn.execute("SELECT version, updated_at FROM risk_dashboard_version").fetchone()
+
+    def data(self, access_level=None):
+        """
+        The `/data/<level>` chart payload: risk-type counts and per-file scatter
+        for `access_level` ("user", "group", anything else for all), and
+        distinct files per risk type over all rows. Rows are paged by `table`.
+        """
+        level = access_level if access_level in LEVELS else "all"
+        with self.db.connection() as conn:
+            score_pending(conn)  # rows written through the legacy Risks view
+            version = conn.execute("SELECT version FROM risk_dashboard_version").fetchone()
+            cached = self._cache.get(level)
+            if cached is not None and version is not None and cached[0] == version[0]:
+                return cached[1]
+            result = self._compute(conn, level)
+        if version is not None:
+            self._cache[level] = (version[0], result)
+        return result
+
+    def _compute(self, conn, level):
+        where, params = ("WHERE access_level = ?", (level,)) if level != "all" else ("", ())
+
+        risk_types = conn.execute(f"""
+            SELECT risk_name, SUM(n) AS count FROM risk_dashboard_type_counts {where}
+            GROUP BY risk_name ORDER BY count DESC, risk_name
+        """, params).fetchall()
+        scatter = conn.execute(f"""
+            SELECT file_name, SUM(impact_sum) / SUM(impact_n), SUM(likelihood_sum) / SUM(likelihood_n)
+            FROM risk_dashboard_file_scores {where}
+            GROUP BY file_name HAVING SUM(impact_n) > 0 AND SUM(likelihood_n) > 0 ORDER BY file_name
+        """, params).fetchall()
+        file_counts = conn.execute("""
+            SELECT risk_name, COUNT(*) FROM risk_dashboard_file_risks GROUP BY risk_name ORDER BY risk_name
+        """).fetchall()
+
+        return {
+            "risk_types": {
+                "labels": [r[0] for r in risk_types],
+                "counts": [r[1] for r in risk_types]
+            },
+            "scatter": {
+                "file_names": [r[0] for r in scatter],
+                "impact": [r[1] for r in scatter],
+                "likelihood": [float(r[2]) for r in scatter]
+            },
+            "file_risk_counts": {
+                "labels": [r[0] for r in file_counts],
+                "counts": [r[1] for r in file_counts]
+            }
+        }
+
+    def table(self, access_level=None, sort="id", descending=False, after=None, limit=TABLE_PAGE_SIZE,
+              fields=None, search=None, risk_name=None):
+        """
+        One page of risk rows, keyset-paginated so every page costs the same however deep it is.
+
+        Args:
+            access_level: "user", "group", anything else for all.
+            sort: Key of `TABLE_SORTS`; ties are broken by id.
+            descending: Sort direction.
+            after: The `next` cursor of the previous page, None for the first.
+            limit: Rows per page, capped at `TABLE_PAGE_MAX`.
+            fields: Columns to return (subset of `TABLE_FIELDS`), default `TABLE_DEFAULT_FIELDS`.
+            search: Case-insensitive substring of the file name.
+            risk_name: Exact risk type.
+
+        Returns:
+            {"rows": [...], "next": cursor or None}
+
+        Raises:
+            ValueError: Unknown sort or field, or a malformed cursor.
+        """
+        if sort not in TABLE_SORTS:
+            raise ValueError(f"Cannot sort by {sort!r}, expected one of {', '.join(TABLE_SORTS)}")
+        fields = list(fields or TABLE_DEFAULT_FIELDS)
+        unknown = [f for f in fields if f not in TABLE_FIELDS]
+        if unknown:
+            raise ValueError(f"Unknown fields {', '.join(unknown)}, expected any of {', '.join(TABLE_FIELDS)}")
+        limit = max(1, min(int(limit), TABLE_PAGE_MAX))
+        column = TABLE_SORTS[sort]
+
+        where, params = [], []
+        if access_level in LEVELS:
+            where.append("access_level = ?")
+            params.append(access_level)
+        if search:
+            where.append("file_name LIKE ? ESCAPE '\\'")
+            params.append("%" + search.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%")
+        if risk_name:
+            where.append("risk_name = ?")
+            params.append(risk_name)
+        if after:
+            value, last_id = _decode_cursor(after)
+            condition, values = _after(column, value, last_id, descending)
+            where.append(condition)
+            params.extend(values)
+
+        direction = "DESC" if descending else "ASC"
+        order = f"{column} {direction}, id {direction}" if column != "id" else f"id {direction}"
+        selected = list(dict.fromkeys(fields + [column, "id"]))
+        with self.db.connection() as conn:
+            rows = conn.execute(
+                f"SELECT {', '.join(selected)} FROM risk {'WHERE ' + ' AND '.join(where) if where else ''} "
+                f"ORDER BY {order} LIMIT ?", params + [limit + 1]).fetchall()
+
+        more = len(rows) > limit
+        rows = [dict(zip(selected, r)) for r in rows[:limit]]
+        next_cursor = _encode_cursor(rows[-1][column], rows[-1]["id"]) if more else None
+        return {"rows": [{f: r[f] for f in fields} for r in rows], "next": next_cursor}
+
+
+def _encode_cursor(value, last_id):
+    return base64.urlsafe_b64encode(json.dumps([value, last_id]).encode()).decode()
+
+
+def _decode_cursor(cursor):
+    try:
+        value, last_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return value, int(last_id)
+    except (ValueError, TypeError) as e:
+        raise ValueError("Malformed page cursor") from e
+
+
+def _after(column, value, last_id, descending):
+    """WHERE clause selecting the rows after (value, last_id) in the sort order; SQLite sorts NULLs first."""
+    if column == "id":
+        return ("id < ?" if descending else "id > ?"), [last_id]
+    if descending:
+        if value is None:
+            return f"({column} IS NULL AND id < ?)", [last_id]
+        return f"({column} < ? OR ({column} = ? AND id < ?) OR {column} IS NULL)", [value, value, last_id]
+    if value is None:
+        return f"({column} IS NULL AND id > ? OR {column} IS NOT NULL)", [last_id]
+    return f"({column} > ? OR ({column} = ? AND id > ?))", [value, value, last_id]
+
+
+risk_dashboard = RiskDashboard()
@@ -0,0 +1,96 @@
+import hashlib
+import os
+import re
+import threading
+import time
+
+from loguru import logger
+
+DOC_STORE_DIR = os.environ.get("DOC_STORE_DIR", os.path.join("instance", "documents"))
+DOC_STORE_MAX_AGE_SECONDS = int(os.environ.get("DOC_STORE_MAX_AGE_SECONDS", 3 * 24 * 3600))
+DOC_STORE_MAX_MB = float(os.environ.get("DOC_STORE_MAX_MB", 500))
+
+_DOC_ID = re.compile(r"^[0-9a-f]{64}$")
+
+
+class DocumentStore:
+    """
+    Keeps extracted document text on disk under its SHA-256 (the document id).
+
+    Pages and follow-up requests carry the short id instead of the full text.
+    Files are plain `<doc_id>.txt` in a shared directory, so every worker
+    process sees the same documents. A file's mtime is its last access time;
+    eviction drops documents unused for longer than the max age, then the
+    least recently used ones until the directory fits the size cap.
+    """
+
+    def __init__(self, directory=DOC_STORE_DIR, max_age_seconds=DOC_STORE_MAX_AGE_SECONDS,
+                 max_mb=DOC_STORE_MAX_MB):
+        self.directory = directory
+        self.max_age_seconds = max_age_seconds
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, doc_id):
+        return os.path.join(self.directory, f"{doc_id}.txt")
+
+    def put(self, text):
+        """Stores `text` and returns its document id."""
+        data = text.encode("utf-8")
+        doc_id = hashlib.sha256(data).hexdigest()
+        path = self._path(doc_id)
+        if os.path.exists(path):
+            os.utime(path)
+            return doc_id
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        self.evict()
+        return doc_id
+
+    def get(self, doc_id):
+        """Returns the stored text, or None if the id is malformed or the document was evicted."""
+        if not doc_id or not _DOC_ID.match(doc_id):
+            return None
+        path = self._path(doc_id)
+        try:
+            with open(path, "rb") as f:
+                text = f.read().decode("utf-8")
+            os.utime(path)
+            return text
+        except FileNotFoundError:
+            return None
+
+    def evict(self):
+        with self._lock:
+            now = time.time()
+            entries = []
+            for name in os.listdir(self.directory):
+                if not name.endswith(".txt"):
+                    continue
+                path = os.path.join(self.directory, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+
+            entries.sort()
+            total = sum(size for _, size, _ in entries)
+            removed = 0
+            for mtime, size, path in entries:
+                if now - mtime <= self.max_age_seconds and total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+                removed += 1
+            if removed:
+                logger.info(f"Document store evicted {removed} documents")
+
+
+doc_store = DocumentStore()
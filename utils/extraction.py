@@ -0,0 +1,188 @@
+import io
+import multiprocessing
+import os
+import re
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import docx
+import PyPDF2
+from loguru import logger
+
+PDF_ENGINES = ("pypdf2", "pdfminer")
+PDF_ENGINE = os.environ.get("PDF_ENGINE", "pypdf2")
+EXTRACT_MAX_PAGES = int(os.environ.get("EXTRACT_MAX_PAGES", 1500))
+EXTRACT_MAX_CHARS = int(os.environ.get("EXTRACT_MAX_CHARS", 5_000_000))
+# PDFs with at least this many pages are split into page ranges across processes
+EXTRACT_PARALLEL_MIN_PAGES = int(os.environ.get("EXTRACT_PARALLEL_MIN_PAGES", 40))
+EXTRACT_PAGES_PER_TASK = int(os.environ.get("EXTRACT_PAGES_PER_TASK", 16))
+EXTRACT_PROCESSES = int(os.environ.get("EXTRACT_PROCESSES", os.cpu_count() or 1))
+
+# Pages are separated by form feeds, which `utils.chunking` uses as its preferred boundary
+PAGE_BREAK = "\f"
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+class UnsupportedFileError(ValueError):
+    pass
+
+
+def _init_worker():
+    # A worker extracts whole documents or page ranges itself and never starts a pool of its own
+    global EXTRACT_PROCESSES
+    EXTRACT_PROCESSES = 1
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn: the web process has threads (LLM pool, job workers) that must not be forked
+            _pool = ProcessPoolExecutor(max_workers=EXTRACT_PROCESSES, mp_context=multiprocessing.get_context("spawn"),
+                                        initializer=_init_worker)
+        return _pool
+
+
+def _pypdf2_pages(path, start, stop):
+    reader = PyPDF2.PdfReader(path)
+    for i in range(start, stop):
+        # One extract_text() per page; PyPDF2 breaks lines mid-sentence, so they are joined
+        yield re.sub("\n", " ", reader.pages[i].extract_text() or "")
+
+
+def _pdfminer_pages(path, start, stop):
+    from pdfminer.high_level import extract_pages
+    from pdfminer.layout import LTTextContainer
+
+    for page in extract_pages(path, page_numbers=range(start, stop)):
+        yield "".join(element.get_text() for element in page if isinstance(element, LTTextContainer))
+
+
+def _extract_range(path, engine, start, stop):
+    """Worker entry point: extracts pages [start, stop) of the PDF at `path`."""
+    pages = _pypdf2_pages if engine == "pypdf2" else _pdfminer_pages
+    return list(pages(path, start, stop))
+
+
+def iter_pdf_pages(data, engine=PDF_ENGINE, max_pages=EXTRACT_MAX_PAGES):
+    """
+    Yields the text of each page of a PDF, in order, extracting every page once.
+
+    Small PDFs are extracted in this process. From EXTRACT_PARALLEL_MIN_PAGES
+    pages on, page ranges are extracted in parallel on a process pool and
+    yielded as soon as the next range in order is ready.
+
+    Args:
+        data: PDF file contents.
+        engine: "pypdf2" or "pdfminer".
+        max_pages: Pages after this many are not extracted.
+    """
+    if engine not in PDF_ENGINES:
+        raise UnsupportedFileError(f"Unknown PDF engine: {engine}")
+    page_count = len(PyPDF2.PdfReader(io.BytesIO(data)).pages)
+    if page_count > max_pages:
+        logger.warning(f"PDF has {page_count} pages, extracting the first {max_pages}")
+        page_count = max_pages
+
+    if page_count < EXTRACT_PARALLEL_MIN_PAGES or EXTRACT_PROCESSES < 2:
+        pages = _pypdf2_pages if engine == "pypdf2" else _pdfminer_pages
+        yield from pages(io.BytesIO(data), 0, page_count)
+        return
+
+    # Workers read the PDF from a temporary file instead of receiving the bytes per task
+    fd, path = tempfile.mkstemp(suffix=".pdf")
+    futures = []
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        pool = _get_pool()
+        futures = [
+            pool.submit(_extract_range, path, engine, start, min(start + EXTRACT_PAGES_PER_TASK, page_count))
+            for start in range(0, page_count, EXTRACT_PAGES_PER_TASK)
+        ]
+        logger.debug(f"Extracting {page_count} pages with {engine} in {len(futures)} parallel ranges")
+        for future in futures:
+            yield from future.result()
+    finally:
+        for future in futures:
+            future.cancel()
+        for future in futures:
+            if not future.cancelled():
+                future.exception()  # wait before deleting the file it reads
+        os.remove(path)
+
+
+def iter_pages(data, filename, engine=PDF_ENGINE, max_pages=EXTRACT_MAX_PAGES):
+    """Yields page texts for a .pdf, .txt or .docx file (text and Word files are a single page)."""
+    ext = filename.rsplit(".", 1)[-1].lower() if "." in filename else ""
+    if ext == "pdf":
+        yield from iter_pdf_pages(data, engine, max_pages)
+    elif ext == "txt":
+        yield data.decode("utf-8")
+    elif ext == "docx":
+        doc = docx.Document(io.BytesIO(data))
+        yield "\n".join(paragraph.text for paragraph in doc.paragraphs)
+    else:
+        raise UnsupportedFileError(f"Unsupported file format: {filename}")
+
+
+def extract_document(data, filename, engine=PDF_ENGINE, max_pages=EXTRACT_MAX_PAGES, max_chars=EXTRACT_MAX_CHARS):
+    """
+    Extracts the text of an uploaded file, stopping at the page and character limits.
+
+    Args:
+        data: File contents.
+        filename: Original file name; its extension selects the format.
+        engine: PDF engine, "pypdf2" or "pdfminer".
+        max_pages: Maximum number of pages to extract.
+        max_chars: Maximum length of the returned text.
+
+    Returns:
+        Dict with `text` (pages joined by PAGE_BREAK), `page_offsets` (start
+        of each page in `text`), `pages`, `truncated` and `engine`.
+    """
+    parts = []
+    page_offsets = []
+    length = 0
+    truncated = False
+    pages = iter_pages(data, filename, engine, max_pages)
+    try:
+        for page in pages:
+            if parts:
+                parts.append(PAGE_BREAK)
+                length += len(PAGE_BREAK)
+            if length + len(page) > max_chars:
+                page = page[:max(max_chars - length, 0)]
+                truncated = True
+            page_offsets.append(length)
+            parts.append(page)
+            length += len(page)
+            if truncated:
+                break
+    finally:
+        pages.close()
+
+    if truncated:
+        logger.warning(f"{filename}: extraction stopped at {max_chars} characters ({len(page_offsets)} pages)")
+    return {
+        "text": "".join(parts),
+        "page_offsets": page_offsets,
+        "pages": len(page_offsets),
+        "truncated": truncated,
+        "engine": engine,
+    }
+
+
+def extract_document_in_pool(data, filename, engine=PDF_ENGINE, max_pages=EXTRACT_MAX_PAGES, max_chars=EXTRACT_MAX_CHARS):
+    """
+    `extract_document` run as one task on the process pool.
+
+    For extracting many documents at once (batch uploads): documents are
+    spread across processes instead of the pages of a single one.
+    """
+    if EXTRACT_PROCESSES < 2:
+        return extract_document(data, filename, engine, max_pages, max_chars)
+    return _get_pool().submit(extract_document, data, filename, engine, max_pages, max_chars).result()
@@ -0,0 +1,168 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+from loguru import logger
+
+from utils import metrics
+from utils.extraction import EXTRACT_MAX_CHARS, EXTRACT_MAX_PAGES, PDF_ENGINE, extract_document
+from utils.storage import get_database
+
+EXTRACTION_CACHE_PATH = os.environ.get("EXTRACTION_CACHE_PATH", os.path.join("instance", "extraction_cache.db"))
+EXTRACTION_CACHE_ENABLED = os.environ.get("EXTRACTION_CACHE_ENABLED", "true").lower() == "true"
+EXTRACTION_CACHE_MAX_MB = float(os.environ.get("EXTRACTION_CACHE_MAX_MB", 500))
+
+
+class ExtractionCache:
+    """
+    SQLite-backed cache of extracted document text, keyed by the SHA-256 of the uploaded bytes.
+
+    The same file uploaded again, by anyone and through any worker process,
+    is served from here without being parsed. Results depend on the PDF
+    engine and the extraction limits, so those form part of the key as a
+    `variant`. Entries are evicted least recently used first once the
+    stored text exceeds the size cap.
+    """
+
+    def __init__(self, path=EXTRACTION_CACHE_PATH, max_mb=EXTRACTION_CACHE_MAX_MB, enabled=EXTRACTION_CACHE_ENABLED):
+        self.path = path
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.enabled = enabled
+        self.db = get_database(path)
+        self.db.add_schema(self._create_schema)
+
+    def _create_schema(self, conn):
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS extraction_cache (
+                content_hash TEXT NOT NULL,
+                variant TEXT NOT NULL,
+                text TEXT NOT NULL,
+                page_offsets TEXT NOT NULL,
+                truncated INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL,
+                PRIMARY KEY (content_hash, variant)
+            )
+        ''')
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_extraction_cache_last_access ON extraction_cache (last_access)")
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS extraction_cache_stats (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            )
+        ''')
+
+    def _bump(self, conn, name):
+        conn.execute("""
+            INSERT INTO extraction_cache_stats (name, value) VALUES (?, 1)
+            ON CONFLICT(name) DO UPDATE SET value = value + 1
+        """, (name,))
+
+    def get(self, content_hash, variant):
+        """Returns the cached extraction dict, or None on a miss."""
+        if not self.enabled:
+            return None
+        try:
+            with self.db.connection() as conn:
+                row = conn.execute(
+                    "SELECT text, page_offsets, truncated FROM extraction_cache WHERE content_hash = ? AND variant = ?",
+                    (content_hash, variant)
+                ).fetchone()
+                if row:
+                    conn.execute(
+                        "UPDATE extraction_cache SET last_access = ? WHERE content_hash = ? AND variant = ?",
+                        (time.time(), content_hash, variant))
+                self._bump(conn, "hits" if row else "misses")
+        except sqlite3.Error as e:
+            logger.warning(f"Extraction cache read failed: {e}")
+            return None
+        if row is None:
+            return None
+        page_offsets = json.loads(row[1])
+        return {"text": row[0], "page_offsets": page_offsets, "pages": len(page_offsets), "truncated": bool(row[2])}
+
+    def set(self, content_hash, variant, result):
+        if not self.enabled:
+            return
+        now = time.time()
+        try:
+            with self.db.connection() as conn:
+                conn.execute("""
+                    INSERT OR REPLACE INTO extraction_cache
+                        (content_hash, variant, text, page_offsets, truncated, size, created_at, last_access)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """, (content_hash, variant, result["text"], json.dumps(result["page_offsets"]),
+                      int(result["truncated"]), len(result["text"].encode("utf-8")), now, now))
+                self._evict(conn)
+        except sqlite3.Error as e:
+            logger.warning(f"Extraction cache write failed: {e}")
+
+    def _evict(self, conn):
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM extraction_cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evicted = 0
+        for content_hash, variant, size in conn.execute(
+                "SELECT content_hash, variant, size FROM extraction_cache ORDER BY last_access").fetchall():
+            if total <= self.max_bytes:
+                break
+            conn.execute("DELETE FROM extraction_cache WHERE content_hash = ? AND variant = ?", (content_hash, variant))
+            total -= size
+            evicted += 1
+        if evicted:
+            logger.info(f"Extraction cache evicted {evicted} entries")
+
+    def extract(self, data, filename, engine=PDF_ENGINE, max_pages=EXTRACT_MAX_PAGES, max_chars=EXTRACT_MAX_CHARS,
+                extractor=extract_document):
+        """
+        `extract_document` (or another `extractor` with its signature) through the cache.
+
+        Returns:
+            The `extract_document` dict plus `content_hash` and `cached`
+            (True when the file was not parsed).
+        """
+        content_hash = hashlib.sha256(data).hexdigest()
+        ext = filename.rsplit(".", 1)[-1].lower() if "." in filename else ""
+        # The engine only matters for PDFs
+        variant = f"{ext}:{engine if ext == 'pdf' else ''}:{max_pages}:{max_chars}"
+
+        result = self.get(content_hash, variant)
+        cached = result is not None
+        if not cached:
+            with metrics.stage("extract"):
+                result = extractor(data, filename, engine, max_pages, max_chars)
+            self.set(content_hash, variant, result)
+        return dict(result, engine=engine, content_hash=content_hash, cached=cached)
+
+    def invalidate(self, content_hash=None):
+        """Drops the entries of one file, or the whole cache when `content_hash` is None. Returns rows removed."""
+        with self.db.connection() as conn:
+            if content_hash is None:
+                cur = conn.execute("DELETE FROM extraction_cache")
+            else:
+                cur = conn.execute("DELETE FROM extraction_cache WHERE content_hash = ?", (content_hash,))
+            return cur.rowcount
+
+    def stats(self):
+        with self.db.connection() as conn:
+            counters = dict(conn.execute("SELECT name, value FROM extraction_cache_stats").fetchall())
+            entries, size = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM extraction_cache"
+            ).fetchone()
+        hits = counters.get("hits", 0)
+        misses = counters.get("misses", 0)
+        return {
+            "enabled": self.enabled,
+            "entries": entries,
+            "size_bytes": size,
+            "max_bytes": self.max_bytes,
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": hits / (hits + misses) if hits + misses else 0.0,
+        }
+
+
+extraction_cache = ExtractionCache()
@@ -0,0 +1,79 @@
+import os
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+LLM_MAX_WORKERS = int(os.environ.get("LLM_MAX_WORKERS", 16))
+LLM_PER_DOCUMENT_CONCURRENCY = int(os.environ.get("LLM_PER_DOCUMENT_CONCURRENCY", 6))
+
+executor = ThreadPoolExecutor(max_workers=LLM_MAX_WORKERS, thread_name_prefix="llm")
+
+_END = object()
+_groups_lock = threading.Lock()
+_groups = {}
+
+
+def _join_group(key, limit):
+    with _groups_lock:
+        entry = _groups.get(key)
+        if entry is None:
+            entry = _groups[key] = [threading.BoundedSemaphore(limit), 0]
+        entry[1] += 1
+        return entry[0]
+
+
+def _leave_group(key):
+    with _groups_lock:
+        entry = _groups[key]
+        entry[1] -= 1
+        if entry[1] == 0:
+            del _groups[key]
+
+
+def iter_as_completed(fn, items, key=None, limit=LLM_PER_DOCUMENT_CONCURRENCY):
+    """
+    Runs `fn(item)` for every item on the shared LLM pool and yields results as they finish.
+
+    At most `limit` calls are in flight for the same `key` (e.g. a document hash),
+    across all concurrent callers, so one large batch cannot starve the pool.
+
+    Args:
+        fn: Callable applied to each item.
+        items: Iterable of inputs.
+        key: Concurrency group; defaults to a private group for this call.
+        limit: Maximum in-flight calls for the group.
+
+    Yields:
+        (item, result, error) tuples in completion order; exactly one of
+        result / error is meaningful.
+    """
+    key = key if key is not None else object()
+    semaphore = _join_group(key, limit)
+    pending = {}
+    remaining = iter(items)
+    exhausted = False
+    try:
+        while pending or not exhausted:
+            # Fill free slots; block for one only when nothing is running yet
+            while not exhausted and semaphore.acquire(blocking=not pending):
+                item = next(remaining, _END)
+                if item is _END:
+                    semaphore.release()
+                    exhausted = True
+                    break
+                future = executor.submit(fn, item)
+                future.add_done_callback(lambda _: semaphore.release())
+                pending[future] = item
+
+            if not pending:
+                continue
+
+            done, _ = wait(pending, timeout=0.5, return_when=FIRST_COMPLETED)
+            for future in done:
+                item = pending.pop(future)
+                error = future.exception()
+                yield item, (None if error else future.result()), error
+    finally:
+        for future in pending:
+            future.cancel()
+        _leave_group(key)
+
@@ -0,0 +1,174 @@
+import atexit
+import base64
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from loguru import logger
+
+from utils.storage import get_database
+
+FEEDBACK_DB_PATH = os.environ.get("FEEDBACK_DB_PATH", "feedback.db")
+FEEDBACK_PROJECT = "risk_web_system"
+FEEDBACK_FLUSH_INTERVAL = float(os.environ.get("FEEDBACK_FLUSH_INTERVAL", 1.0))
+FEEDBACK_BATCH_SIZE = int(os.environ.get("FEEDBACK_BATCH_SIZE", 500))
+FEEDBACK_QUEUE_MAX = int(os.environ.get("FEEDBACK_QUEUE_MAX", 10000))
+FEEDBACK_PAGE_SIZE = int(os.environ.get("FEEDBACK_PAGE_SIZE", 100))
+FEEDBACK_PAGE_MAX = int(os.environ.get("FEEDBACK_PAGE_MAX", 1000))
+
+
+class FeedbackStore:
+    """
+    User feedback submitted from the analysis pages, read back by /view_feedback.
+
+    Submissions are write-behind: `add` only queues the row, and a
+    background writer commits whatever has queued up every
+    FEEDBACK_FLUSH_INTERVAL seconds in one transaction, so a burst of
+    clicks costs one commit instead of one each. Rows whose write failed
+    are kept in a retry buffer, written before anything newer. Queued and
+    retried rows are flushed at interpreter exit; when the queue is full
+    the caller writes the backlog itself rather than dropping feedback.
+    """
+
+    def __init__(self, path=FEEDBACK_DB_PATH, flush_interval=FEEDBACK_FLUSH_INTERVAL,
+                 batch_size=FEEDBACK_BATCH_SIZE):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.db = get_database(path)
+        self.db.add_schema(self._create_schema)
+        self._queue = queue.Queue(maxsize=FEEDBACK_QUEUE_MAX)
+        self._write_lock = threading.Lock()
+        # Rows taken off the queue whose write failed; guarded by _write_lock
+        self._retry = []
+        self._start_lock = threading.Lock()
+        self._pid = None
+        atexit.register(self.flush)
+
+    def _create_schema(self, conn):
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS feedback (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id TEXT,
+                feedback TEXT,
+                timestamp TEXT,
+                project TEXT
+            )
+        ''')
+        # Databases created before feedback was tagged with its project
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(feedback)")]
+        if "project" not in columns:
+            conn.execute("ALTER TABLE feedback ADD COLUMN project TEXT")
+        # The rowid (= id) is the implicit last column, so this index serves the (timestamp, id) keyset
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_feedback_timestamp ON feedback (timestamp)")
+
+    def _start(self):
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            threading.Thread(target=self._writer, name="feedback-writer", daemon=True).start()
+            self._pid = os.getpid()
+
+    def add(self, user_id, feedback, project=FEEDBACK_PROJECT):
+        """Queues a feedback row; it is committed within FEEDBACK_FLUSH_INTERVAL seconds."""
+        self._start()
+        row = (user_id, feedback, datetime.utcnow().isoformat(), project)
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            logger.warning("Feedback queue full, writing the backlog inline")
+            self.flush()
+            self._queue.put(row)
+
+    def _drain(self, first=None):
+        rows = [] if first is None else [first]
+        while len(rows) < self.batch_size:
+            try:
+                rows.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return rows
+
+    def _write(self, rows):
+        """Commits the retry buffer and `rows`; returns how many were written, or keeps them all and raises."""
+        with self._write_lock:
+            rows, self._retry = self._retry + rows, []
+            try:
+                with self.db.connection() as conn:
+                    conn.executemany(
+                        "INSERT INTO feedback (user_id, feedback, timestamp, project) VALUES (?, ?, ?, ?)", rows)
+            except sqlite3.Error:
+                self._retry = rows
+                raise
+        return len(rows)
+
+    def _writer(self):
+        while True:
+            if self._retry:
+                # Retry before taking more rows, so a full queue still pushes back on `add`
+                time.sleep(self.flush_interval)
+                rows = []
+            else:
+                try:
+                    first = self._queue.get(timeout=self.flush_interval)
+                except queue.Empty:
+                    continue
+                rows = self._drain(first)
+            try:
+                self._write(rows)
+            except sqlite3.Error as e:
+                logger.error(f"Feedback write failed, {len(self._retry)} rows kept for retry: {e}")
+
+    def flush(self):
+        """Commits every queued row and the retry buffer now (called at exit)."""
+        written = 0
+        while True:
+            rows = self._drain()
+            if not rows and not self._retry:
+                break
+            written += self._write(rows)
+        if written:
+            logger.info(f"Flushed {written} queued feedback rows")
+        return written
+
+    def page(self, before=None, limit=FEEDBACK_PAGE_SIZE):
+        """
+        One page of feedback, newest first.
+
+        Args:
+            before: The `next` cursor of the previous page, None for the newest.
+            limit: Rows per page, capped at FEEDBACK_PAGE_MAX.
+
+        Returns:
+            {"rows": [(user_id, feedback, timestamp, project), ...], "next": cursor or None}
+
+        Raises:
+            ValueError: On a malformed cursor.
+        """
+        limit = max(1, min(int(limit), FEEDBACK_PAGE_MAX))
+        where, params = "", []
+        if before:
+            try:
+                timestamp, last_id = json.loads(base64.urlsafe_b64decode(before.encode()))
+                params = [timestamp, int(last_id)]
+            except (ValueError, TypeError) as e:
+                raise ValueError("Malformed page cursor") from e
+            where = "WHERE (timestamp, id) < (?, ?)"
+        with self.db.connection() as conn:
+            rows = conn.execute(
+                f"SELECT id, user_id, feedback, timestamp, project FROM feedback {where} "
+                f"ORDER BY timestamp DESC, id DESC LIMIT ?", params + [limit + 1]).fetchall()
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = base64.urlsafe_b64encode(json.dumps([rows[-1][3], rows[-1][0]]).encode()).decode()
+        return {"rows": [row[1:] for row in rows], "next": next_cursor}
+
+
+feedback_store = FeedbackStore()
@@ -0,0 +1,106 @@
+import gzip
+import hashlib
+import os
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+COMPRESS_MIN_BYTES = int(os.environ.get("COMPRESS_MIN_BYTES", 1024))
+COMPRESS_GZIP_LEVEL = int(os.environ.get("COMPRESS_GZIP_LEVEL", 6))
+COMPRESS_BROTLI_QUALITY = int(os.environ.get("COMPRESS_BROTLI_QUALITY", 5))
+COMPRESSIBLE_MIMETYPES = {
+    "text/html", "text/plain", "text/css", "text/javascript", "application/javascript", "application/json",
+}
+STATIC_MAX_AGE = int(os.environ.get("STATIC_MAX_AGE", 365 * 24 * 3600))
+
+_fingerprints = {}
+
+
+def choose_encoding(accept_encoding):
+    """Picks "br" or "gzip" from an Accept-Encoding header, None when neither is accepted."""
+    accepted = {}
+    for part in (accept_encoding or "").split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip().lower()] = q
+    if brotli is not None and accepted.get("br", 0) > 0:
+        return "br"
+    if accepted.get("gzip", 0) > 0:
+        return "gzip"
+    return None
+
+
+def compress(body, encoding):
+    if encoding == "br":
+        return brotli.compress(body, quality=COMPRESS_BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=COMPRESS_GZIP_LEVEL)
+
+
+def compress_response(response):
+    """
+    after_request hook compressing HTML and JSON bodies over COMPRESS_MIN_BYTES.
+
+    Streamed and file responses are left alone. A strong ETag is weakened,
+    as the compressed body is no longer byte-identical to what it names.
+    """
+    if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+            or "Content-Encoding" in response.headers or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+    response.vary.add("Accept-Encoding")
+    encoding = choose_encoding(request.headers.get("Accept-Encoding"))
+    if encoding is None or (response.content_length or 0) < COMPRESS_MIN_BYTES:
+        return response
+
+    response.set_data(compress(response.get_data(), encoding))
+    response.headers["Content-Encoding"] = encoding
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def static_fingerprint(static_folder, filename):
+    """Short content hash of a static file, recomputed only when its mtime changes."""
+    path = os.path.join(static_folder, filename)
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    cached = _fingerprints.get(path)
+    if cached is None or cached[0] != mtime:
+        with open(path, "rb") as f:
+            cached = (mtime, hashlib.md5(f.read()).hexdigest()[:12])
+        _fingerprints[path] = cached
+    return cached[1]
+
+
+def init_app(app):
+    """
+    Compresses responses, and fingerprints static URLs so they can be cached for a year.
+
+    Every `url_for('static', filename=...)` gets `?v=<content hash>`, so a
+    changed file gets a new URL; responses for fingerprinted URLs are
+    marked immutable.
+    """
+
+    @app.url_defaults
+    def _fingerprint_static(endpoint, values):
+        if endpoint == "static" and "filename" in values and "v" not in values:
+            fingerprint = static_fingerprint(app.static_folder, values["filename"])
+            if fingerprint:
+                values["v"] = fingerprint
+
+    @app.after_request
+    def _cache_and_compress(response):
+        if request.endpoint == "static" and request.args.get("v") and response.status_code in (200, 304):
+            response.headers["Cache-Control"] = f"public, max-age={STATIC_MAX_AGE}, immutable"
+        return compress_response(response)
@@ -0,0 +1,290 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from loguru import logger
+
+from utils.storage import get_database
+
+JOBS_DB_PATH = os.environ.get("JOBS_DB_PATH", os.path.join("instance", "jobs.db"))
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", 8))
+JOB_LEASE_SECONDS = int(os.environ.get("JOB_LEASE_SECONDS", 600))
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", 3))
+JOB_POLL_INTERVAL = float(os.environ.get("JOB_POLL_INTERVAL", 1.0))
+JOB_RETENTION_SECONDS = int(os.environ.get("JOB_RETENTION_SECONDS", 7 * 24 * 3600))
+
+QUEUED, RUNNING, DONE, ERROR = "queued", "running", "done", "error"
+
+
+class JobError(Exception):
+    """Raised by a job handler to fail the job with a message meant for the user."""
+
+
+class JobQueue:
+    """
+    Runs slow work (LLM analyses) on a local worker pool instead of inside a request.
+
+    Jobs live in a SQLite table, so every web worker process can submit and
+    poll them and nothing is lost when a process restarts. A worker claims a
+    job by taking a lease, which a heartbeat thread renews while the handler
+    runs; a job whose lease runs out (its process died) is queued again, up to
+    JOB_MAX_ATTEMPTS times. A run only records its outcome while it still
+    holds the lease.
+
+    Handlers are registered per job kind and receive the JSON payload; their
+    return value must be JSON-serializable and becomes the job result. A kind
+    may have a concurrency limit, counted across all processes, so bulk work
+    (batch uploads) cannot occupy every worker. Jobs submitted together can
+    share a batch id and be followed as a group.
+    """
+
+    def __init__(self, path=JOBS_DB_PATH, workers=JOB_WORKERS, lease_seconds=JOB_LEASE_SECONDS):
+        self.path = path
+        self.workers = workers
+        self.lease_seconds = lease_seconds
+        self._handlers = {}
+        self._limits = {}
+        # Autocommit: claims and recovery take their own BEGIN IMMEDIATE transactions
+        self.db = get_database(path, isolation_level=None, row_factory=sqlite3.Row)
+        self.db.add_schema(self._create_schema)
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self._changed = threading.Condition()
+        # job id -> attempt number of the runs in this process, whose leases the heartbeat renews
+        self._held = {}
+        self._held_lock = threading.Lock()
+
+    def _create_schema(self, conn):
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                state TEXT NOT NULL,
+                result TEXT,
+                error TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL,
+                lease_until REAL,
+                batch_id TEXT
+            )
+        ''')
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(jobs)")]
+        if "batch_id" not in columns:
+            conn.execute("ALTER TABLE jobs ADD COLUMN batch_id TEXT")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_state_created ON jobs (state, created_at)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_batch ON jobs (batch_id) WHERE batch_id IS NOT NULL")
+
+    def register(self, kind, handler, max_concurrent=None):
+        """Registers the handler of a job kind; `max_concurrent` caps its running jobs across processes."""
+        self._handlers[kind] = handler
+        if max_concurrent:
+            self._limits[kind] = max_concurrent
+
+    def start(self):
+        """Starts the worker threads for this process (idempotent, restarts them after a fork)."""
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self._recover()
+            for i in range(self.workers):
+                threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True).start()
+            threading.Thread(target=self._heartbeat, name="job-heartbeat", daemon=True).start()
+            self._pid = os.getpid()
+            logger.info(f"Job queue started {self.workers} workers")
+
+    def submit(self, kind, payload, batch_id=None):
+        """Queues a job and returns its id."""
+        if kind not in self._handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+        job_id = uuid.uuid4().hex
+        with self.db.connection() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, kind, payload, state, created_at, batch_id) VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, kind, json.dumps(payload), QUEUED, time.time(), batch_id))
+        with self._changed:
+            self._changed.notify_all()
+        return job_id
+
+    @staticmethod
+    def _job_dict(row):
+        return {
+            "id": row["id"],
+            "kind": row["kind"],
+            "state": row["state"],
+            "result": json.loads(row["result"]) if row["result"] else None,
+            "error": row["error"],
+            "attempts": row["attempts"],
+            "created_at": row["created_at"],
+            "started_at": row["started_at"],
+            "finished_at": row["finished_at"],
+            "batch_id": row["batch_id"],
+        }
+
+    def get(self, job_id):
+        """Returns the job as a dict, or None if it does not exist."""
+        with self.db.connection() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._job_dict(row) if row is not None else None
+
+    def batch(self, batch_id):
+        """Returns the jobs of a batch in submission order, with per-state counts, or None if it is unknown."""
+        with self.db.connection() as conn:
+            rows = conn.execute(
+                "SELECT * FROM jobs WHERE batch_id = ? ORDER BY created_at, rowid", (batch_id,)
+            ).fetchall()
+        if not rows:
+            return None
+        jobs = [dict(self._job_dict(row), payload=json.loads(row["payload"])) for row in rows]
+        counts = {state: sum(1 for job in jobs if job["state"] == state) for state in (QUEUED, RUNNING, DONE, ERROR)}
+        return dict(counts, batch_id=batch_id, total=len(jobs),
+                    finished=counts[DONE] + counts[ERROR] == len(jobs), jobs=jobs)
+
+    def wait(self, job_id, timeout):
+        """Long-polls until the job is finished or `timeout` seconds pass; returns the job dict."""
+        deadline = time.time() + timeout
+        while True:
+            job = self.get(job_id)
+            remaining = deadline - time.time()
+            if job is None or job["state"] in (DONE, ERROR) or remaining <= 0:
+                return job
+            # Woken early by jobs finishing in this process; other processes are seen on the next poll
+            with self._changed:
+                self._changed.wait(min(JOB_POLL_INTERVAL, remaining))
+
+    def stats(self):
+        with self.db.connection() as conn:
+            counts = dict(conn.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall())
+            oldest = conn.execute("SELECT MIN(created_at) FROM jobs WHERE state = ?", (QUEUED,)).fetchone()[0]
+        return {
+            "workers": self.workers,
+            "queued": counts.get(QUEUED, 0),
+            "running": counts.get(RUNNING, 0),
+            "done": counts.get(DONE, 0),
+            "error": counts.get(ERROR, 0),
+            "oldest_queued_seconds": round(time.time() - oldest, 1) if oldest else 0,
+        }
+
+    def _recover(self):
+        # Jobs whose worker died mid-run are requeued once their lease has expired
+        now = time.time()
+        with self.db.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            failed = conn.execute(
+                "UPDATE jobs SET state = ?, error = ?, finished_at = ? WHERE state = ? AND lease_until < ? AND attempts >= ?",
+                (ERROR, "Job was interrupted too many times", now, RUNNING, now, JOB_MAX_ATTEMPTS)).rowcount
+            requeued = conn.execute(
+                "UPDATE jobs SET state = ?, lease_until = NULL WHERE state = ? AND lease_until < ?",
+                (QUEUED, RUNNING, now)).rowcount
+            pruned = conn.execute(
+                "DELETE FROM jobs WHERE state IN (?, ?) AND finished_at < ?",
+                (DONE, ERROR, now - JOB_RETENTION_SECONDS)).rowcount
+            conn.execute("COMMIT")
+        if requeued or failed or pruned:
+            logger.info(f"Job queue recovery: {requeued} requeued, {failed} failed, {pruned} pruned")
+
+    def _claim(self):
+        now = time.time()
+        with self.db.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            saturated = []
+            if self._limits:
+                running = dict(conn.execute(
+                    "SELECT kind, COUNT(*) FROM jobs WHERE state = ? GROUP BY kind", (RUNNING,)).fetchall())
+                saturated = [kind for kind, limit in self._limits.items() if running.get(kind, 0) >= limit]
+            row = conn.execute(
+                f"SELECT id, kind, payload, attempts + 1 AS attempt FROM jobs WHERE state = ? AND kind NOT IN ({','.join('?' * len(saturated))}) "
+                "ORDER BY created_at LIMIT 1", (QUEUED, *saturated)
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE jobs SET state = ?, started_at = ?, lease_until = ?, attempts = attempts + 1 WHERE id = ?",
+                    (RUNNING, now, now + self.lease_seconds, row["id"]))
+            conn.execute("COMMIT")
+        return row
+
+    def _renew(self):
+        with self._held_lock:
+            held = list(self._held.items())
+        if not held:
+            return
+        lease_until = time.time() + self.lease_seconds
+        with self.db.connection() as conn:
+            conn.executemany(
+                "UPDATE jobs SET lease_until = ? WHERE id = ? AND state = ? AND attempts = ?",
+                [(lease_until, job_id, RUNNING, attempt) for job_id, attempt in held])
+
+    def _heartbeat(self):
+        # Renews well before expiry, so one slow or failed renewal does not cost the lease
+        while True:
+            time.sleep(self.lease_seconds / 3)
+            try:
+                self._renew()
+            except sqlite3.Error as e:
+                logger.warning(f"Job lease renewal failed: {e}")
+
+    def _finish(self, job_id, attempt, state, result=None, error=None):
+        """Records the outcome of run `attempt`; False when its lease was lost and another run owns the job."""
+        with self.db.connection() as conn:
+            updated = conn.execute(
+                "UPDATE jobs SET state = ?, result = ?, error = ?, finished_at = ?, lease_until = NULL "
+                "WHERE id = ? AND state = ? AND attempts = ?",
+                (state, json.dumps(result) if result is not None else None, error, time.time(),
+                 job_id, RUNNING, attempt)).rowcount
+        with self._changed:
+            self._changed.notify_all()
+        return bool(updated)
+
+    def _work(self):
+        last_recovery = time.time()
+        while True:
+            try:
+                if time.time() - last_recovery > self.lease_seconds:
+                    self._recover()
+                    last_recovery = time.time()
+                row = self._claim()
+            except sqlite3.Error as e:
+                logger.warning(f"Job queue unavailable: {e}")
+                row = None
+            if row is None:
+                with self._changed:
+                    self._changed.wait(JOB_POLL_INTERVAL)
+                continue
+
+            job_id, kind, attempt = row["id"], row["kind"], row["attempt"]
+            started = time.time()
+            with self._held_lock:
+                self._held[job_id] = attempt
+            try:
+                result = self._handlers[kind](json.loads(row["payload"]))
+            except JobError as e:
+                outcome = {"state": ERROR, "error": str(e)}
+            except Exception:
+                logger.exception(f"Job {job_id} ({kind}) failed")
+                outcome = {"state": ERROR, "error": "Error during analysis"}
+            else:
+                outcome = {"state": DONE, "result": result}
+            finally:
+                with self._held_lock:
+                    self._held.pop(job_id, None)
+
+            try:
+                finished = self._finish(job_id, attempt, **outcome)
+            except sqlite3.Error as e:
+                # The lease is no longer renewed, so the job is requeued once it expires
+                logger.warning(f"Job {job_id} ({kind}) outcome not recorded: {e}")
+                continue
+            if not finished:
+                logger.warning(f"Job {job_id} ({kind}) lost its lease; outcome of attempt {attempt} discarded")
+            elif outcome["state"] == DONE:
+                logger.info(f"Job {job_id} ({kind}) done in {time.time() - started:.1f}s")
+
+
+job_queue = JobQueue()
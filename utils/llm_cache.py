@@ -0,0 +1,158 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+from loguru import logger
+
+from utils.storage import get_database
+
+LLM_CACHE_PATH = os.environ.get("LLM_CACHE_PATH", os.path.join("instance", "llm_cache.db"))
+LLM_CACHE_ENABLED = os.environ.get("LLM_CACHE_ENABLED", "true").lower() == "true"
+LLM_CACHE_TTL_SECONDS = int(os.environ.get("LLM_CACHE_TTL_SECONDS", 7 * 24 * 3600))
+LLM_CACHE_MAX_MB = float(os.environ.get("LLM_CACHE_MAX_MB", 200))
+
+
+def make_cache_key(model, api_version, system_message, prompt) -> str:
+    """
+    Builds the content address of an LLM call.
+
+    Args:
+        model: Deployment / model name the request is sent to.
+        api_version: API version string (None for the plain OpenAI client).
+        system_message: System message sent with the prompt.
+        prompt: Fully rendered user prompt.
+
+    Returns:
+        Hex SHA-256 digest identifying the request.
+    """
+    payload = json.dumps([model, api_version, system_message, prompt], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    """
+    SQLite-backed cache of parsed LLM JSON responses.
+
+    The database file is shared by every worker process on the host, so a
+    response produced by one worker is served to all of them. Hit/miss
+    counters live in the same file for the same reason.
+    """
+
+    def __init__(self, path=LLM_CACHE_PATH, ttl_seconds=LLM_CACHE_TTL_SECONDS,
+                 max_mb=LLM_CACHE_MAX_MB, enabled=LLM_CACHE_ENABLED):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.enabled = enabled
+        self.db = get_database(path)
+        self.db.add_schema(self._create_schema)
+
+    def _create_schema(self, conn):
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                model TEXT,
+                response TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+        ''')
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_llm_cache_last_access ON llm_cache (last_access)")
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS llm_cache_stats (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            )
+        ''')
+
+    def _bump(self, conn, name):
+        conn.execute("""
+            INSERT INTO llm_cache_stats (name, value) VALUES (?, 1)
+            ON CONFLICT(name) DO UPDATE SET value = value + 1
+        """, (name,))
+
+    def get(self, key):
+        """Returns the cached response for `key`, or None on a miss or expired entry."""
+        if not self.enabled:
+            return None
+        now = time.time()
+        try:
+            with self.db.connection() as conn:
+                row = conn.execute(
+                    "SELECT response, created_at FROM llm_cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row and now - row[1] <= self.ttl_seconds:
+                    conn.execute("UPDATE llm_cache SET last_access = ? WHERE key = ?", (now, key))
+                    self._bump(conn, "hits")
+                    return json.loads(row[0])
+                if row:
+                    conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self._bump(conn, "misses")
+        except sqlite3.Error as e:
+            logger.warning(f"LLM cache read failed: {e}")
+        return None
+
+    def set(self, key, model, response):
+        """Stores a parsed response and evicts expired / least recently used entries."""
+        if not self.enabled:
+            return
+        now = time.time()
+        data = json.dumps(response, ensure_ascii=False)
+        try:
+            with self.db.connection() as conn:
+                conn.execute("""
+                    INSERT OR REPLACE INTO llm_cache (key, model, response, size, created_at, last_access)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                """, (key, model, data, len(data.encode("utf-8")), now, now))
+                self._evict(conn, now)
+        except sqlite3.Error as e:
+            logger.warning(f"LLM cache write failed: {e}")
+
+    def _evict(self, conn, now):
+        conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (now - self.ttl_seconds,))
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM llm_cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evicted = 0
+        for key, size in conn.execute("SELECT key, size FROM llm_cache ORDER BY last_access").fetchall():
+            if total <= self.max_bytes:
+                break
+            conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+            total -= size
+            evicted += 1
+        if evicted:
+            logger.info(f"LLM cache evicted {evicted} entries")
+
+    def invalidate(self, key=None):
+        """Drops a single entry, or the whole cache when `key` is None. Returns rows removed."""
+        with self.db.connection() as conn:
+            if key is None:
+                cur = conn.execute("DELETE FROM llm_cache")
+            else:
+                cur = conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+            return cur.rowcount
+
+    def stats(self):
+        with self.db.connection() as conn:
+            counters = dict(conn.execute("SELECT name, value FROM llm_cache_stats").fetchall())
+            entries, size = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache"
+            ).fetchone()
+        hits = counters.get("hits", 0)
+        misses = counters.get("misses", 0)
+        return {
+            "enabled": self.enabled,
+            "entries": entries,
+            "size_bytes": size,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": hits / (hits + misses) if hits + misses else 0.0,
+        }
+
+
+llm_cache = LLMCache()
@@ -0,0 +1,152 @@
+import os
+import threading
+
+import httpx
+from loguru import logger
+from openai import AsyncAzureOpenAI, AzureOpenAI, OpenAI
+
+AZURE_OPENAI_ENDPOINT = os.environ.get("AZURE_OPENAI_ENDPOINT", "https://aug-az-openai-poc.openai.azure.com/")
+AZURE_OPENAI_API_VERSION = os.environ.get("AZURE_OPENAI_API_VERSION", "2024-12-01-preview")
+AZURE_OPENAI_DEPLOYMENT = os.environ.get("AZURE_OPENAI_DEPLOYMENT", "aug-gpt-4o")
+# Credentials come from the environment only; a client is not built without its key
+AZURE_OPENAI_API_KEY = os.environ.get("AZURE_OPENAI_API_KEY")
+OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
+
+LLM_POOL_MAX_CONNECTIONS = int(os.environ.get("LLM_POOL_MAX_CONNECTIONS", 20))
+LLM_POOL_MAX_KEEPALIVE = int(os.environ.get("LLM_POOL_MAX_KEEPALIVE", 10))
+LLM_POOL_KEEPALIVE_EXPIRY = float(os.environ.get("LLM_POOL_KEEPALIVE_EXPIRY", 60))
+LLM_CONNECT_TIMEOUT = float(os.environ.get("LLM_CONNECT_TIMEOUT", 10))
+LLM_READ_TIMEOUT = float(os.environ.get("LLM_READ_TIMEOUT", 180))
+LLM_MAX_RETRIES = int(os.environ.get("LLM_MAX_RETRIES", 2))
+# The async client multiplexes every in-flight call of the process over one pool
+LLM_ASYNC_POOL_MAX_CONNECTIONS = int(os.environ.get("LLM_ASYNC_POOL_MAX_CONNECTIONS", 500))
+
+
+class LLMConfigurationError(RuntimeError):
+    """Raised when a client is requested without the settings it needs."""
+
+
+def _require(value, name):
+    if not value:
+        raise LLMConfigurationError(f"{name} is not set; export it before using the LLM client")
+    return value
+
+
+class LLMClientManager:
+    """
+    Owns one long-lived OpenAI/AzureOpenAI client per process.
+
+    The SDK clients are thread-safe, so all request threads share them and
+    reuse the same keep-alive connection pool. Clients are dropped in forked
+    children (e.g. gunicorn workers forked after import) because sockets
+    inherited from the parent must not be shared.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._clients = {}
+        self._pid = os.getpid()
+
+    def _http_client(self):
+        return httpx.Client(
+            limits=httpx.Limits(
+                max_connections=LLM_POOL_MAX_CONNECTIONS,
+                max_keepalive_connections=LLM_POOL_MAX_KEEPALIVE,
+                keepalive_expiry=LLM_POOL_KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(LLM_READ_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+        )
+
+    def _async_http_client(self):
+        return httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=LLM_ASYNC_POOL_MAX_CONNECTIONS,
+                max_keepalive_connections=LLM_ASYNC_POOL_MAX_CONNECTIONS,
+                keepalive_expiry=LLM_POOL_KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(LLM_READ_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+        )
+
+    def _build(self, name):
+        if name == "azure":
+            # For Entra ID auth pass azure_ad_token_provider=get_bearer_token_provider(
+            #     InteractiveBrowserCredential(), "https://cognitiveservices.azure.com/.default")
+            # instead of api_key.
+            return AzureOpenAI(
+                azure_endpoint=AZURE_OPENAI_ENDPOINT,
+                api_version=AZURE_OPENAI_API_VERSION,
+                api_key=_require(AZURE_OPENAI_API_KEY, "AZURE_OPENAI_API_KEY"),
+                max_retries=LLM_MAX_RETRIES,
+                http_client=self._http_client(),
+            )
+        if name == "azure_async":
+            # Bound to the event loop that first uses it; the ASGI server runs one loop per process
+            return AsyncAzureOpenAI(
+                azure_endpoint=AZURE_OPENAI_ENDPOINT,
+                api_version=AZURE_OPENAI_API_VERSION,
+                api_key=_require(AZURE_OPENAI_API_KEY, "AZURE_OPENAI_API_KEY"),
+                max_retries=LLM_MAX_RETRIES,
+                http_client=self._async_http_client(),
+            )
+        if name == "openai":
+            return OpenAI(
+                api_key=_require(OPENAI_API_KEY, "OPENAI_API_KEY"),
+                max_retries=LLM_MAX_RETRIES,
+                http_client=self._http_client(),
+            )
+        raise ValueError(f"Unknown LLM client: {name}")
+
+    def get(self, name):
+        if self._pid != os.getpid():
+            self.reset()
+        client = self._clients.get(name)
+        if client is not None:
+            return client
+        with self._lock:
+            client = self._clients.get(name)
+            if client is None:
+                client = self._build(name)
+                self._clients[name] = client
+                logger.info(f"Created pooled {name} LLM client (pid {os.getpid()})")
+            return client
+
+    def reset(self):
+        # Called in a fresh child after fork: forget the parent's clients without
+        # closing them, their sockets still belong to the parent.
+        self._lock = threading.Lock()
+        self._clients = {}
+        self._pid = os.getpid()
+
+    def close(self):
+        with self._lock:
+            for name, client in list(self._clients.items()):
+                if not isinstance(client, AsyncAzureOpenAI):
+                    client.close()
+                    del self._clients[name]
+
+    async def aclose(self):
+        """Closes the async clients; call from the event loop that used them (ASGI shutdown)."""
+        with self._lock:
+            clients = [(n, c) for n, c in self._clients.items() if isinstance(c, AsyncAzureOpenAI)]
+            for name, _ in clients:
+                del self._clients[name]
+        for _, client in clients:
+            await client.close()
+
+
+client_manager = LLMClientManager()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=client_manager.reset)
+
+
+def get_azure_client():
+    return client_manager.get("azure")
+
+
+def get_openai_client():
+    return client_manager.get("openai")
+
+
+def get_async_azure_client():
+    return client_manager.get("azure_async")
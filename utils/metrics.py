@@ -0,0 +1,292 @@
+import contextvars
+import functools
+import os
+import threading
+import time
+from bisect import bisect_left
+
+from loguru import logger
+
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "true").lower() == "true"
+# Per-request stage summary in the logs; requests faster than this (seconds) are not logged
+METRICS_LOG_MIN_SECONDS = float(os.environ.get("METRICS_LOG_MIN_SECONDS", 0.0))
+STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+_registry = []
+_collectors = []
+_request_stages = contextvars.ContextVar("request_stages", default=None)
+_render_starts = contextvars.ContextVar("render_starts", default=())
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    return repr(float(value)) if value != float("inf") else "+Inf"
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    """Monotonic total per label set."""
+    kind = "counter"
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return self._header() + [f"{self.name}{_format_labels(self.labels, k)} {_format_value(v)}" for k, v in items]
+
+
+class Gauge(Counter):
+    """Value that goes up and down (in-flight requests)."""
+    kind = "gauge"
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram(_Metric):
+    """Cumulative bucket counts, sum and count per label set."""
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=STAGE_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][bisect_left(self.buckets, value)] += 1
+            state[1] += value
+
+    def render(self):
+        with self._lock:
+            items = sorted((k, (list(v[0]), v[1])) for k, v in self._values.items())
+        lines = self._header()
+        for labels, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = (("le", _format_value(bound) if bound != float("inf") else "+Inf"),)
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, labels)} {cumulative}")
+        return lines
+
+
+stage_seconds = Histogram("risk_stage_seconds", "Time spent in each pipeline stage.", ["stage"])
+http_request_seconds = Histogram("http_request_seconds", "Request duration by endpoint.",
+                                 ["endpoint", "method", "status"])
+http_requests_in_flight = Gauge("http_requests_in_flight", "Requests being served.", ["endpoint"])
+llm_requests_in_flight = Gauge("llm_requests_in_flight", "Chat-completion calls waiting on the LLM.", ["model"])
+llm_tokens = Counter("llm_tokens_total", "Tokens reported by the LLM.", ["model", "kind"])
+llm_requests = Counter("llm_requests_total", "Chat-completion calls by outcome.", ["model", "outcome"])
+
+
+class _Stage:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        record_stage(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class _NullStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+def stage(name):
+    """
+    Context manager timing a pipeline stage into `risk_stage_seconds` and the current request's summary.
+
+    A shared no-op object when METRICS_ENABLED is false.
+    """
+    return _Stage(name) if METRICS_ENABLED else _NULL_STAGE
+
+
+def timed(name):
+    """Decorator timing every call of the function as stage `name`; returns it unchanged when disabled."""
+    def decorate(fn):
+        if not METRICS_ENABLED:
+            return fn
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with _Stage(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+class _LLMRequest(_Stage):
+    __slots__ = ("model",)
+
+    def __init__(self, model):
+        super().__init__("llm_request")
+        self.model = model
+
+    def __enter__(self):
+        llm_requests_in_flight.inc(self.model)
+        return super().__enter__()
+
+    def __exit__(self, exc_type, *exc):
+        super().__exit__(exc_type, *exc)
+        llm_requests_in_flight.dec(self.model)
+        llm_requests.inc(self.model, "ok" if exc_type is None else "error")
+        return False
+
+
+def llm_request(model):
+    """
+    Like `stage("llm_request")`, also counting the call in flight and by outcome.
+
+    Wraps the whole stream for streamed completions.
+    """
+    return _LLMRequest(model) if METRICS_ENABLED else _NULL_STAGE
+
+
+def record_tokens(model, usage):
+    """Adds a completion's `usage` to `llm_tokens_total`."""
+    if not METRICS_ENABLED:
+        return
+    for kind in ("prompt", "completion"):
+        count = getattr(usage, f"{kind}_tokens", None)
+        if count:
+            llm_tokens.inc(model, kind, amount=count)
+
+
+def record_stage(name, seconds):
+    stage_seconds.observe(seconds, name)
+    stages = _request_stages.get()
+    if stages is not None:
+        stages[name] = stages.get(name, 0.0) + seconds
+
+
+def add_collector(collect):
+    """
+    Registers `collect()`, called on every scrape for values read from elsewhere (cache and queue stats).
+
+    It returns (name, kind, documentation, {label tuple: value}, label names) tuples.
+    """
+    _collectors.append(collect)
+
+
+def render():
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in _registry:
+        lines += metric.render()
+    for collect in _collectors:
+        try:
+            families = collect()
+        except Exception as e:
+            logger.warning(f"Metrics collector failed: {e}")
+            continue
+        for name, kind, documentation, samples, labels in families:
+            lines += [f"# HELP {name} {documentation}", f"# TYPE {name} {kind}"]
+            lines += [f"{name}{_format_labels(labels, k)} {_format_value(v)}" for k, v in samples.items()]
+    return "\n".join(lines) + "\n"
+
+
+def init_app(app):
+    """
+    Times every request and Jinja render, logs a per-request stage summary and serves GET /metrics.
+
+    Stages run in other threads or processes (fan-out workers, the
+    extraction pool) still count towards the histograms, but not towards
+    the summary of the request that started them.
+    """
+    from flask import Response, before_render_template, g, request, template_rendered
+
+    @app.route("/metrics")
+    def metrics():
+        return Response(render(), mimetype="text/plain; version=0.0.4")
+
+    if not METRICS_ENABLED:
+        return
+
+    @app.before_request
+    def _start_request():
+        endpoint = request.endpoint or "unmatched"
+        g.metrics = (time.perf_counter(), endpoint, request.method, request.path, {})
+        _request_stages.set(g.metrics[-1])
+        _render_starts.set(())
+        http_requests_in_flight.inc(endpoint)
+
+    @app.after_request
+    def _record_status(response):
+        state = g.get("metrics")
+        if state is not None and response.is_streamed:
+            # The body is generated after teardown; the request ends when the server closes the response
+            del g.metrics
+            response.call_on_close(lambda: _finish_request(state, response.status_code))
+        else:
+            g.metrics_status = response.status_code
+        return response
+
+    @app.teardown_request
+    def _teardown_request(exc):
+        state = g.pop("metrics", None)
+        if state is not None:
+            _finish_request(state, g.pop("metrics_status", 500))
+
+    def _render_started(sender, template, context, **extra):
+        _render_starts.set(_render_starts.get() + (time.perf_counter(),))
+
+    def _render_finished(sender, template, context, **extra):
+        starts = _render_starts.get()
+        if starts:
+            _render_starts.set(starts[:-1])
+            record_stage("render", time.perf_counter() - starts[-1])
+
+    before_render_template.connect(_render_started, app, weak=False)
+    template_rendered.connect(_render_finished, app, weak=False)
+
+
+def _finish_request(state, status):
+    start, endpoint, method, path, stages = state
+    elapsed = time.perf_counter() - start
+    _request_stages.set(None)
+    http_requests_in_flight.dec(endpoint)
+    http_request_seconds.observe(elapsed, endpoint, method, str(status))
+    if endpoint not in ("static", "metrics") and elapsed >= METRICS_LOG_MIN_SECONDS:
+        summary = " ".join(f"{name}={seconds:.3f}s" for name, seconds in stages.items())
+        logger.info(f"{method} {path} {status} in {elapsed:.3f}s" + (f" | {summary}" if summary else ""))
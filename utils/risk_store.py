@@ -0,0 +1,239 @@
+import os
+import re
+import time
+
+from loguru import logger
+
+from utils.storage import get_database
+
+RISKS_DB_PATH = os.environ.get("RISKS_DB_PATH", "Test.db")
+
+LIKELIHOOD_SCORES = {"Low": 1, "Medium": 2, "High": 3}
+
+# Column order of the legacy `Risks` table, also accepted by `insert_risks` for tuples
+RISKS_COLUMNS = [
+    "Analysis Type", "file_id", "file_name", "description", "risk_name",
+    "triggering_root_cause_events", "triggering_intermediate_events", "consequences",
+    "likelihood", "impact", "key_risk_indicators", "internal_controls", "access_level",
+]
+
+RISK_FIELDS = [
+    "analysis_type", "file_id", "file_name", "description", "risk_name",
+    "triggering_root_cause_events", "triggering_intermediate_events", "consequences",
+    "likelihood", "impact", "key_risk_indicators", "internal_controls", "access_level",
+]
+
+_IMPACT_PAIR = re.compile(r"([^:,;\n]*?)\s*:\s*\b(High|Medium|Low)\b")
+_IMPACT_LEVEL = re.compile(r"\b(High|Medium|Low)\b")
+
+
+def parse_impact(impact_text):
+    """
+    Splits an impact text ("Financial Loss: High, Reputational Damage: Medium") into (category, level) pairs.
+
+    Levels that are not preceded by a "Category:" label are kept with an
+    empty category so they still count towards the score.
+    """
+    if not impact_text:
+        return []
+    pairs = [(category.strip(), level) for category, level in _IMPACT_PAIR.findall(impact_text)]
+    if len(pairs) < len(_IMPACT_LEVEL.findall(impact_text)):
+        labelled = {m.end() for m in _IMPACT_PAIR.finditer(impact_text)}
+        pairs += [("", m.group(1)) for m in _IMPACT_LEVEL.finditer(impact_text) if m.end() not in labelled]
+    return pairs
+
+
+def impact_score(pairs):
+    """Mean of the impact levels (Low=1, Medium=2, High=3), None when there are none."""
+    scores = [LIKELIHOOD_SCORES[level] for _, level in pairs]
+    return sum(scores) / len(scores) if scores else None
+
+
+def ensure_schema(conn):
+    """
+    Creates the normalized risk tables and migrates a legacy `Risks` table into them.
+
+    `risk` holds one row per identified risk with its likelihood and mean
+    impact already scored; `risk_impact` holds its (category, level) pairs.
+    The legacy table is kept as `Risks_legacy` and `Risks` becomes a view
+    over `risk` with the old column names. Writes to the view go to `risk`
+    through INSTEAD OF triggers; as SQL cannot parse the impact text, those
+    rows are flagged `impact_pending` and scored by `score_pending`.
+    """
+    conn.executescript('''
+        CREATE TABLE IF NOT EXISTS risk (
+            id INTEGER PRIMARY KEY,
+            analysis_type TEXT,
+            file_id INTEGER,
+            file_name TEXT,
+            description TEXT,
+            risk_name TEXT,
+            triggering_root_cause_events TEXT,
+            triggering_intermediate_events TEXT,
+            consequences TEXT,
+            likelihood TEXT,
+            likelihood_score INTEGER,
+            impact TEXT,
+            impact_score REAL,
+            key_risk_indicators TEXT,
+            internal_controls TEXT,
+            access_level TEXT,
+            created_at REAL,
+            impact_pending INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE INDEX IF NOT EXISTS ix_risk_access_level_risk_name ON risk (access_level, risk_name);
+        CREATE INDEX IF NOT EXISTS ix_risk_access_level_file_name ON risk (access_level, file_name);
+        CREATE INDEX IF NOT EXISTS ix_risk_risk_name_file_name ON risk (risk_name, file_name);
+        CREATE INDEX IF NOT EXISTS ix_risk_file_name ON risk (file_name);
+        CREATE INDEX IF NOT EXISTS ix_risk_access_level_likelihood ON risk (access_level, likelihood_score);
+        CREATE INDEX IF NOT EXISTS ix_risk_access_level_impact ON risk (access_level, impact_score);
+
+        CREATE TABLE IF NOT EXISTS risk_impact (
+            risk_id INTEGER NOT NULL REFERENCES risk (id) ON DELETE CASCADE,
+            category TEXT NOT NULL,
+            level TEXT NOT NULL,
+            score INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS ix_risk_impact_risk_id ON risk_impact (risk_id);
+        CREATE INDEX IF NOT EXISTS ix_risk_impact_category_level ON risk_impact (category, level);
+    ''')
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(risk)")}
+    if "impact_pending" not in columns:
+        conn.execute("ALTER TABLE risk ADD COLUMN impact_pending INTEGER NOT NULL DEFAULT 0")
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_risk_impact_pending ON risk (id) WHERE impact_pending = 1")
+    legacy = conn.execute("SELECT type FROM sqlite_master WHERE name = 'Risks'").fetchone()
+    if legacy and legacy[0] == "table":
+        migrate_legacy(conn)
+    else:
+        _create_view(conn)
+    conn.commit()
+    score_pending(conn)
+
+
+# Same mapping as LIKELIHOOD_SCORES, and the same trimming as `_normalize`
+_LIKELIHOOD_SCORE_SQL = "CASE TRIM(NEW.likelihood) WHEN 'Low' THEN 1 WHEN 'Medium' THEN 2 WHEN 'High' THEN 3 END"
+# The view has no rowid; a legacy UPDATE/DELETE touches one matching `risk` row per affected view row
+_OLD_RISK_ID = "(SELECT id FROM risk WHERE {} LIMIT 1)".format(" AND ".join(
+    f"{field} IS OLD.\"{column}\"" for field, column in zip(RISK_FIELDS, RISKS_COLUMNS)))
+
+
+def _create_view(conn):
+    values = [f"TRIM(NEW.\"{column}\")" if field in ("risk_name", "file_name", "likelihood", "access_level")
+              else f"NEW.\"{column}\"" for field, column in zip(RISK_FIELDS, RISKS_COLUMNS)]
+    new_values = ", ".join(values)
+    assignments = ", ".join(f"{field} = {value}" for field, value in zip(RISK_FIELDS, values))
+    # One statement at a time: executescript would commit the transaction of `migrate_legacy`
+    conn.execute('''
+        CREATE VIEW IF NOT EXISTS "Risks" AS
+        SELECT analysis_type AS "Analysis Type", file_id, file_name, description, risk_name,
+               triggering_root_cause_events, triggering_intermediate_events, consequences,
+               likelihood, impact, key_risk_indicators, internal_controls, access_level
+        FROM risk
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS risks_view_insert INSTEAD OF INSERT ON "Risks" BEGIN
+            INSERT INTO risk ({", ".join(RISK_FIELDS)}, likelihood_score, impact_score, created_at, impact_pending)
+            VALUES ({new_values}, {_LIKELIHOOD_SCORE_SQL}, NULL,
+                    (julianday('now') - 2440587.5) * 86400.0, NEW.impact IS NOT NULL);
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS risks_view_update INSTEAD OF UPDATE ON "Risks" BEGIN
+            DELETE FROM risk_impact WHERE NEW.impact IS NOT OLD.impact AND risk_id = {_OLD_RISK_ID};
+            UPDATE risk SET {assignments}, likelihood_score = {_LIKELIHOOD_SCORE_SQL},
+                impact_score = CASE WHEN NEW.impact IS OLD.impact THEN impact_score END,
+                impact_pending = CASE WHEN NEW.impact IS OLD.impact THEN impact_pending ELSE NEW.impact IS NOT NULL END
+            WHERE id = {_OLD_RISK_ID};
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS risks_view_delete INSTEAD OF DELETE ON "Risks" BEGIN
+            DELETE FROM risk WHERE id = {_OLD_RISK_ID};
+        END
+    ''')
+
+
+def score_pending(conn, batch_size=1000):
+    """Scores the impact of rows written through the `Risks` view and commits. Returns the rows scored."""
+    scored = 0
+    while True:
+        rows = conn.execute(
+            "SELECT id, impact FROM risk WHERE impact_pending = 1 LIMIT ?", (batch_size,)).fetchall()
+        if not rows:
+            break
+        with conn:
+            for risk_id, impact in rows:
+                pairs = parse_impact(impact)
+                conn.execute("DELETE FROM risk_impact WHERE risk_id = ?", (risk_id,))
+                conn.executemany("INSERT INTO risk_impact (risk_id, category, level, score) VALUES (?, ?, ?, ?)",
+                                 [(risk_id, category, level, LIKELIHOOD_SCORES[level]) for category, level in pairs])
+                conn.execute("UPDATE risk SET impact_score = ?, impact_pending = 0 WHERE id = ?",
+                             (impact_score(pairs), risk_id))
+        scored += len(rows)
+    if scored:
+        logger.info(f"Scored the impact of {scored} risks written through the Risks view")
+    return scored
+
+
+def migrate_legacy(conn, batch_size=5000):
+    """Moves the rows of a legacy `Risks` table into `risk` / `risk_impact` in one transaction."""
+    start = time.perf_counter()
+    columns = {row[1] for row in conn.execute('PRAGMA table_info("Risks")')}
+    select = ", ".join(f'"{c}"' if c in columns else "NULL" for c in RISKS_COLUMNS)
+    migrated = 0
+    with conn:
+        cursor = conn.execute(f'SELECT {select} FROM "Risks" ORDER BY rowid')
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            insert_risks(conn, rows)
+            migrated += len(rows)
+        conn.execute('ALTER TABLE "Risks" RENAME TO "Risks_legacy"')
+        _create_view(conn)
+    logger.info(f"Migrated {migrated} legacy Risks rows in {time.perf_counter() - start:.2f}s")
+    return migrated
+
+
+def _normalize(row):
+    values = [row.get(field, row.get(column)) for field, column in zip(RISK_FIELDS, RISKS_COLUMNS)] \
+        if isinstance(row, dict) else list(row)
+    record = dict(zip(RISK_FIELDS, values))
+    for field in ("risk_name", "file_name", "likelihood", "access_level"):
+        if isinstance(record[field], str):
+            record[field] = record[field].strip()
+    return record
+
+
+def insert_risks(conn, rows):
+    """
+    Inserts risks, scoring them once at ingest. Does not commit.
+
+    Args:
+        conn: Connection to a database set up with `ensure_schema`.
+        rows: Dicts keyed by `RISK_FIELDS` (or the legacy column names), or
+            tuples in `RISKS_COLUMNS` order.
+
+    Returns:
+        The ids of the inserted rows.
+    """
+    insert = "INSERT INTO risk ({}, likelihood_score, impact_score, created_at) VALUES ({})".format(
+        ", ".join(RISK_FIELDS), ", ".join("?" * (len(RISK_FIELDS) + 3)))
+    now = time.time()
+    ids, impacts = [], []
+    for row in rows:
+        record = _normalize(row)
+        pairs = parse_impact(record["impact"])
+        cursor = conn.execute(insert, [record[f] for f in RISK_FIELDS] + [
+            LIKELIHOOD_SCORES.get(record["likelihood"]), impact_score(pairs), now])
+        ids.append(cursor.lastrowid)
+        impacts.extend((cursor.lastrowid, category, level, LIKELIHOOD_SCORES[level]) for category, level in pairs)
+    conn.executemany("INSERT INTO risk_impact (risk_id, category, level, score) VALUES (?, ?, ?, ?)", impacts)
+    return ids
+
+
+def risk_database(path=RISKS_DB_PATH):
+    """The shared `Database` of the risk file, with the normalized schema registered."""
+    db = get_database(path)
+    db.add_schema(ensure_schema)
+    return db
@@ -0,0 +1,136 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from loguru import logger
+
+SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", 30000))
+SQLITE_SYNCHRONOUS = os.environ.get("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_CACHE_SIZE_KB = int(os.environ.get("SQLITE_CACHE_SIZE_KB", 32 * 1024))
+SQLITE_MMAP_SIZE_MB = int(os.environ.get("SQLITE_MMAP_SIZE_MB", 256))
+
+_databases = {}
+_databases_lock = threading.Lock()
+
+
+def apply_pragmas(conn):
+    """Per-connection settings shared by every SQLite database of the app (also used for the SQLAlchemy engine)."""
+    conn.execute(f"PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT_MS}")
+    # NORMAL is safe in WAL mode and skips the fsync on every commit
+    conn.execute(f"PRAGMA synchronous = {SQLITE_SYNCHRONOUS}")
+    conn.execute(f"PRAGMA cache_size = -{SQLITE_CACHE_SIZE_KB}")
+    conn.execute(f"PRAGMA mmap_size = {SQLITE_MMAP_SIZE_MB * 1024 * 1024}")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    conn.execute("PRAGMA foreign_keys = ON")
+
+
+class Database:
+    """
+    One SQLite file: a reused connection per thread, WAL journaling and schema set up once per process.
+
+    Modules register their `CREATE TABLE` code with `add_schema`; it runs
+    the first time the database is used in a process, not on every
+    connection or write. Connections are opened lazily per thread and kept
+    for the thread's lifetime (reopened after a fork). In WAL mode readers
+    never block the writer and the writer never blocks readers; writers
+    queue on the busy timeout instead of failing.
+
+    Use `connection()` as a context manager: it commits on success and
+    rolls back on error, like `with sqlite3.connect(...)`, and nests
+    (only the outermost block commits).
+    """
+
+    def __init__(self, path, isolation_level="", row_factory=None):
+        self.path = path
+        self.isolation_level = isolation_level
+        self.row_factory = row_factory
+        self._schemas = []
+        self._applied = set()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._wal_pid = None
+
+    def add_schema(self, setup):
+        """Registers `setup(conn)`, run once per process before the database is first used."""
+        with self._lock:
+            if setup not in self._schemas:
+                self._schemas.append(setup)
+
+    def _open(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=SQLITE_BUSY_TIMEOUT_MS / 1000,
+                               isolation_level=self.isolation_level)
+        if self.row_factory is not None:
+            conn.row_factory = self.row_factory
+        apply_pragmas(conn)
+        if self._wal_pid != os.getpid():
+            # Persistent in the file, so once per process is enough
+            mode = conn.execute("PRAGMA journal_mode = WAL").fetchone()[0]
+            if mode.lower() != "wal":
+                logger.warning(f"SQLite {self.path} is in {mode} journal mode, not WAL")
+            self._wal_pid = os.getpid()
+        return conn
+
+    def _thread_connection(self):
+        local = self._local
+        if getattr(local, "pid", None) != os.getpid():
+            local.conn, local.depth, local.pid = self._open(), 0, os.getpid()
+        if len(self._applied) < len(self._schemas):
+            self._run_schemas(local.conn)
+        return local.conn
+
+    def _run_schemas(self, conn):
+        with self._lock:
+            for setup in self._schemas:
+                if setup in self._applied:
+                    continue
+                try:
+                    setup(conn)
+                    if conn.in_transaction:
+                        conn.commit()
+                except Exception:
+                    if conn.in_transaction:
+                        conn.rollback()
+                    raise
+                self._applied.add(setup)
+
+    @contextmanager
+    def connection(self):
+        conn = self._thread_connection()
+        local = self._local
+        local.depth += 1
+        try:
+            yield conn
+        except BaseException:
+            if local.depth == 1 and conn.in_transaction:
+                conn.rollback()
+            raise
+        else:
+            if local.depth == 1 and conn.in_transaction:
+                conn.commit()
+        finally:
+            local.depth -= 1
+
+    def close(self):
+        """Closes the calling thread's connection (it is reopened on next use)."""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and getattr(self._local, "pid", None) == os.getpid():
+            conn.close()
+        self._local.__dict__.clear()
+
+
+def get_database(path, isolation_level="", row_factory=None):
+    """
+    The shared `Database` of a file, created on first use.
+
+    Modules storing tables in the same file share its connections; the
+    connection options come from whichever module asks first.
+    """
+    key = os.path.abspath(path)
+    with _databases_lock:
+        db = _databases.get(key)
+        if db is None:
+            db = _databases[key] = Database(path, isolation_level=isolation_level, row_factory=row_factory)
+        return db
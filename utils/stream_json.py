@@ -0,0 +1,83 @@
+import json
+import re
+
+from loguru import logger
+
+_ARRAY_START = re.compile(r'"identified_risks"\s*:\s*\[')
+
+
+class IdentifiedRisksParser:
+    """
+    Incrementally extracts the elements of `risk_assessment.identified_risks`
+    from a streamed JSON completion.
+
+    Feed it text deltas as they arrive; every element whose closing brace has
+    been received is returned as a parsed object, without waiting for the
+    rest of the document (e.g. `risk_prioritization`).
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.pos = None          # scan position inside the array, None until "[" is seen
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.element_start = None
+        self.finished = False
+
+    def feed(self, chunk):
+        """
+        Args:
+            chunk: Next piece of the streamed completion text.
+
+        Returns:
+            List of identified-risk objects completed by this chunk.
+        """
+        self.buffer += chunk
+        if self.finished:
+            return []
+        if self.pos is None:
+            match = _ARRAY_START.search(self.buffer)
+            if not match:
+                return []
+            self.pos = match.end()
+
+        completed = []
+        buf = self.buffer
+        i = self.pos
+        while i < len(buf):
+            c = buf[i]
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif c == "\\":
+                    self.escaped = True
+                elif c == '"':
+                    self.in_string = False
+            elif c == '"':
+                self.in_string = True
+            elif c in "{[":
+                if self.depth == 0:
+                    self.element_start = i
+                self.depth += 1
+            elif c in "}]":
+                if self.depth == 0:
+                    # closing bracket of identified_risks itself
+                    self.finished = True
+                    i += 1
+                    break
+                self.depth -= 1
+                if self.depth == 0:
+                    raw = buf[self.element_start:i + 1]
+                    try:
+                        completed.append(json.loads(raw))
+                    except json.JSONDecodeError:
+                        logger.error(f"Could not parse streamed risk\n{raw}")
+                    self.element_start = None
+            i += 1
+        self.pos = i
+        return completed
+
+    def text(self):
+        """Full text received so far."""
+        return self.buffer
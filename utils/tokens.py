@@ -0,0 +1,129 @@
+import os
+import sqlite3
+import time
+
+from loguru import logger
+
+from utils import metrics
+from utils.storage import get_database
+
+try:
+    import tiktoken
+except ImportError:  # optional: fall back to a character-based estimate
+    tiktoken = None
+
+TOKENIZER_ENCODING = os.environ.get("TOKENIZER_ENCODING", "o200k_base")  # gpt-4o family
+LLM_PROMPT_TOKEN_BUDGET = int(os.environ.get("LLM_PROMPT_TOKEN_BUDGET", 100000))
+LLM_OVERSIZE_POLICY = os.environ.get("LLM_OVERSIZE_POLICY", "chunk")  # "chunk" or "refuse"
+LLM_USAGE_PATH = os.environ.get("LLM_USAGE_PATH", os.path.join("instance", "llm_usage.db"))
+
+# Fixed per-request overhead of the chat format (role markers, separators)
+CHAT_OVERHEAD_TOKENS = 12
+
+_encoding = None
+_encoding_failed = False
+
+
+class PromptTooLargeError(Exception):
+    def __init__(self, estimate, budget):
+        self.estimate = estimate
+        self.budget = budget
+        super().__init__(f"Prompt is about {estimate['total']} tokens, over the {budget} token budget")
+
+
+def _get_encoding():
+    global _encoding, _encoding_failed
+    if _encoding is None and tiktoken is not None and not _encoding_failed:
+        try:
+            _encoding = tiktoken.get_encoding(TOKENIZER_ENCODING)
+        except Exception as e:
+            # The encoding file is downloaded on first use and may be unavailable offline
+            logger.warning(f"tiktoken encoding {TOKENIZER_ENCODING} unavailable, estimating from characters: {e}")
+            _encoding_failed = True
+    return _encoding
+
+
+def count_tokens(text) -> int:
+    """Counts tokens with the model's tokenizer when available, else ~4 characters per token."""
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def check_budget(estimate, budget=LLM_PROMPT_TOKEN_BUDGET):
+    """Raises PromptTooLargeError when the estimated prompt exceeds the per-call budget."""
+    if estimate["total"] > budget:
+        raise PromptTooLargeError(estimate, budget)
+
+
+class UsageLog:
+    """Records each call's pre-flight estimate next to the `usage` the API reported."""
+
+    def __init__(self, path=LLM_USAGE_PATH):
+        self.path = path
+        self.db = get_database(path)
+        self.db.add_schema(self._create_schema)
+
+    def _create_schema(self, conn):
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS llm_usage (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                created_at REAL NOT NULL,
+                model TEXT,
+                estimated_prompt_tokens INTEGER,
+                estimated_instructions INTEGER,
+                estimated_taxonomy INTEGER,
+                estimated_illustrative_risks INTEGER,
+                estimated_document INTEGER,
+                prompt_tokens INTEGER,
+                completion_tokens INTEGER,
+                total_tokens INTEGER
+            )
+        ''')
+
+    def record(self, model, estimate, usage):
+        prompt_tokens = getattr(usage, "prompt_tokens", None)
+        metrics.record_tokens(model, usage)
+        logger.info(
+            f"LLM usage {model}: estimated {estimate.get('total')} prompt tokens "
+            f"(document {estimate.get('document')}), actual {prompt_tokens} prompt / "
+            f"{getattr(usage, 'completion_tokens', None)} completion"
+        )
+        try:
+            with self.db.connection() as conn:
+                conn.execute("""
+                    INSERT INTO llm_usage (created_at, model, estimated_prompt_tokens, estimated_instructions,
+                        estimated_taxonomy, estimated_illustrative_risks, estimated_document,
+                        prompt_tokens, completion_tokens, total_tokens)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """, (time.time(), model, estimate.get("total"), estimate.get("instructions"),
+                      estimate.get("taxonomy"), estimate.get("illustrative_risks"), estimate.get("document"),
+                      prompt_tokens, getattr(usage, "completion_tokens", None), getattr(usage, "total_tokens", None)))
+        except sqlite3.Error as e:
+            logger.warning(f"LLM usage write failed: {e}")
+
+    def summary(self):
+        with self.db.connection() as conn:
+            row = conn.execute("""
+                SELECT COUNT(*), SUM(estimated_prompt_tokens), SUM(prompt_tokens), SUM(completion_tokens),
+                       AVG(CAST(prompt_tokens AS REAL) / NULLIF(estimated_prompt_tokens, 0)),
+                       MAX(prompt_tokens), AVG(estimated_document)
+                FROM llm_usage
+            """).fetchone()
+        return {
+            "calls": row[0],
+            "estimated_prompt_tokens": row[1] or 0,
+            "prompt_tokens": row[2] or 0,
+            "completion_tokens": row[3] or 0,
+            "actual_to_estimate_ratio": row[4],
+            "max_prompt_tokens": row[5],
+            "avg_document_tokens": row[6],
+            "budget": LLM_PROMPT_TOKEN_BUDGET,
+            "oversize_policy": LLM_OVERSIZE_POLICY,
+        }
+
+
+usage_log = UsageLog()
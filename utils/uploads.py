@@ -0,0 +1,83 @@
+import os
+import posixpath
+import uuid
+import zipfile
+
+BATCH_UPLOAD_DIR = os.environ.get("BATCH_UPLOAD_DIR", os.path.join("instance", "uploads"))
+BATCH_MAX_FILES = int(os.environ.get("BATCH_MAX_FILES", 100))
+BATCH_MAX_TOTAL_MB = float(os.environ.get("BATCH_MAX_TOTAL_MB", 500))
+
+
+class BatchUploadError(ValueError):
+    pass
+
+
+def _allowed(filename, allowed_extensions):
+    return "." in filename and filename.rsplit(".", 1)[1].lower() in allowed_extensions
+
+
+def expand_uploads(file_storages, allowed_extensions, max_files=BATCH_MAX_FILES, max_total_mb=BATCH_MAX_TOTAL_MB):
+    """
+    Turns uploaded files, any of which may be a ZIP, into (filename, bytes) pairs.
+
+    Files and ZIP members without an allowed extension are skipped and
+    reported. The file count and total uncompressed size are capped, and a
+    ZIP member's declared size is checked before it is read.
+
+    Args:
+        file_storages: Uploaded werkzeug FileStorage objects.
+        allowed_extensions: Extensions accepted for analysis, e.g. {"pdf", "txt", "docx"}.
+
+    Returns:
+        (files, skipped): list of (filename, bytes) and list of skipped names.
+
+    Raises:
+        BatchUploadError: Too many files, too much data, or an unreadable ZIP.
+    """
+    max_bytes = int(max_total_mb * 1024 * 1024)
+    files, skipped = [], []
+    total = 0
+
+    def add(name, size, read):
+        nonlocal total
+        if len(files) >= max_files:
+            raise BatchUploadError(f"A batch can contain at most {max_files} documents")
+        if total + size > max_bytes:
+            raise BatchUploadError(f"A batch can contain at most {max_total_mb:g} MB of documents")
+        data = read()
+        total += len(data)
+        files.append((name, data))
+
+    for storage in file_storages:
+        name = os.path.basename(storage.filename or "")
+        if not name:
+            continue
+        if name.lower().endswith(".zip"):
+            try:
+                with zipfile.ZipFile(storage.stream) as archive:
+                    for info in archive.infolist():
+                        member = posixpath.basename(info.filename)
+                        if info.is_dir() or not member or member.startswith(".") or "__MACOSX" in info.filename:
+                            continue
+                        if not _allowed(member, allowed_extensions):
+                            skipped.append(f"{name}/{info.filename}")
+                            continue
+                        add(member, info.file_size, lambda info=info: archive.read(info))
+            except zipfile.BadZipFile:
+                raise BatchUploadError(f"{name} is not a valid ZIP file")
+        elif _allowed(name, allowed_extensions):
+            data = storage.read()
+            add(name, len(data), lambda data=data: data)
+        else:
+            skipped.append(name)
+    return files, skipped
+
+
+def save_upload(data, filename, directory=BATCH_UPLOAD_DIR):
+    """Writes an uploaded file where a job worker can read it; returns the path."""
+    os.makedirs(directory, exist_ok=True)
+    ext = filename.rsplit(".", 1)[-1].lower() if "." in filename else "bin"
+    path = os.path.join(directory, f"{uuid.uuid4().hex}.{ext}")
+    with open(path, "wb") as f:
+        f.write(data)
+    return path